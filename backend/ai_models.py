@@ -3,100 +3,134 @@ AI Models and utilities for Memora
 """
 import cv2
 import numpy as np
-import tensorflow as tf
-from tensorflow import keras
-import mediapipe as mp
-from typing import Dict, List, Tuple, Optional
+import os
+from typing import Dict, List, Tuple, Optional, Union
 import logging
+from landmarks import FEATURE_INDICES, FaceLandmarks
 
 logger = logging.getLogger(__name__)
 
+# Model file extension -> runtime used to execute it
+EMOTION_BACKENDS = {".h5": "keras", ".keras": "keras", ".tflite": "tflite", ".onnx": "onnx"}
+
 class EmotionDetector:
-    """Emotion detection using CNN model"""
+    """Emotion detection using CNN model.
+
+    The model takes (F, 48, 48, 1) grayscale faces scaled to 0-1 and returns
+    (F, 7) scores. It runs as a Keras model called directly (no `predict`
+    loop), a TFLite interpreter or an ONNX Runtime CPU session; `backend`
+    defaults to the one matching the model file's extension.
+    """
     
-    def __init__(self, model_path: Optional[str] = None):
+    def __init__(self, model_path: Optional[str] = None, backend: Optional[str] = None):
         self.model = None
+        self.backend = None
         self.emotions = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+        self._input_name = None
+        self._batch_size = None
         
         if model_path:
+            self.backend = backend or EMOTION_BACKENDS.get(os.path.splitext(model_path)[1].lower(), "keras")
             try:
-                self.model = keras.models.load_model(model_path)
-                logger.info("Emotion detection model loaded successfully")
+                self.model = self._load(model_path)
+                logger.info(f"Emotion detection model loaded successfully ({self.backend})")
             except Exception as e:
                 logger.error(f"Failed to load emotion model: {e}")
+                self.model = None
     
-    def detect_emotion(self, face_image: np.ndarray) -> str:
-        """Detect emotion from face image"""
-        if self.model is None:
-            return "neutral"
+    def _load(self, model_path: str):
+        if self.backend == "keras":
+            from tensorflow import keras
+            return keras.models.load_model(model_path)
+        if self.backend == "tflite":
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                from tensorflow.lite import Interpreter
+            return Interpreter(model_path=model_path)
+        if self.backend == "onnx":
+            import onnxruntime
+            session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+            self._input_name = session.get_inputs()[0].name
+            return session
+        raise ValueError(f"Unsupported emotion backend: {self.backend}")
+    
+    def preprocess_batch(self, face_images: List[np.ndarray], rgb: bool = False) -> np.ndarray:
+        """Stack face crops into one (F, 48, 48, 1) float32 tensor"""
+        batch = np.empty((len(face_images), 48, 48, 1), dtype=np.float32)
+        for i, face_image in enumerate(face_images):
+            face_gray = cv2.cvtColor(face_image, cv2.COLOR_RGB2GRAY if rgb else cv2.COLOR_BGR2GRAY)
+            batch[i, :, :, 0] = cv2.resize(face_gray, (48, 48))
+        batch *= 1 / 255.0
+        return batch
+    
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        """One forward pass over the whole batch"""
+        if self.backend == "tflite":
+            input_index = self.model.get_input_details()[0]["index"]
+            if self._batch_size != len(batch):
+                self.model.resize_tensor_input(input_index, batch.shape)
+                self.model.allocate_tensors()
+                self._batch_size = len(batch)
+            self.model.set_tensor(input_index, batch)
+            self.model.invoke()
+            return self.model.get_tensor(self.model.get_output_details()[0]["index"])
+        if self.backend == "onnx":
+            return self.model.run(None, {self._input_name: batch})[0]
+        return np.asarray(self.model(batch, training=False))
+    
+    def detect_batch(self, face_images: List[np.ndarray], rgb: bool = False) -> List[str]:
+        """Detect the emotion of every face crop with a single model call"""
+        emotions = ["neutral"] * len(face_images)
+        valid = [i for i, face_image in enumerate(face_images) if face_image is not None and face_image.size]
+        if self.model is None or not valid:
+            return emotions
         
         try:
-            # Preprocess image
-            face_gray = cv2.cvtColor(face_image, cv2.COLOR_BGR2GRAY)
-            face_resized = cv2.resize(face_gray, (48, 48))
-            face_normalized = face_resized.astype('float32') / 255.0
-            face_reshaped = face_normalized.reshape(1, 48, 48, 1)
-            
-            # Predict emotion
-            predictions = self.model.predict(face_reshaped, verbose=0)
-            emotion_idx = np.argmax(predictions[0])
-            confidence = predictions[0][emotion_idx]
-            
-            if confidence > 0.5:
-                return self.emotions[emotion_idx]
-            else:
-                return "neutral"
-                
+            predictions = self._run(self.preprocess_batch([face_images[i] for i in valid], rgb))
+            for i, scores in zip(valid, predictions):
+                emotion_idx = int(np.argmax(scores))
+                if scores[emotion_idx] > 0.5:
+                    emotions[i] = self.emotions[emotion_idx]
         except Exception as e:
-            logger.error(f"Error detecting emotion: {e}")
-            return "neutral"
+            logger.error(f"Error detecting emotions: {e}")
+        return emotions
+    
+    def detect_emotion(self, face_image: np.ndarray, rgb: bool = False) -> str:
+        """Detect emotion from face image"""
+        return self.detect_batch([face_image], rgb)[0]
 
 class FacialLandmarkAnalyzer:
     """Advanced facial landmark analysis for trait extraction"""
     
     def __init__(self):
-        self.mp_face_mesh = mp.solutions.face_mesh
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
-            static_image_mode=True,
-            max_num_faces=1,
-            refine_landmarks=True,
-            min_detection_confidence=0.5
-        )
+        self._face_mesh = None
         
         # Key landmark indices for different facial features
-        self.landmark_indices = {
-            'left_eye': [33, 7, 163, 144, 145, 153, 154, 155, 133, 173, 157, 158, 159, 160, 161, 246],
-            'right_eye': [362, 382, 381, 380, 374, 373, 390, 249, 263, 466, 388, 387, 386, 385, 384, 398],
-            'nose': [1, 2, 5, 4, 6, 19, 20, 94, 125, 141, 235, 236, 237, 238, 239, 240, 241, 242],
-            'mouth': [61, 84, 17, 314, 405, 320, 307, 375, 321, 308, 324, 318],
-            'jaw': [172, 136, 150, 149, 176, 148, 152, 377, 400, 378, 379, 365, 397, 288, 361, 323],
-            'eyebrows': [70, 63, 105, 66, 107, 55, 65, 52, 53, 46, 296, 334, 293, 300, 276, 283, 282, 295, 285]
-        }
+        self.landmark_indices = FEATURE_INDICES
+    
+    @property
+    def face_mesh(self):
+        """MediaPipe graph, built on first use so proportion analysis alone stays cheap"""
+        if self._face_mesh is None:
+            import mediapipe as mp
+            self._face_mesh = mp.solutions.face_mesh.FaceMesh(
+                static_image_mode=True,
+                max_num_faces=1,
+                refine_landmarks=True,
+                min_detection_confidence=0.5
+            )
+        return self._face_mesh
     
-    def extract_landmarks(self, image: np.ndarray) -> Optional[Dict]:
+    def extract_landmarks(self, image: np.ndarray) -> Optional[FaceLandmarks]:
         """Extract detailed facial landmarks"""
         try:
             rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
             results = self.face_mesh.process(rgb_image)
             
             if results.multi_face_landmarks:
-                landmarks = results.multi_face_landmarks[0]
                 height, width = image.shape[:2]
-                
-                # Convert normalized coordinates to pixel coordinates
-                points = []
-                for landmark in landmarks.landmark:
-                    x = int(landmark.x * width)
-                    y = int(landmark.y * height)
-                    z = landmark.z
-                    points.append([x, y, z])
-                
-                return {
-                    "points": points,
-                    "width": width,
-                    "height": height,
-                    "feature_points": self._extract_feature_points(points)
-                }
+                return FaceLandmarks.from_mediapipe(results.multi_face_landmarks[0], width, height)
             
             return None
             
@@ -104,67 +138,18 @@ class FacialLandmarkAnalyzer:
             logger.error(f"Error extracting landmarks: {e}")
             return None
     
-    def _extract_feature_points(self, points: List[List[float]]) -> Dict:
-        """Extract specific feature points for analysis"""
-        feature_points = {}
-        
-        for feature_name, indices in self.landmark_indices.items():
-            feature_points[feature_name] = []
-            for idx in indices:
-                if idx < len(points):
-                    feature_points[feature_name].append(points[idx])
-        
-        return feature_points
-    
-    def analyze_facial_proportions(self, landmarks: Dict) -> Dict[str, float]:
+    def analyze_facial_proportions(self, landmarks: Union[FaceLandmarks, Dict, None]) -> Dict[str, float]:
         """Analyze facial proportions and distinctive features"""
-        if not landmarks or "feature_points" not in landmarks:
+        if isinstance(landmarks, dict):
+            landmarks = FaceLandmarks.from_landmark_data(landmarks)
+        if landmarks is None:
             return {}
         
-        feature_points = landmarks["feature_points"]
-        proportions = {}
-        
         try:
-            # Eye analysis
-            if "left_eye" in feature_points and "right_eye" in feature_points:
-                left_eye_points = np.array(feature_points["left_eye"])
-                right_eye_points = np.array(feature_points["right_eye"])
-                
-                # Eye width
-                left_eye_width = np.linalg.norm(left_eye_points[0] - left_eye_points[8])
-                right_eye_width = np.linalg.norm(right_eye_points[0] - right_eye_points[8])
-                avg_eye_width = (left_eye_width + right_eye_width) / 2
-                proportions["eye_width"] = avg_eye_width / landmarks["width"]
-                
-                # Eye spacing
-                eye_distance = np.linalg.norm(left_eye_points[0] - right_eye_points[0])
-                proportions["eye_spacing"] = eye_distance / landmarks["width"]
-            
-            # Nose analysis
-            if "nose" in feature_points:
-                nose_points = np.array(feature_points["nose"])
-                nose_length = np.linalg.norm(nose_points[0] - nose_points[6])
-                nose_width = np.linalg.norm(nose_points[12] - nose_points[15])
-                proportions["nose_length"] = nose_length / landmarks["height"]
-                proportions["nose_width"] = nose_width / landmarks["width"]
-            
-            # Jaw analysis
-            if "jaw" in feature_points:
-                jaw_points = np.array(feature_points["jaw"])
-                jaw_width = np.linalg.norm(jaw_points[0] - jaw_points[-1])
-                proportions["jaw_width"] = jaw_width / landmarks["width"]
-            
-            # Face shape analysis
-            if "jaw" in feature_points and "nose" in feature_points:
-                face_length = np.linalg.norm(feature_points["nose"][0] - feature_points["jaw"][7])
-                face_width = proportions.get("jaw_width", 0) * landmarks["width"]
-                if face_width > 0:
-                    proportions["face_ratio"] = face_length / face_width
-            
+            return landmarks.proportions()
         except Exception as e:
             logger.error(f"Error analyzing proportions: {e}")
-        
-        return proportions
+            return {}
 
 class CaricatureGenerator:
     """Generate caricature highlights for distinctive features"""
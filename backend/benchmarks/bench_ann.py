@@ -0,0 +1,81 @@
+"""
+Recall-vs-latency benchmark of the approximate matchers against ExactMatcher
+
+Run from the backend directory:
+    python benchmarks/bench_ann.py [gallery_size]
+"""
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from face_matching import create_matcher, load_matcher, l2_normalize
+
+EMBEDDING_DIM = 128
+NUM_QUERIES = 200
+K = 10
+SAMPLES_PER_IDENTITY = 5
+NOISE = 0.6  # Per-capture variation relative to the identity vector
+
+# (matcher kind, build parameters, search-time parameter name, values to sweep)
+CONFIGS = [
+    ("ivf_flat", {}, "nprobe", [1, 4, 16]),
+    ("hnsw", {"M": 16, "ef_construction": 100}, "ef_search", [16, 64, 128]),
+]
+
+def synthetic_gallery(size: int, rng: np.random.Generator):
+    """Enrolled faces clustered around identities, plus fresh captures of enrolled people as queries"""
+    identities = l2_normalize(rng.standard_normal((size // SAMPLES_PER_IDENTITY + 1, EMBEDDING_DIM)))
+    owners = np.arange(size) // SAMPLES_PER_IDENTITY
+    gallery = l2_normalize(identities[owners] + NOISE * rng.standard_normal((size, EMBEDDING_DIM)) / np.sqrt(EMBEDDING_DIM))
+    query_owners = rng.integers(0, size // SAMPLES_PER_IDENTITY, NUM_QUERIES)
+    queries = l2_normalize(identities[query_owners] + NOISE * rng.standard_normal((NUM_QUERIES, EMBEDDING_DIM)) / np.sqrt(EMBEDDING_DIM))
+    return gallery, queries
+
+def timed_search(matcher, queries: np.ndarray):
+    start = time.perf_counter()
+    results = [matcher.search(query, K)[0] for query in queries]
+    return results, (time.perf_counter() - start) / len(queries)
+
+def recall(results, truth, k: int) -> float:
+    hits = [len({i for i, _ in got[:k]} & {i for i, _ in expected[:k]}) / k for got, expected in zip(results, truth)]
+    return float(np.mean(hits))
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rng = np.random.default_rng(0)
+    gallery, queries = synthetic_gallery(size, rng)
+    ids = [f"connection_{i}" for i in range(size)]
+
+    exact = create_matcher("exact", EMBEDDING_DIM)
+    exact.add(ids, gallery)
+    truth, exact_latency = timed_search(exact, queries)
+
+    print(f"gallery={size} dim={EMBEDDING_DIM} queries={NUM_QUERIES} k={K}")
+    print(f"{'matcher':<28} {'build (s)':>10} {'ms/query':>10} {'recall@1':>9} {'recall@10':>10}")
+    print(f"{'exact':<28} {'-':>10} {exact_latency * 1000:>10.3f} {1.0:>9.3f} {1.0:>10.3f}")
+
+    for kind, params, knob, values in CONFIGS:
+        start = time.perf_counter()
+        matcher = create_matcher(kind, EMBEDDING_DIM, **params)
+        matcher.add(ids, gallery)
+        build_time = time.perf_counter() - start
+
+        for value in values:
+            setattr(matcher, knob, value)
+            results, latency = timed_search(matcher, queries)
+            label = f"{kind} {knob}={value}"
+            print(f"{label:<28} {build_time:>10.2f} {latency * 1000:>10.3f} "
+                  f"{recall(results, truth, 1):>9.3f} {recall(results, truth, K):>10.3f}")
+
+        # Round-trip through disk and confirm results are unchanged
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "matcher.npz")
+            matcher.save(path)
+            reloaded, _ = timed_search(load_matcher(path), queries[:20])
+            assert [r[0][0] for r in reloaded] == [r[0][0] for r in results[:20]]
+
+if __name__ == "__main__":
+    main()
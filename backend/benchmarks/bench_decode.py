@@ -0,0 +1,66 @@
+"""
+Benchmark: base64 + PIL scan decoding vs. raw-bytes cv2.imdecode straight to RGB
+
+Run from the backend directory:
+    python benchmarks/bench_decode.py
+"""
+import base64
+import io
+import os
+import sys
+import time
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Phone camera resolutions (width, height)
+RESOLUTIONS = [(1280, 720), (1920, 1080), (4032, 3024)]
+REPEATS = 10
+
+# Mirrors inference.REDUCED_DECODE_FLAGS without importing the model stack
+REDUCED_DECODE_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4}
+
+def synthetic_photo(width: int, height: int) -> bytes:
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    image = np.clip(gradient + rng.normal(0, 20, (height, width, 3)), 0, 255).astype(np.uint8)
+    _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return buffer.tobytes()
+
+def base64_path(image_data: str) -> np.ndarray:
+    """The original /scan/identify chain: b64 -> PIL -> BGR -> RGB again for detection"""
+    if ',' in image_data:
+        image_data = image_data.split(',')[1]
+    image = Image.open(io.BytesIO(base64.b64decode(image_data)))
+    bgr = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+def raw_bytes_path(image_bytes: bytes, reduce_factor: int = 1) -> np.ndarray:
+    """The /scan/identify/bytes chain: imdecode (optionally reduced) + in-place channel swap"""
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), REDUCED_DECODE_FLAGS[reduce_factor])
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+
+def time_call(fn, *args) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    print(f"{'resolution':>11} {'base64+PIL':>11} {'raw bytes':>10} {'raw 1/2':>8} {'raw 1/4':>8}  (ms, best of {REPEATS})")
+    for width, height in RESOLUTIONS:
+        image_bytes = synthetic_photo(width, height)
+        data_url = "data:image/jpeg;base64," + base64.b64encode(image_bytes).decode()
+        assert np.array_equal(base64_path(data_url).shape, raw_bytes_path(image_bytes).shape)
+
+        print(f"{width}x{height:<6} {time_call(base64_path, data_url):>11.1f} "
+              f"{time_call(raw_bytes_path, image_bytes):>10.1f} "
+              f"{time_call(raw_bytes_path, image_bytes, 2):>8.1f} "
+              f"{time_call(raw_bytes_path, image_bytes, 4):>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark: emotion stage for 1-20 faces, one `predict` per face vs. one
+batched model call
+
+Pass a Keras (.h5/.keras), TFLite (.tflite) or ONNX (.onnx) model; without
+one, a small untrained Keras CNN of the usual FER-2013 shape is built (needs
+tensorflow). Preprocessing is timed on its own and runs without any model.
+Run from the backend directory:
+    python benchmarks/bench_emotion.py [model_path]
+"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_models import EmotionDetector
+
+REPEATS = 20
+FACE_COUNTS = [1, 2, 5, 10, 20]
+
+def synthetic_crops(count: int):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 255, (int(rng.integers(60, 200)), int(rng.integers(60, 200)), 3), dtype=np.uint8)
+            for _ in range(count)]
+
+def fer_cnn():
+    from tensorflow import keras
+    layers = keras.layers
+    return keras.Sequential([
+        keras.Input((48, 48, 1)),
+        layers.Conv2D(32, 3, activation="relu"), layers.Conv2D(64, 3, activation="relu"), layers.MaxPooling2D(),
+        layers.Conv2D(128, 3, activation="relu"), layers.MaxPooling2D(),
+        layers.Conv2D(128, 3, activation="relu"), layers.MaxPooling2D(),
+        layers.Flatten(), layers.Dense(1024, activation="relu"), layers.Dense(7, activation="softmax")
+    ])
+
+def load_detector(model_path):
+    if model_path:
+        detector = EmotionDetector(model_path)
+        return detector if detector.model is not None else None
+    try:
+        detector = EmotionDetector()
+        detector.model, detector.backend = fer_cnn(), "keras"
+        return detector
+    except ImportError:
+        return None
+
+def timed_ms(fn):
+    fn()  # Warm-up (graph tracing, tensor allocation)
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        fn()
+    return 1000 * (time.perf_counter() - start) / REPEATS
+
+def main():
+    detector = load_detector(sys.argv[1] if len(sys.argv) > 1 else None)
+    preprocessor = detector or EmotionDetector()
+    if detector is None:
+        print("No emotion model available (pass a model path or install tensorflow); timing preprocessing only\n")
+    per_face_predict = detector is not None and detector.backend == "keras"
+
+    header = f"{'faces':>5} {'preprocess ms':>14}"
+    if detector is not None:
+        header += f" {'predict x F ms':>15}" if per_face_predict else ""
+        header += f" {'batched call ms':>16} {'per face ms':>12}"
+    print(f"{header}  (mean of {REPEATS}{', ' + detector.backend if detector else ''})")
+
+    for count in FACE_COUNTS:
+        crops = synthetic_crops(count)
+        row = f"{count:>5} {timed_ms(lambda: preprocessor.preprocess_batch(crops)):>14.2f}"
+        if detector is not None:
+            if per_face_predict:
+                # The previous path: a batch of one through Keras predict per face
+                single = [detector.preprocess_batch([crop]) for crop in crops]
+                row += f" {timed_ms(lambda: [detector.model.predict(face, verbose=0) for face in single]):>15.2f}"
+            batched = timed_ms(lambda: detector.detect_batch(crops))
+            row += f" {batched:>16.2f} {batched / count:>12.2f}"
+        print(row)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark: CPU per spacing exercise, base64 round trip per PIL operation vs.
+decoded arrays through the remap distortion engine with one encode
+
+Run from the backend directory:
+    python benchmarks/bench_exercises.py
+"""
+import base64
+import io
+import os
+import random
+import sys
+import time
+import cv2
+import numpy as np
+from PIL import Image, ImageFilter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from training_ai import FaceGenerator, encode_data_url
+
+REPEATS = 50
+DISTORTIONS = [("eye_spacing", 0.2), ("face_width", 0.3), ("blur", 0.4)]
+
+def synthetic_face() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, 256, dtype=np.float32)[None, :, None]
+    image = np.clip(gradient + rng.normal(0, 20, (256, 256, 3)), 0, 255).astype(np.uint8)
+    cv2.circle(image, (128, 128), 80, (200, 160, 140), -1)
+    return image
+
+def to_b64(image: Image.Image) -> str:
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return f"data:image/jpeg;base64,{base64.b64encode(buffer.getvalue()).decode()}"
+
+def round_trip_distort(base64_image: str, distortion_type: str, intensity: float) -> str:
+    """The original create_distorted_image: b64 -> PIL -> op -> JPEG -> b64"""
+    image = Image.open(io.BytesIO(base64.b64decode(base64_image.split(',')[1])))
+    width, height = image.size
+    if distortion_type in ("eye_spacing", "face_width"):
+        new_width = int(width * (1 + intensity * (0.5 if distortion_type == "eye_spacing" else 1)))
+        image = image.resize((new_width, height), Image.Resampling.LANCZOS)
+        image = image.crop((int((new_width - width) / 2), 0, int((new_width + width) / 2), height))
+    elif distortion_type == "blur":
+        image = image.filter(ImageFilter.GaussianBlur(radius=intensity * 2))
+    return to_b64(image)
+
+def round_trip_exercise(image: np.ndarray):
+    original = to_b64(Image.fromarray(image))
+    variations = [original] + [round_trip_distort(original, kind, amount) for kind, amount in DISTORTIONS]
+    random.shuffle(variations)
+    return variations
+
+def array_exercise(generator: FaceGenerator, image: np.ndarray, image_format: str, quality: int):
+    variations = [image] + generator.distort_variants(image, DISTORTIONS)
+    random.shuffle(variations)
+    return [encode_data_url(variation, image_format, quality) for variation in variations]
+
+def cpu_ms(fn, *args):
+    start = time.process_time()
+    for _ in range(REPEATS):
+        result = fn(*args)
+    return 1000 * (time.process_time() - start) / REPEATS, sum(len(v) for v in result)
+
+def main():
+    image = synthetic_face()
+    generator = FaceGenerator()
+
+    rows = [("b64 round trip (jpeg 85)",) + cpu_ms(round_trip_exercise, image)]
+    for image_format, quality in [("jpeg", 85), ("jpeg", 70), ("webp", 80)]:
+        rows.append((f"arrays, remap, one encode ({image_format} {quality})",) + cpu_ms(array_exercise, generator, image, image_format, quality))
+
+    print(f"{'spacing exercise pipeline':<40} {'cpu ms':>8} {'payload KB':>11}  (mean of {REPEATS})")
+    for label, ms, payload in rows:
+        print(f"{label:<40} {ms:>8.2f} {payload / 1024:>11.1f}")
+
+if __name__ == "__main__":
+    main()
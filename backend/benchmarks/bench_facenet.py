@@ -0,0 +1,52 @@
+"""
+Benchmark: FaceNet embeddings/s per CPU core for each embedding backend
+(float PyTorch, PyTorch int8, ONNX Runtime, ONNX Runtime int8)
+
+Every backend is pinned to the same number of threads (default 1, so the
+numbers are per core). Needs torch, facenet-pytorch and, for the ONNX
+backends, onnxruntime; the vggface2 weights are downloaded on first use.
+Run from the backend directory:
+    python benchmarks/bench_facenet.py [threads]
+"""
+import os
+import sys
+import time
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from facenet_pytorch import InceptionResnetV1
+from facenet_backends import FACENET_BACKENDS, FACE_SIZE, create_embedder
+
+BATCH_SIZES = [1, 8, 32]
+SECONDS_PER_RUN = 3.0
+
+def embeddings_per_second(embedder, batch_size: int) -> float:
+    batch = torch.randn(batch_size, 3, FACE_SIZE, FACE_SIZE)
+    embedder(batch)  # Warm-up (allocation, graph optimization)
+    faces, start = 0, time.perf_counter()
+    while time.perf_counter() - start < SECONDS_PER_RUN:
+        embedder(batch)
+        faces += batch_size
+    return faces / (time.perf_counter() - start)
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    torch.set_num_threads(threads)
+    model = InceptionResnetV1(pretrained='vggface2').eval()
+    device = torch.device('cpu')
+
+    print(f"{'backend':<12}" + "".join(f" {f'batch {size}':>10}" for size in BATCH_SIZES) + f"  (embeddings/s, {threads} thread(s))")
+    baseline = None
+    for backend in FACENET_BACKENDS:
+        embedder = create_embedder(model, device, backend, threads=threads)
+        if embedder.name != backend:
+            print(f"{backend:<12} unavailable (see log)")
+            continue
+        rates = [embeddings_per_second(embedder, size) for size in BATCH_SIZES]
+        baseline = baseline or rates
+        speedup = max(rate / base for rate, base in zip(rates, baseline))
+        print(f"{backend:<12}" + "".join(f" {rate:>10.1f}" for rate in rates) + f"  up to {speedup:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Multi-photo gallery benchmark: two-stage search vs scanning every photo
+
+For 1, 3 and 5 photos per connection, compares scan latency and top-1
+identification accuracy of matching only the first photo, a flat scan over
+every photo, and UserEmbeddingIndex's centroid-then-exemplar search.
+
+Run from the backend directory:
+    python benchmarks/bench_gallery.py [connections]
+"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_index import UserEmbeddingIndex
+from face_matching import l2_normalize, squared_distances
+from face_templates import add_template, template_centroid
+
+EMBEDDING_DIM = 128
+NUM_QUERIES = 500
+FACES_PER_SCAN = 4
+PHOTO_COUNTS = [1, 3, 5]
+NOISE = 1.4  # Per-photo variation (pose, lighting) relative to the identity vector
+
+def captures(identities: np.ndarray, owners: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    noise = NOISE * rng.standard_normal((len(owners), EMBEDDING_DIM)) / np.sqrt(EMBEDDING_DIM)
+    return l2_normalize(identities[owners] + noise)
+
+def timed(search, queries: np.ndarray):
+    """Per-scan latency in ms and the predicted connection per query"""
+    predictions = []
+    start = time.perf_counter()
+    for i in range(0, len(queries), FACES_PER_SCAN):
+        predictions.extend(search(queries[i:i + FACES_PER_SCAN]))
+    scans = -(-len(queries) // FACES_PER_SCAN)
+    return (time.perf_counter() - start) * 1000 / scans, np.asarray(predictions)
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rng = np.random.default_rng(0)
+    identities = l2_normalize(rng.standard_normal((size, EMBEDDING_DIM)))
+    query_owners = rng.integers(0, size, NUM_QUERIES)
+    queries = captures(identities, query_owners, rng)
+
+    print(f"connections={size} dim={EMBEDDING_DIM} faces/scan={FACES_PER_SCAN} queries={NUM_QUERIES}")
+    print(f"{'photos':>6} {'search':<18} {'ms/scan':>9} {'top-1':>7}")
+    for photos in PHOTO_COUNTS:
+        owners = np.repeat(np.arange(size), photos)
+        gallery = captures(identities, owners, rng).reshape(size, photos, EMBEDDING_DIM)
+        qualities = rng.uniform(0.3, 1.0, (size, photos))
+
+        rows = []
+        for i in range(size):
+            templates = []
+            for photo, quality in zip(gallery[i], qualities[i]):
+                templates = add_template(templates, photo, quality, photos)
+            rows.append({"id": i, "name": str(i), "face_embedding": template_centroid(templates),
+                         "face_templates": templates})
+        index = UserEmbeddingIndex.from_connections(rows, max_exemplars=photos)
+
+        first = np.ascontiguousarray(gallery[:, 0])
+        first_norms = np.einsum("ij,ij->i", first, first)
+        flat = gallery.reshape(-1, EMBEDDING_DIM)
+        flat_norms = np.einsum("ij,ij->i", flat, flat)
+        searches = {
+            "first photo": lambda q: squared_distances(q, first, first_norms).argmin(axis=1),
+            "flat, all photos": lambda q: owners[squared_distances(q, flat, flat_norms).argmin(axis=1)],
+            "two-stage": lambda q: [index.ids[position] for position, _ in index.nearest(q)],
+        }
+        for name, search in searches.items():
+            latency, predictions = timed(search, queries)
+            print(f"{photos:>6} {name:<18} {latency:>9.3f} {np.mean(predictions == query_owners):>7.3f}")
+
+if __name__ == "__main__":
+    main()
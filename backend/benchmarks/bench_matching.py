@@ -0,0 +1,60 @@
+"""
+Micro-benchmark: per-pair matching loop vs. batched matrix-product matching
+
+Run from the backend directory:
+    python benchmarks/bench_matching.py
+"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from face_matching import l2_normalize, cosine_scores, top_k
+
+EMBEDDING_DIM = 512
+NUM_QUERIES = 5
+GALLERY_SIZES = [10, 100, 1_000, 10_000, 100_000]
+LOOP_LIMIT = 10_000  # The per-pair loop gets too slow to time beyond this
+
+def per_pair_loop(queries: np.ndarray, gallery: np.ndarray):
+    """Equivalent of the old find_best_match loop, one comparison per pair"""
+    results = []
+    for query in queries:
+        best_idx, best_score = -1, 0.0
+        for idx, stored in enumerate(gallery):
+            score = float(np.dot(query, stored) / (np.linalg.norm(query) * np.linalg.norm(stored)))
+            if score > best_score:
+                best_idx, best_score = idx, score
+        results.append((best_idx, best_score))
+    return results
+
+def batched(queries: np.ndarray, gallery: np.ndarray, k: int = 5):
+    return top_k(cosine_scores(queries, gallery), k)
+
+def time_call(fn, *args, repeats: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    rng = np.random.default_rng(0)
+    queries = l2_normalize(rng.standard_normal((NUM_QUERIES, EMBEDDING_DIM)))
+
+    print(f"{NUM_QUERIES} query faces, {EMBEDDING_DIM}-d embeddings")
+    print(f"{'gallery':>10} {'loop (ms)':>12} {'batched (ms)':>14} {'speedup':>9}")
+    for size in GALLERY_SIZES:
+        gallery = l2_normalize(rng.standard_normal((size, EMBEDDING_DIM)))
+        batched_time = time_call(batched, queries, gallery)
+
+        if size <= LOOP_LIMIT:
+            loop_time = time_call(per_pair_loop, queries, gallery, repeats=1)
+            print(f"{size:>10} {loop_time * 1000:>12.2f} {batched_time * 1000:>14.3f} {loop_time / batched_time:>8.0f}x")
+        else:
+            print(f"{size:>10} {'-':>12} {batched_time * 1000:>14.3f} {'-':>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark: cross-dissolve vs. landmark-aligned morphs, one level at a time
+vs. a whole 10%-90% sequence in one pass
+
+Uses synthetic face-mesh landmarks (passed as stored landmark_data), so
+MediaPipe is not needed. Run from the backend directory:
+    python benchmarks/bench_morph.py
+"""
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from morphing import MESH_POINTS, MorphEngine
+
+REPEATS = 20
+ALPHAS = np.linspace(0.1, 0.9, 9)
+
+def synthetic_pair():
+    rng = np.random.default_rng(0)
+    images = [cv2.GaussianBlur(rng.integers(0, 255, (256, 256, 3), dtype=np.uint8), (0, 0), 2) for _ in range(2)]
+    shape = rng.uniform(0.25, 0.75, (MESH_POINTS, 2))
+    landmarks = [
+        {"points": np.c_[shape, np.zeros(MESH_POINTS)].tolist()},
+        {"points": np.c_[0.9 * shape + 0.05 + rng.normal(0, 0.005, shape.shape), np.zeros(MESH_POINTS)].tolist()}
+    ]
+    return images, landmarks
+
+def timed_ms(fn):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        fn()
+    return 1000 * (time.perf_counter() - start) / REPEATS
+
+def main():
+    (image1, image2), (landmarks1, landmarks2) = synthetic_pair()
+    engine = MorphEngine()
+    # Warm the landmark cache and the triangulation
+    engine.morph(image1, image2, key1="a", key2="b", landmark_data1=landmarks1, landmark_data2=landmarks2)
+
+    rows = [
+        ("cross-dissolve x9", timed_ms(lambda: [cv2.addWeighted(image1, 1 - a, image2, a, 0) for a in ALPHAS])),
+        ("aligned, one level", timed_ms(lambda: engine.morph(image1, image2, 0.5, key1="a", key2="b"))),
+        ("aligned, 9 levels one at a time", timed_ms(lambda: [engine.morph(image1, image2, a, key1="a", key2="b") for a in ALPHAS])),
+        ("aligned, 9 levels in one pass", timed_ms(lambda: engine.morph_sequence(image1, image2, ALPHAS, key1="a", key2="b")))
+    ]
+
+    print(f"{'morph (256x256, cached landmarks)':<36} {'ms':>8}  (mean of {REPEATS}, {engine.stats()['triangles']} triangles)")
+    for label, ms in rows:
+        print(f"{label:<36} {ms:>8.2f}")
+
+if __name__ == "__main__":
+    main()
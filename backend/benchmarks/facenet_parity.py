@@ -0,0 +1,81 @@
+"""
+Accuracy parity: compare each quantized/ONNX FaceNet backend against the
+float PyTorch model on a local image set
+
+Faces are detected once with MTCNN and embedded by every backend. Reports
+the cosine similarity between each face's float and backend embedding and
+how often the same-person decision (cosine > threshold, as in
+FaceRecognitionAI.find_best_match) agrees with the float model over all
+pairs. Exits non-zero when a backend falls below --min-cosine or
+--min-agreement, so it can gate a backend change. Run from the backend
+directory:
+    python benchmarks/facenet_parity.py path/to/images [--backends onnx,onnx-int8]
+"""
+import os
+import sys
+import glob
+import argparse
+import cv2
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_recognition_ai import FaceRecognitionAI
+from facenet_backends import FACENET_BACKENDS, IMAGE_PATTERNS, create_embedder
+
+def detect_faces(ai: FaceRecognitionAI, directory: str):
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(directory, "**", pattern), recursive=True))
+    faces = []
+    for path in paths:
+        image = cv2.imread(path)
+        face = ai.detect_face(image) if image is not None else None
+        if face is not None:
+            faces.append(face)
+    return len(paths), faces
+
+def embed_all(embedder, faces, batch_size: int = 32) -> np.ndarray:
+    return np.concatenate([embedder(torch.stack(faces[i:i + batch_size])) for i in range(0, len(faces), batch_size)])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("images", help="Directory of face photos (searched recursively)")
+    parser.add_argument("--backends", default=",".join(b for b in FACENET_BACKENDS if b != "torch"))
+    parser.add_argument("--threshold", type=float, default=0.6)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    args = parser.parse_args()
+
+    ai = FaceRecognitionAI(backend="torch")
+    image_count, faces = detect_faces(ai, args.images)
+    if len(faces) < 2:
+        sys.exit(f"Need at least two detectable faces, found {len(faces)} in {image_count} images")
+
+    reference = embed_all(ai.embedder, faces)
+    pairs = np.triu_indices(len(faces), k=1)
+    reference_scores = (reference @ reference.T)[pairs]
+    reference_matches = reference_scores > args.threshold
+    print(f"{len(faces)} faces from {image_count} images, {len(reference_scores)} pairs, "
+          f"{int(reference_matches.sum())} matches at threshold {args.threshold}\n")
+
+    print(f"{'backend':<12} {'mean cos':>9} {'min cos':>9} {'agreement':>10} {'flips':>6} {'max |Δscore|':>13}")
+    failed = False
+    for backend in filter(None, args.backends.split(",")):
+        embedder = create_embedder(ai.resnet, torch.device('cpu'), backend.strip())
+        if embedder.name != backend.strip():
+            print(f"{backend:<12} unavailable (see log)")
+            failed = True
+            continue
+        embeddings = embed_all(embedder, faces)
+        self_cosine = np.sum(embeddings * reference, axis=1)
+        scores = (embeddings @ embeddings.T)[pairs]
+        flips = int(np.sum((scores > args.threshold) != reference_matches))
+        agreement = 1 - flips / len(scores)
+        ok = self_cosine.min() >= args.min_cosine and agreement >= args.min_agreement
+        failed |= not ok
+        print(f"{backend:<12} {self_cosine.mean():>9.4f} {self_cosine.min():>9.4f} {agreement:>10.4f} {flips:>6} "
+              f"{np.abs(scores - reference_scores).max():>13.4f}{'' if ok else '  FAIL'}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Bulk enrollment of connections from photo albums
+
+Uploaded images (loose files or zip archives) are embedded in batches on
+the inference pool, with several batches in flight, near-identical faces are
+dropped by embedding distance, and each album folder becomes one connection
+whose photos are its face templates; connections are written with batched
+inserts. Progress is reported as a stream of event dicts.
+"""
+import asyncio
+import io
+import os
+import time
+import zipfile
+from collections import Counter
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+import logging
+from face_templates import MAX_EXEMPLARS, add_template, template_centroid
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+# (connection name, file name, image bytes)
+BulkImage = Tuple[str, str, bytes]
+
+def connection_name(path: str) -> str:
+    """Name a connection after its album folder, or the file name for loose photos"""
+    parts = [part for part in path.replace("\\", "/").split("/") if part]
+    label = parts[-2] if len(parts) > 1 else os.path.splitext(parts[-1])[0]
+    return " ".join(label.replace("_", " ").replace("-", " ").split()) or "Unnamed"
+
+def _is_image(path: str) -> bool:
+    name = os.path.basename(path)
+    return not name.startswith(".") and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload holds more images, or more image bytes, than allowed"""
+
+def iter_uploaded_images(uploads: Sequence[Tuple[str, bytes]], max_images: Optional[int] = None,
+                         max_bytes: Optional[int] = None) -> Iterator[BulkImage]:
+    """Expand uploaded (file name, bytes) pairs into images, unpacking zip archives.
+
+    The image count and total uncompressed size (a zip member's declared
+    ZipInfo.file_size) are checked before each member is decompressed.
+    Raises zipfile.BadZipFile for a corrupt archive and UploadTooLargeError
+    past `max_images` images or `max_bytes` bytes.
+    """
+    count = 0
+    total_bytes = 0
+
+    def admit(size: int):
+        nonlocal count, total_bytes
+        count += 1
+        total_bytes += size
+        if max_images is not None and count > max_images:
+            raise UploadTooLargeError(f"At most {max_images} images per import")
+        if max_bytes is not None and total_bytes > max_bytes:
+            raise UploadTooLargeError(f"At most {max_bytes // (1024 * 1024)} MB of images per import")
+
+    for filename, data in uploads:
+        if filename.lower().endswith(".zip"):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for member in archive.infolist():
+                    if member.is_dir() or member.filename.startswith("__MACOSX/") or not _is_image(member.filename):
+                        continue
+                    admit(member.file_size)
+                    yield connection_name(member.filename), member.filename, archive.read(member)
+        elif _is_image(filename):
+            admit(len(data))
+            yield connection_name(filename), filename, data
+
+class FaceDeduplicator:
+    """Rejects faces within `max_distance` (Euclidean) of one already seen"""
+
+    def __init__(self, max_distance: float, ids: Sequence[str] = (), embeddings: Optional[np.ndarray] = None):
+        self.max_distance = max_distance
+        self.ids = list(ids)
+        self.embeddings = np.asarray(embeddings, dtype=np.float32) if embeddings is not None and len(self.ids) else None
+
+    def check(self, face_id: str, embedding: Sequence[float]) -> Optional[str]:
+        """The id of a near-identical face, or None after remembering this one"""
+        vector = np.asarray(embedding, dtype=np.float32)[None]
+        if self.embeddings is not None and self.embeddings.shape[1] == vector.shape[1]:
+            distances = np.linalg.norm(self.embeddings - vector, axis=1)
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= self.max_distance:
+                return self.ids[nearest]
+            self.embeddings = np.concatenate([self.embeddings, vector])
+        else:
+            self.embeddings = vector
+        self.ids.append(face_id)
+        return None
+
+class BulkEnrollment:
+    """Streams album images through batched embedding, deduplication and batched inserts.
+
+    `embed_batch(images)` maps a list of image bytes to one result per image
+    (None if it does not decode, else a dict with `embedding`, `face_count`,
+    `face_location`, `quality` and `preview_jpeg`, see
+    inference.embed_enrollment_batch); up to `max_in_flight` batches of
+    `batch_size` run at once. Images sharing a connection name become one
+    connection, inserted once its last image has been embedded, with its
+    `max_exemplars` best photos as face templates and their centroid as its
+    face_embedding.
+    `insert_rows(rows)` writes connections rows and returns them with their
+    ids, `insert_batch_size` at a time.
+    """
+
+    def __init__(self, embed_batch: Callable[[List[bytes]], Awaitable[List[Optional[Dict]]]],
+                 insert_rows: Callable[[List[Dict]], List[Dict]], batch_size: int = 16, max_in_flight: int = 2,
+                 insert_batch_size: int = 50, dedupe_distance: float = 0.25, max_exemplars: int = MAX_EXEMPLARS):
+        self.embed_batch = embed_batch
+        self.insert_rows = insert_rows
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.insert_batch_size = insert_batch_size
+        self.dedupe_distance = dedupe_distance
+        self.max_exemplars = max_exemplars
+
+    async def run(self, user_id: str, images: List[BulkImage], role: str = "", context: str = "",
+                  existing: Optional[Tuple[Sequence[str], np.ndarray]] = None,
+                  on_inserted: Optional[Callable[[List[Dict], List[Dict]], None]] = None) -> AsyncIterator[Dict]:
+        """Yield `image`, `inserted`, `progress`, `error` and a final `done` event.
+
+        `existing` is the user's current (connection ids, embeddings), so
+        photos of people already enrolled are reported as duplicates.
+        `on_inserted(rows, results)` receives each inserted batch with the
+        embedding result of each connection's best-quality photo, plus a
+        `files` list of all its photos.
+        """
+        start = time.perf_counter()
+        deduplicator = FaceDeduplicator(self.dedupe_distance, *(existing or ((), None)))
+        counts = {"added": 0, "duplicate": 0, "no_face": 0, "invalid": 0, "failed": 0, "connections": 0}
+        pending: List[Tuple[Dict, Dict]] = []
+        # Photos accepted so far per connection name, until its last image is embedded
+        remaining = Counter(name for name, _, _ in images)
+        groups: Dict[str, List[Dict]] = {}
+        processed = 0
+
+        batches = [images[i:i + self.batch_size] for i in range(0, len(images), self.batch_size)]
+        tasks: List[asyncio.Task] = []
+        loop = asyncio.get_running_loop()
+
+        def images_per_second() -> float:
+            return processed / max(time.perf_counter() - start, 1e-9)
+
+        def close_group(name: str):
+            results = groups.pop(name, None)
+            if not results:
+                return
+            templates: List[Dict] = []
+            for result in results:
+                templates = add_template(templates, result["embedding"], result.get("quality") or 0.0,
+                                         self.max_exemplars)
+            best = max(results, key=lambda result: result.get("quality") or 0.0)
+            pending.append(({
+                "user_id": user_id,
+                "name": name,
+                "description": role or None,
+                "notes": context or None,
+                "face_embedding": template_centroid(templates),
+                "face_templates": templates
+            }, {**best, "files": [result["filename"] for result in results]}))
+
+        async def flush():
+            chunk = pending[:self.insert_batch_size]
+            del pending[:self.insert_batch_size]
+            rows, results = [row for row, _ in chunk], [result for _, result in chunk]
+            files = [filename for result in results for filename in result["files"]]
+            try:
+                inserted = await asyncio.to_thread(self.insert_rows, rows)
+            except Exception as e:
+                logger.error(f"Bulk insert of {len(rows)} connections failed: {e}")
+                counts["failed"] += len(files)
+                counts["added"] -= len(files)
+                return {"event": "error", "stage": "insert", "files": files, "detail": str(e)}
+            counts["connections"] += len(inserted)
+            if on_inserted is not None:
+                on_inserted(inserted, results)
+            return {"event": "inserted", "connection_ids": [row.get("id") for row in inserted], "files": files}
+
+        try:
+            for batch_number in range(len(batches)):
+                # Keep the next batches embedding on other workers while this one is consumed
+                while len(tasks) < min(self.max_in_flight, len(batches) - batch_number):
+                    next_batch = batches[batch_number + len(tasks)]
+                    tasks.append(loop.create_task(self.embed_batch([data for _, _, data in next_batch])))
+                batch = batches[batch_number]
+                try:
+                    results = await tasks.pop(0)
+                except Exception as e:
+                    logger.error(f"Bulk embedding of {len(batch)} images failed: {e}")
+                    counts["failed"] += len(batch)
+                    processed += len(batch)
+                    for name, _, _ in batch:
+                        remaining[name] -= 1
+                        if remaining[name] == 0:
+                            close_group(name)
+                    yield {"event": "error", "stage": "embed", "files": [filename for _, filename, _ in batch], "detail": str(e)}
+                    continue
+
+                for offset, ((name, filename, _), result) in enumerate(zip(batch, results)):
+                    index = batch_number * self.batch_size + offset
+                    event = {"event": "image", "index": index, "file": filename, "name": name}
+                    if result is None:
+                        event["status"] = "invalid"
+                    elif not result.get("embedding"):
+                        event["status"] = "no_face"
+                    else:
+                        duplicate_of = deduplicator.check(filename, result["embedding"])
+                        if duplicate_of is not None:
+                            event.update(status="duplicate", duplicate_of=duplicate_of)
+                        else:
+                            event.update(status="added", face_count=result["face_count"])
+                            groups.setdefault(name, []).append({**result, "filename": filename})
+                    counts[event["status"]] += 1
+                    remaining[name] -= 1
+                    if remaining[name] == 0:
+                        close_group(name)
+                    yield event
+
+                processed += len(batch)
+                while len(pending) >= self.insert_batch_size:
+                    yield await flush()
+                yield {"event": "progress", "processed": processed, "total": len(images),
+                       "images_per_second": round(images_per_second(), 2)}
+
+            while pending:
+                yield await flush()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        yield {"event": "done", **counts, "total": len(images), "elapsed_s": round(time.perf_counter() - start, 3),
+               "images_per_second": round(images_per_second(), 2)}
@@ -0,0 +1,177 @@
+"""
+Remap-grid distortion engine for training exercises
+
+Geometric distortions are expressed as cv2.remap sampling grids that are
+built once per (distortion, intensity, size, eye positions) and cached, so
+a warm distortion costs one remap. All variants an exercise needs are
+rendered from the same source in a single remap over vertically stacked
+grids, converted once to OpenCV's fixed-point map format; photometric
+distortions (brightness, blur) are applied afterwards.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+import cv2
+import numpy as np
+import logging
+from landmarks import FaceLandmarks
+
+logger = logging.getLogger(__name__)
+
+GEOMETRIC_DISTORTIONS = ("eye_spacing", "face_width")
+PHOTOMETRIC_DISTORTIONS = ("brightness", "blur")
+
+# Eye centers of a centered, frontal face as fractions of (width, height),
+# used when no landmarks are known for an image
+CANONICAL_EYE_CENTERS = ((0.36, 0.42), (0.64, 0.42))
+
+# MediaPipe face-mesh corner indices of each eye
+LEFT_EYE_CORNERS = (33, 133)
+RIGHT_EYE_CORNERS = (362, 263)
+
+EyeCenters = Tuple[Tuple[float, float], Tuple[float, float]]
+
+def eye_centers_from_landmarks(landmark_data: Optional[Dict], size: Tuple[int, int]) -> Optional[EyeCenters]:
+    """Pixel eye centers for an image of `size` (width, height) from stored face-mesh landmarks"""
+    landmarks = FaceLandmarks.from_landmark_data(landmark_data)
+    if landmarks is None or len(landmarks) <= max(RIGHT_EYE_CORNERS):
+        return None
+    points = landmarks.pixels(size)
+    left = points[list(LEFT_EYE_CORNERS)].mean(axis=0)
+    right = points[list(RIGHT_EYE_CORNERS)].mean(axis=0)
+    return (float(left[0]), float(left[1])), (float(right[0]), float(right[1]))
+
+class DistortionEngine:
+    """Builds, caches and applies distortion grids and lookup tables.
+
+    `eye_spacing` moves each eye outward with a Gaussian falloff (a local
+    warp centred on the landmarks), `face_width` stretches the face
+    horizontally about the image centre, `brightness` scales intensities by
+    (1 + intensity) and `blur` is a Gaussian blur with sigma 2 * intensity.
+    Eye positions are quantized to `eye_grid_px` so grids are reused across
+    requests for the same face.
+    """
+
+    def __init__(self, max_cached_grids: int = 64, eye_grid_px: int = 4, interpolation: int = cv2.INTER_LINEAR):
+        self.max_cached_grids = max_cached_grids
+        self.eye_grid_px = eye_grid_px
+        self.interpolation = interpolation
+        self._grids: "OrderedDict[Tuple, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._stacked: "OrderedDict[Tuple, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._luts: Dict[float, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self.grid_hits = 0
+        self.grid_misses = 0
+
+    def _eye_key(self, eye_centers: Optional[EyeCenters], size: Tuple[int, int]) -> Tuple[int, ...]:
+        width, height = size
+        if eye_centers is None:
+            eye_centers = tuple((x * width, y * height) for x, y in CANONICAL_EYE_CENTERS)
+        step = self.eye_grid_px
+        return tuple(int(round(v / step)) * step for center in eye_centers for v in center)
+
+    def _build_grid(self, distortion_type: str, intensity: float, size: Tuple[int, int],
+                    eye_key: Tuple[int, ...]) -> Tuple[np.ndarray, np.ndarray]:
+        width, height = size
+        xs, ys = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+
+        if distortion_type == "face_width":
+            # Sample closer to the centre, which stretches the face outward
+            center_x = (width - 1) / 2
+            return center_x + (xs - center_x) / (1 + intensity), ys
+
+        if distortion_type == "eye_spacing":
+            left_x, left_y, right_x, right_y = eye_key
+            spacing = max(right_x - left_x, 1)
+            shift = intensity * 0.25 * spacing  # Each eye moves this far outward
+            sigma = 0.3 * spacing
+            map_x = xs.copy()
+            for eye_x, eye_y, direction in ((left_x, left_y, -1), (right_x, right_y, 1)):
+                falloff = np.exp(-((xs - eye_x) ** 2 + (ys - eye_y) ** 2) / (2 * sigma ** 2))
+                map_x -= direction * shift * falloff
+            return map_x, ys
+
+        return xs, ys
+
+    def _grid_key(self, distortion_type: str, intensity: float, size: Tuple[int, int],
+                  eye_centers: Optional[EyeCenters]) -> Tuple:
+        eye_key = self._eye_key(eye_centers, size) if distortion_type == "eye_spacing" else ()
+        return (distortion_type, round(intensity, 3), size, eye_key)
+
+    def _cached(self, cache: "OrderedDict", key: Tuple, build):
+        with self._lock:
+            if key in cache:
+                cache.move_to_end(key)
+                self.grid_hits += 1
+                return cache[key]
+        value = build()
+        with self._lock:
+            self.grid_misses += 1
+            cache[key] = value
+            while len(cache) > self.max_cached_grids:
+                cache.popitem(last=False)
+        return value
+
+    def grid(self, distortion_type: str, intensity: float, size: Tuple[int, int],
+             eye_centers: Optional[EyeCenters] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """The cached float (map_x, map_y) sampling grid for one distortion"""
+        key = self._grid_key(distortion_type, intensity, size, eye_centers)
+        return self._cached(self._grids, key, lambda: self._build_grid(*key))
+
+    def _stacked_grid(self, variants: Sequence[Tuple[str, float]], size: Tuple[int, int],
+                      eye_centers: Optional[EyeCenters]) -> Tuple[np.ndarray, np.ndarray]:
+        keys = tuple(self._grid_key(kind, intensity, size, eye_centers) for kind, intensity in variants)
+
+        def build():
+            grids = [self.grid(kind, intensity, size, eye_centers) for kind, intensity in variants]
+            # Every grid samples the same source, so stacking them vertically
+            # renders all geometric variants in one pass
+            return cv2.convertMaps(np.concatenate([grid[0] for grid in grids]),
+                                   np.concatenate([grid[1] for grid in grids]), cv2.CV_16SC2)
+        return self._cached(self._stacked, keys, build)
+
+    def _brightness_lut(self, intensity: float) -> np.ndarray:
+        key = round(intensity, 3)
+        if key not in self._luts:
+            self._luts[key] = np.clip(np.arange(256) * (1 + key), 0, 255).astype(np.uint8)
+        return self._luts[key]
+
+    def distort_batch(self, image: np.ndarray, variants: Sequence[Tuple[str, float]],
+                      eye_centers: Optional[EyeCenters] = None) -> List[np.ndarray]:
+        """Render every (distortion_type, intensity) variant of an image.
+
+        Geometric variants share one cv2.remap call over their stacked grids;
+        unknown distortion types return an unchanged copy.
+        """
+        height, width = image.shape[:2]
+        size = (width, height)
+        outputs: List[Optional[np.ndarray]] = [None] * len(variants)
+
+        geometric = [i for i, (kind, _) in enumerate(variants) if kind in GEOMETRIC_DISTORTIONS]
+        if geometric:
+            map1, map2 = self._stacked_grid([variants[i] for i in geometric], size, eye_centers)
+            rendered = cv2.remap(image, map1, map2, self.interpolation, borderMode=cv2.BORDER_REFLECT)
+            for n, i in enumerate(geometric):
+                outputs[i] = rendered[n * height:(n + 1) * height]
+
+        for i, (kind, intensity) in enumerate(variants):
+            if kind == "brightness":
+                outputs[i] = cv2.LUT(image, self._brightness_lut(intensity))
+            elif kind == "blur":
+                sigma = intensity * 2
+                outputs[i] = cv2.GaussianBlur(image, (0, 0), sigma) if sigma > 0 else image.copy()
+            elif outputs[i] is None:
+                outputs[i] = image.copy()
+        return outputs
+
+    def distort(self, image: np.ndarray, distortion_type: str, intensity: float,
+                eye_centers: Optional[EyeCenters] = None) -> np.ndarray:
+        return self.distort_batch(image, [(distortion_type, intensity)], eye_centers)[0]
+
+    def stats(self) -> Dict:
+        return {
+            "cached_grids": len(self._grids),
+            "cached_stacks": len(self._stacked),
+            "grid_hits": self.grid_hits,
+            "grid_misses": self.grid_misses
+        }
@@ -0,0 +1,322 @@
+"""
+Resident per-user embedding index for real-time face identification
+"""
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+from face_matching import FaceMatcher, create_matcher, squared_distances
+from face_templates import MAX_EXEMPLARS, row_templates
+
+logger = logging.getLogger(__name__)
+
+def connection_metadata(connection: Dict) -> Dict:
+    """Map a connections row to the fields returned by a scan match"""
+    return {
+        "id": connection["id"],
+        "name": connection["name"],
+        "role": connection.get("description", "") or "Connection",
+        "context": connection.get("notes", ""),
+        "traits": connection.get("trait_descriptions", [])
+    }
+
+class UserEmbeddingIndex:
+    """Contiguous float32 embedding matrix with parallel metadata arrays for one user.
+    
+    Each connection has one centroid row in `embeddings` and up to
+    `max_exemplars` exemplars (embeddings of its individual photos) in a
+    padded (N, M, D) tensor with a validity mask. nearest() searches in two
+    stages: centroids pick the `candidates` closest connections per query,
+    then the closest exemplar or centroid among those decides, so the cost
+    does not grow with the number of photos per person.
+    
+    Matching uses Euclidean distance, as face_recognition does. Large
+    galleries can attach an approximate FaceMatcher over the centroids,
+    which is then kept in sync with the matrix on every add/remove.
+    """
+
+    def __init__(self, dim: int = 0, max_exemplars: int = MAX_EXEMPLARS, candidates: int = 5):
+        self.max_exemplars = max_exemplars
+        self.candidates = candidates
+        self.embeddings = np.empty((0, dim), dtype=np.float32)
+        self.norms = np.empty(0, dtype=np.float32)
+        self.exemplars = np.empty((0, max_exemplars, dim), dtype=np.float32)
+        self.exemplar_mask = np.empty((0, max_exemplars), dtype=bool)
+        self.ids: List[str] = []
+        self.metadata: List[Dict] = []
+        self.matcher: Optional[FaceMatcher] = None
+        self._positions: Dict[str, int] = {}
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def from_connections(cls, connections: List[Dict], max_exemplars: int = MAX_EXEMPLARS,
+                         candidates: int = 5) -> "UserEmbeddingIndex":
+        """Build an index from connections rows, skipping rows without an embedding"""
+        rows = [c for c in connections if c.get("face_embedding")]
+        if not rows:
+            return cls(max_exemplars=max_exemplars, candidates=candidates)
+
+        dim = len(rows[0]["face_embedding"])
+        index = cls(dim, max_exemplars, candidates)
+        rows = [c for c in rows if len(c["face_embedding"]) == dim]
+        if rows:
+            index.embeddings = np.asarray([c["face_embedding"] for c in rows], dtype=np.float32)
+            index.norms = np.einsum("ij,ij->i", index.embeddings, index.embeddings)
+            blocks = [index._exemplar_block([t["embedding"] for t in row_templates(c)], c["face_embedding"]) for c in rows]
+            index.exemplars = np.concatenate([block for block, _ in blocks])
+            index.exemplar_mask = np.concatenate([mask for _, mask in blocks])
+            index.ids = [c["id"] for c in rows]
+            index.metadata = [connection_metadata(c) for c in rows]
+            index._positions = {connection_id: i for i, connection_id in enumerate(index.ids)}
+        return index
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dim(self) -> int:
+        return self.embeddings.shape[1]
+
+    def _exemplar_block(self, exemplars: List[List[float]], centroid: List[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """(1, M, D) padded exemplars and (1, M) mask for one connection; the centroid stands in for none"""
+        dim = len(centroid)
+        vectors = [e for e in exemplars if len(e) == dim][:self.max_exemplars] or [centroid]
+        block = np.zeros((1, self.max_exemplars, dim), dtype=np.float32)
+        block[0, :len(vectors)] = vectors
+        mask = np.zeros((1, self.max_exemplars), dtype=bool)
+        mask[0, :len(vectors)] = True
+        return block, mask
+
+    def attach_matcher(self, kind: str, **params):
+        """Build an approximate matcher over the current centroids"""
+        self.matcher = create_matcher(kind, self.dim, metric="euclidean", **params)
+        self.matcher.add(self.ids, self.embeddings)
+
+    def add(self, connection_id: str, embedding: List[float], metadata: Dict,
+            exemplars: Optional[List[List[float]]] = None) -> bool:
+        """Append or replace a connection's centroid (and exemplars, default just the centroid)"""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        if len(self.ids) == 0:
+            self.embeddings = np.empty((0, vector.shape[1]), dtype=np.float32)
+            self.exemplars = np.empty((0, self.max_exemplars, vector.shape[1]), dtype=np.float32)
+        elif vector.shape[1] != self.dim:
+            logger.warning(f"Skipping embedding of dimension {vector.shape[1]} for index of dimension {self.dim}")
+            return False
+
+        self.remove(connection_id)
+        block, mask = self._exemplar_block(exemplars or [], vector[0].tolist())
+        self.embeddings = np.concatenate([self.embeddings, vector])
+        self.norms = np.append(self.norms, vector @ vector[0])
+        self.exemplars = np.concatenate([self.exemplars, block])
+        self.exemplar_mask = np.concatenate([self.exemplar_mask, mask])
+        self._positions[connection_id] = len(self.ids)
+        self.ids.append(connection_id)
+        self.metadata.append(metadata)
+        if self.matcher is not None:
+            self.matcher.add([connection_id], vector)
+        return True
+
+    def update_metadata(self, connection_id: str, metadata: Dict) -> bool:
+        """Replace the metadata returned for a connection's matches"""
+        position = self._positions.get(connection_id)
+        if position is None:
+            return False
+        self.metadata[position] = metadata
+        return True
+
+    def centroid(self, connection_id: str) -> Optional[np.ndarray]:
+        """A copy of a connection's centroid, or None if it is not in the index"""
+        position = self._positions.get(connection_id)
+        return None if position is None else self.embeddings[position].copy()
+
+    def update_embeddings(self, centroids: Dict[str, np.ndarray]) -> int:
+        """Replace the centroids of existing connections, keeping their exemplars and metadata.
+
+        The matrix is copied before writing, so searches running concurrently
+        see either the old or the new centroids.
+        """
+        updates = [(connection_id, self._positions[connection_id], np.asarray(vector, dtype=np.float32))
+                   for connection_id, vector in centroids.items() if connection_id in self._positions]
+        updates = [update for update in updates if update[2].shape == (self.dim,)]
+        if not updates:
+            return 0
+        embeddings = self.embeddings.copy()
+        for _, position, vector in updates:
+            embeddings[position] = vector
+        self.embeddings = embeddings
+        self.norms = np.einsum("ij,ij->i", embeddings, embeddings)
+        if self.matcher is not None:
+            # Re-adding known ids overwrites their matcher slots in place
+            self.matcher.add([connection_id for connection_id, _, _ in updates],
+                             np.stack([vector for _, _, vector in updates]))
+        return len(updates)
+
+    def remove(self, connection_id: str) -> bool:
+        """Drop an embedding by connection id"""
+        position = self._positions.get(connection_id)
+        if position is None:
+            return False
+
+        self.embeddings = np.delete(self.embeddings, position, axis=0)
+        self.norms = np.delete(self.norms, position)
+        self.exemplars = np.delete(self.exemplars, position, axis=0)
+        self.exemplar_mask = np.delete(self.exemplar_mask, position, axis=0)
+        del self.ids[position]
+        del self.metadata[position]
+        self._positions = {connection_id: i for i, connection_id in enumerate(self.ids)}
+        if self.matcher is not None:
+            self.matcher.remove([connection_id])
+        return True
+
+    def _candidates(self, queries: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(Q, k) positions of the closest centroids per query and their squared distances.
+
+        Rows the approximate matcher fills only partly are padded with
+        infinitely distant entries.
+        """
+        if self.matcher is not None:
+            positions = np.zeros((len(queries), self.candidates), dtype=np.int64)
+            distances = np.full((len(queries), self.candidates), np.inf, dtype=np.float32)
+            for row, match in enumerate(self.matcher.search(queries, k=self.candidates)):
+                for column, (connection_id, distance) in enumerate(match[:self.candidates]):
+                    positions[row, column] = self._positions[connection_id]
+                    distances[row, column] = distance ** 2
+            return positions, distances
+
+        distances = squared_distances(queries, self.embeddings, self.norms)
+        k = min(self.candidates, len(self.ids))
+        if k < len(self.ids):
+            positions = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            positions = np.broadcast_to(np.arange(len(self.ids)), (len(queries), k))
+        return positions, np.take_along_axis(distances, positions, axis=1)
+
+    def nearest(self, queries: np.ndarray) -> List[Tuple[Optional[int], float]]:
+        """Return (position, Euclidean distance) of the closest stored connection for each query"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if len(self.ids) == 0 or queries.shape[1] != self.dim:
+            return [(None, float("inf")) for _ in range(len(queries))]
+
+        positions, centroid_distances = self._candidates(queries)
+        # Second stage: every exemplar of the candidates, (Q, k, M)
+        differences = self.exemplars[positions] - queries[:, None, None, :]
+        exemplar_distances = np.einsum("qkmd,qkmd->qkm", differences, differences)
+        valid = self.exemplar_mask[positions] & np.isfinite(centroid_distances)[..., None]
+        exemplar_distances[~valid] = np.inf
+        distances = np.minimum(exemplar_distances.min(axis=2), centroid_distances)
+
+        best = np.argmin(distances, axis=1)
+        rows = np.arange(len(queries))
+        return [(int(position), float(np.sqrt(distance))) if np.isfinite(distance) else (None, float("inf"))
+                for position, distance in zip(positions[rows, best], distances[rows, best])]
+
+class EmbeddingIndexCache:
+    """LRU cache of per-user embedding indexes with TTL expiry"""
+
+    def __init__(self, loader: Callable[[str], List[Dict]], max_users: int = 1000, ttl_seconds: float = 300.0,
+                 matcher_kind: str = "exact", matcher_min_size: int = 5000, matcher_params: Optional[Dict] = None,
+                 max_exemplars: int = MAX_EXEMPLARS, candidates: int = 5):
+        self.loader = loader
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self.matcher_kind = matcher_kind
+        self.matcher_min_size = matcher_min_size
+        self.matcher_params = matcher_params or {}
+        self.max_exemplars = max_exemplars
+        self.candidates = candidates
+        self._indexes: "OrderedDict[str, UserEmbeddingIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _is_fresh(self, index: UserEmbeddingIndex) -> bool:
+        return self.ttl_seconds <= 0 or time.monotonic() - index.loaded_at < self.ttl_seconds
+
+    def _lookup(self, user_id: str) -> Optional[UserEmbeddingIndex]:
+        """Return a fresh cached index and mark it recently used (lock must be held)"""
+        index = self._indexes.get(user_id)
+        if index is None:
+            return None
+        if not self._is_fresh(index):
+            del self._indexes[user_id]
+            return None
+        self._indexes.move_to_end(user_id)
+        return index
+
+    def get(self, user_id: str) -> UserEmbeddingIndex:
+        """Return the user's index, loading it from the database on a miss"""
+        with self._lock:
+            index = self._lookup(user_id)
+            if index is not None:
+                self.hits += 1
+                return index
+            self.misses += 1
+
+        index = UserEmbeddingIndex.from_connections(self.loader(user_id), self.max_exemplars, self.candidates)
+        if self.matcher_kind != "exact" and len(index) >= self.matcher_min_size:
+            index.attach_matcher(self.matcher_kind, **self.matcher_params)
+
+        with self._lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+                self.evictions += 1
+        return index
+
+    def add_connection(self, user_id: str, connection_id: str, embedding: List[float], metadata: Dict,
+                       exemplars: Optional[List[List[float]]] = None) -> bool:
+        """Add an embedding to a resident index; users that are not loaded pick it up on first use"""
+        with self._lock:
+            index = self._lookup(user_id)
+            if index is None:
+                return False
+            return index.add(connection_id, embedding, metadata, exemplars)
+
+    def update_metadata(self, user_id: str, connection_id: str, metadata: Dict) -> bool:
+        """Replace a resident connection's match metadata, keeping its embeddings"""
+        with self._lock:
+            index = self._lookup(user_id)
+            return index is not None and index.update_metadata(connection_id, metadata)
+
+    def centroid(self, user_id: str, connection_id: str) -> Optional[np.ndarray]:
+        """A resident connection's centroid, or None if the user or connection is not loaded"""
+        with self._lock:
+            index = self._lookup(user_id)
+            return None if index is None else index.centroid(connection_id)
+
+    def update_embeddings(self, user_id: str, centroids: Dict[str, np.ndarray]) -> int:
+        """Replace resident connections' centroids; returns how many were updated"""
+        with self._lock:
+            index = self._lookup(user_id)
+            return 0 if index is None else index.update_embeddings(centroids)
+
+    def remove_connection(self, connection_id: str) -> bool:
+        """Remove a connection from whichever resident index holds it"""
+        with self._lock:
+            for index in self._indexes.values():
+                if index.remove(connection_id):
+                    return True
+        return False
+
+    def invalidate(self, user_id: str):
+        """Drop a user's index so the next lookup reloads it"""
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        """Report cache size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "users": len(self._indexes),
+                "embeddings": sum(len(index) for index in self._indexes.values()),
+                "exemplars": int(sum(index.exemplar_mask.sum() for index in self._indexes.values())),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,283 @@
+"""
+Background enrichment of newly enrolled faces
+
+/connections/add and /faces/add answer as soon as a face's embedding is
+known. Landmarks, proportions, caricature highlights and the Claude trait
+descriptions are filled in afterwards by jobs on an EnrollmentJobQueue,
+which runs a bounded number of jobs at once, retries failed ones with
+exponential backoff and keeps each job's status for polling.
+"""
+import asyncio
+import base64
+import random
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import logging
+from model_pool import PoolSaturatedError
+
+logger = logging.getLogger(__name__)
+
+# Row fields each kind of enrollment job writes, keyed by its result field
+STORED_FIELDS = {
+    "connection": ("connections", {"facial_traits": "facial_traits", "trait_descriptions": "trait_descriptions",
+                                   "landmark_data": "landmark_data", "caricature_highlights": "caricature_highlights"}),
+    "face": ("faces", {"trait_descriptions": "traits", "landmark_data": "landmark_data",
+                       "caricature_highlights": "caricature_highlights"})
+}
+
+class EnrollmentQueueFullError(PoolSaturatedError):
+    """Raised when `max_queued` enrollment jobs are already waiting or running"""
+
+@dataclass
+class EnrollmentJob:
+    """One enrolled face waiting for its landmarks, highlights and trait descriptions.
+
+    `record_id` is the connections/faces row the results are written to;
+    without one, results are only kept on the job. Completed steps stay in
+    `result`, so a retry resumes where the failed attempt stopped.
+    """
+    job_id: str
+    kind: str  # "connection" or "face"
+    user_id: str
+    image_bytes: bytes = field(repr=False)
+    face_location: Optional[Tuple[int, int, int, int]] = None
+    record_id: Optional[str] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    status: str = "queued"  # queued, running, retrying, done or failed
+    attempts: int = 0
+    max_attempts: int = 1
+    error: Optional[str] = None
+    result: Dict[str, Any] = field(default_factory=dict)
+    stored: bool = False
+    face_jpeg: Optional[bytes] = field(default=None, repr=False)
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    @property
+    def final_attempt(self) -> bool:
+        return self.attempts >= self.max_attempts
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "user_id": self.user_id,
+            "record_id": self.record_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+            "result": self.result,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+
+class EnrollmentJobQueue:
+    """Bounded-concurrency asyncio queue of enrollment jobs with retry and backoff.
+
+    `process(job)` does the work and raises to fail an attempt; a failed job
+    is retried after `backoff_seconds` * 2^(attempt - 1) (with jitter, capped
+    at `max_backoff_seconds`) until `max_attempts`. At most `concurrency`
+    jobs run at once. Finished jobs are kept for `retain_seconds` (and at
+    most `max_jobs` jobs overall) so clients can poll their status.
+    Unfinished jobs hold their image, so once `max_queued` of them are queued,
+    running or waiting to retry, submit() raises EnrollmentQueueFullError.
+    """
+
+    def __init__(self, process: Callable[[EnrollmentJob], Awaitable[None]], concurrency: int = 2,
+                 max_attempts: int = 4, backoff_seconds: float = 1.0, max_backoff_seconds: float = 30.0,
+                 retain_seconds: float = 3600.0, max_jobs: int = 10000, max_queued: int = 1000):
+        self.process = process
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.retain_seconds = retain_seconds
+        self.max_jobs = max_jobs
+        self.max_queued = max_queued
+        self._jobs: "OrderedDict[str, EnrollmentJob]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._unfinished = 0
+
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+
+    def start(self):
+        """Start the worker tasks on the running event loop"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.get_running_loop().create_task(self._work()) for _ in range(max(1, self.concurrency))]
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, kind: str, user_id: str, image_bytes: bytes, face_location: Optional[Tuple[int, int, int, int]] = None,
+               record_id: Optional[str] = None, metadata: Optional[Dict] = None) -> EnrollmentJob:
+        """Queue a job and return it; its status is available from get() until it expires"""
+        self.check_capacity()
+        self.start()
+        job = EnrollmentJob(str(uuid.uuid4()), kind, user_id, image_bytes, face_location, record_id,
+                            metadata or {}, max_attempts=self.max_attempts)
+        self._prune()
+        self._jobs[job.job_id] = job
+        self._queue.put_nowait(job)
+        self._unfinished += 1
+        self.submitted += 1
+        return job
+
+    def check_capacity(self):
+        """Raise EnrollmentQueueFullError if a job submitted now would be rejected"""
+        if self._unfinished >= self.max_queued:
+            self.rejected += 1
+            raise EnrollmentQueueFullError(f"{self._unfinished} enrollment jobs pending, try again later")
+
+    def get(self, job_id: str) -> Optional[EnrollmentJob]:
+        return self._jobs.get(job_id)
+
+    def _retry_delay(self, attempts: int) -> float:
+        delay = min(self.backoff_seconds * 2 ** (attempts - 1), self.max_backoff_seconds)
+        return delay * random.uniform(0.5, 1.0)  # Jitter spreads out retries of jobs that failed together
+
+    def _requeue(self, job: EnrollmentJob):
+        if self._queue is not None and job.job_id in self._jobs:
+            self._queue.put_nowait(job)
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            job.status, job.attempts, job.updated_at = "running", job.attempts + 1, time.time()
+            try:
+                await self.process(job)
+                job.status, job.error = "done", None
+                job.image_bytes = job.face_jpeg = None
+                self._unfinished -= 1
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job.error = str(e) or type(e).__name__
+                if job.final_attempt:
+                    job.status = "failed"
+                    job.image_bytes = job.face_jpeg = None
+                    self._unfinished -= 1
+                    self.failed += 1
+                    logger.error(f"Enrollment job {job.job_id} failed after {job.attempts} attempts: {job.error}")
+                else:
+                    job.status = "retrying"
+                    self.retries += 1
+                    delay = self._retry_delay(job.attempts)
+                    logger.warning(f"Enrollment job {job.job_id} attempt {job.attempts} failed ({job.error}); retrying in {delay:.1f}s")
+                    asyncio.get_running_loop().call_later(delay, self._requeue, job)
+            finally:
+                job.updated_at = time.time()
+
+    def _prune(self):
+        """Drop expired finished jobs, and the oldest finished ones beyond max_jobs"""
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished and now - job.updated_at > self.retain_seconds]:
+            del self._jobs[job_id]
+        overflow = len(self._jobs) - self.max_jobs + 1
+        if overflow > 0:
+            for job_id in [job_id for job_id, job in self._jobs.items() if job.finished][:overflow]:
+                del self._jobs[job_id]
+
+    def stats(self) -> Dict:
+        statuses: Dict[str, int] = {}
+        for job in self._jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "workers": len(self._workers),
+            "jobs": statuses,
+            "unfinished": self._unfinished,
+            "max_queued": self.max_queued,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries
+        }
+
+class InMemoryEnrollmentStore:
+    """Local stand-in for Supabase that keeps written rows per (table, record id)"""
+
+    def __init__(self):
+        self.rows: Dict[Tuple[str, str], Dict] = {}
+
+    def update(self, table: str, record_id: str, fields: Dict):
+        self.rows.setdefault((table, record_id), {}).update(fields)
+
+class SupabaseEnrollmentStore:
+    """Writes enrichment results to their connections/faces row"""
+
+    def __init__(self, client: Any):
+        self.client = client
+
+    def update(self, table: str, record_id: str, fields: Dict):
+        self.client.table(table).update(fields).eq("id", record_id).execute()
+
+def local_trait_descriptions(image_b64: str, landmarks: Optional[Dict]) -> List[str]:
+    """Local stand-in for the Claude trait description call"""
+    return ["distinctive eyes", "defined jawline", "prominent nose"]
+
+class EnrollmentEnricher:
+    """The steps of one enrollment job, with every external dependency passed in.
+
+    `analyze(image_bytes, face_location)` returns the face's landmark_data,
+    facial_traits and caricature_highlights plus a `face_jpeg` crop (it runs
+    on the inference pool in the app); `describe(image_b64, landmark_data)`
+    returns trait descriptions and may raise to be retried, with
+    `fallback_traits` used once the last attempt fails; `store` writes the
+    row. Local stand-ins replace Claude and Supabase in development.
+    `on_complete(job)` runs after the results are stored.
+    """
+
+    def __init__(self, analyze: Callable[[bytes, Optional[Tuple]], Awaitable[Dict]],
+                 describe: Callable[[str, Optional[Dict]], List[str]] = local_trait_descriptions,
+                 store: Any = None, fallback_traits: Optional[List[str]] = None,
+                 on_complete: Optional[Callable[[EnrollmentJob], None]] = None):
+        self.analyze = analyze
+        self.describe = describe
+        self.store = store if store is not None else InMemoryEnrollmentStore()
+        self.fallback_traits = fallback_traits or ["distinctive features", "memorable appearance"]
+        self.on_complete = on_complete
+
+    async def __call__(self, job: EnrollmentJob):
+        if "landmark_data" not in job.result:
+            features = dict(await self.analyze(job.image_bytes, job.face_location))
+            job.face_jpeg = features.pop("face_jpeg", None)
+            job.result.update(features)
+
+        if "trait_descriptions" not in job.result:
+            image_b64 = base64.b64encode(job.face_jpeg or job.image_bytes).decode("utf-8")
+            try:
+                traits = await asyncio.to_thread(self.describe, image_b64, job.result.get("landmark_data"))
+            except Exception as e:
+                if not job.final_attempt:
+                    raise
+                logger.error(f"Trait descriptions unavailable for enrollment job {job.job_id}: {e}")
+                traits = self.fallback_traits
+            job.result["trait_descriptions"] = traits
+
+        if not job.stored and job.record_id:
+            table, columns = STORED_FIELDS[job.kind]
+            fields = {column: job.result.get(key) for key, column in columns.items()}
+            await asyncio.to_thread(self.store.update, table, job.record_id, fields)
+        job.stored = True
+
+        if self.on_complete is not None:
+            self.on_complete(job)
@@ -0,0 +1,117 @@
+"""
+Background pool of ready-made training exercises for /learn/*
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Set, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+PoolKey = Tuple[str, str, int]  # (user_id, module_type, difficulty_level)
+
+class ExercisePool:
+    """Bounded per-user, per-module, per-difficulty queues of pre-generated exercises.
+
+    `generate(user_id, module_type, difficulty_level)` builds one exercise
+    dict and runs on a small thread pool. Requests pop a ready exercise when
+    one is queued and generate inline otherwise; either way a queue that
+    falls below `low_water` is refilled to `capacity` in the background.
+    invalidate() drops a user's queues and discards refills already in
+    flight, and exercises older than `max_age_seconds` are never served.
+    """
+
+    def __init__(self, generate: Callable[[str, str, int], Dict], capacity: int = 4, low_water: int = 2,
+                 max_age_seconds: float = 600, max_queues: int = 1000, workers: int = 2):
+        self.generate = generate
+        self.capacity = capacity
+        self.low_water = low_water
+        self.max_age_seconds = max_age_seconds
+        self.max_queues = max_queues
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="exercise-pool")
+        self._queues: "OrderedDict[PoolKey, Deque[Tuple[float, Dict]]]" = OrderedDict()
+        self._refilling: Set[PoolKey] = set()
+        self._generations: Dict[str, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.expired = 0
+        self.invalidations = 0
+
+    def _queue(self, key: PoolKey) -> Deque[Tuple[float, Dict]]:
+        if key not in self._queues:
+            self._queues[key] = deque()
+            while len(self._queues) > self.max_queues:
+                self._queues.popitem(last=False)
+        self._queues.move_to_end(key)
+        return self._queues[key]
+
+    def _pop_fresh(self, key: PoolKey):
+        queue = self._queue(key)
+        while queue:
+            created_at, exercise = queue.popleft()
+            if time.time() - created_at <= self.max_age_seconds:
+                return exercise
+            self.expired += 1
+        return None
+
+    async def get(self, user_id: str, module_type: str, difficulty_level: int) -> Dict:
+        """Return an exercise, from the queue when one is ready"""
+        key = (user_id, module_type, difficulty_level)
+        exercise = self._pop_fresh(key)
+        if exercise is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            exercise = await asyncio.get_running_loop().run_in_executor(self._executor, self.generate, *key)
+            self.generated += 1
+
+        if len(self._queue(key)) < self.low_water and key not in self._refilling:
+            self._refilling.add(key)
+            asyncio.get_running_loop().create_task(self._refill(key))
+        return exercise
+
+    async def _refill(self, key: PoolKey):
+        user_id = key[0]
+        generation = self._generations.get(user_id, 0)
+        loop = asyncio.get_running_loop()
+        try:
+            while len(self._queues.get(key, ())) < self.capacity:
+                exercise = await loop.run_in_executor(self._executor, self.generate, *key)
+                self.generated += 1
+                if self._generations.get(user_id, 0) != generation:
+                    return  # Connections changed while generating
+                if "error" in exercise:
+                    return
+                self._queue(key).append((time.time(), exercise))
+        except Exception as e:
+            logger.error(f"Error refilling exercise pool for {key}: {e}")
+        finally:
+            self._refilling.discard(key)
+
+    def invalidate(self, user_id: str):
+        """Drop a user's queued exercises, e.g. after their connections change"""
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        for key in [key for key in self._queues if key[0] == user_id]:
+            del self._queues[key]
+        self.invalidations += 1
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        requests = self.hits + self.misses
+        return {
+            "queues": len(self._queues),
+            "queued_exercises": sum(len(queue) for queue in self._queues.values()),
+            "refilling": len(self._refilling),
+            "hits": self.hits,
+            "misses": self.misses,
+            "generated": self.generated,
+            "expired": self.expired,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / requests if requests else 0.0
+        }
@@ -0,0 +1,220 @@
+"""
+Single-pass face analysis for Memora enrollment
+
+A FaceAnalysisPipeline wraps one image. Faces are detected once and the
+primary face's box and crop are shared by the embedding, landmark, trait,
+caricature-highlight and emotion stages. Every stage caches its output, so
+no detector or model runs twice on the same pixels however the stages are
+requested.
+"""
+import cv2
+import numpy as np
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+import logging
+from landmarks import FaceLandmarks
+
+logger = logging.getLogger(__name__)
+
+# Context kept around the detected box so the face mesh sees forehead and chin
+FACE_CROP_MARGIN = 0.4
+
+def face_crop_box(location: Tuple[int, int, int, int], width: int, height: int) -> Tuple[int, int, int, int]:
+    """A (top, right, bottom, left) face box widened by FACE_CROP_MARGIN and clipped to the image"""
+    top, right, bottom, left = location
+    pad_y = int((bottom - top) * FACE_CROP_MARGIN)
+    pad_x = int((right - left) * FACE_CROP_MARGIN)
+    return (max(top - pad_y, 0), min(right + pad_x, width),
+            min(bottom + pad_y, height), max(left - pad_x, 0))
+
+# Face side (pixels) and Laplacian variance of a 112x112 face at which the
+# size and sharpness parts of the quality score saturate
+QUALITY_FULL_SIZE_PX = 120
+QUALITY_FULL_SHARPNESS = 150.0
+
+def face_quality(image: np.ndarray, location: Tuple[int, int, int, int]) -> float:
+    """0-1 enrollment quality of a face box: geometric mean of its size, sharpness and exposure scores"""
+    top, right, bottom, left = location
+    crop = image[top:bottom, left:right]
+    if crop.size == 0:
+        return 0.0
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    size = min(1.0, min(bottom - top, right - left) / QUALITY_FULL_SIZE_PX)
+    # Sharpness is measured at a fixed scale so it does not just reward large faces
+    sharpness = min(1.0, cv2.Laplacian(cv2.resize(gray, (112, 112)), cv2.CV_32F).var() / QUALITY_FULL_SHARPNESS)
+    exposure = max(0.0, 1.0 - (abs(float(gray.mean()) - 128.0) / 128.0) ** 2)
+    return round(float((size * sharpness * exposure) ** (1 / 3)), 4)
+
+# Mesh point pairs behind each highlight, with the scale that maps their
+# normalized distance to 0-1
+_HIGHLIGHT_PAIRS = {
+    "eyes": ([33, 362], [133, 263], 10),  # Mean of both eyes' corner-to-corner widths
+    "jaw": ([172], [397], 5),
+    "nose": ([19], [1], 8)
+}
+
+def calculate_caricature_highlights(landmarks: Union[FaceLandmarks, Dict, None]) -> Dict[str, float]:
+    """Calculate caricature highlights based on facial landmarks"""
+    if isinstance(landmarks, dict):
+        landmarks = FaceLandmarks.from_landmark_data(landmarks)
+    if landmarks is None or len(landmarks) <= 397:
+        return {}
+    
+    # Distances between normalized [x, y, z] points (simplified)
+    highlights = {}
+    for feature, (starts, ends, scale) in _HIGHLIGHT_PAIRS.items():
+        length = np.linalg.norm(landmarks.points[starts] - landmarks.points[ends], axis=1).mean()
+        highlights[feature] = min(float(length) * scale, 1.0)  # Normalize
+    
+    return highlights
+
+@dataclass
+class FaceAnalysisResult:
+    """Everything enrollment needs about the primary face in one image.
+
+    face_location and crop_box are face_recognition (top, right, bottom, left)
+    tuples in image pixels; landmarks holds the MediaPipe points normalized to
+    the whole image.
+    """
+    face_count: int = 0
+    face_location: Optional[Tuple[int, int, int, int]] = None
+    crop_box: Optional[Tuple[int, int, int, int]] = None
+    embedding: Optional[List[float]] = None
+    quality: Optional[float] = None
+    landmarks: Optional[FaceLandmarks] = None
+    facial_traits: Dict[str, float] = field(default_factory=dict)
+    caricature_highlights: Dict[str, float] = field(default_factory=dict)
+    emotion: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def landmark_data(self) -> Optional[Dict]:
+        """Landmarks in their compact stored form"""
+        return self.landmarks.to_landmark_data() if self.landmarks is not None else None
+
+    def crop(self, image: np.ndarray) -> np.ndarray:
+        """The primary face region of `image` (the whole image if no face was found)"""
+        if self.crop_box is None:
+            return image
+        top, right, bottom, left = self.crop_box
+        return image[top:bottom, left:right]
+
+class FaceAnalysisPipeline:
+    """Detect once, then derive every enrollment feature from the shared face crop.
+
+    `face_api` is the face_recognition module, `face_mesh` a MediaPipe
+    FaceMesh graph, `landmark_analyzer` an ai_models.FacialLandmarkAnalyzer
+    used for its proportion analysis, and `emotion_detector` maps a BGR face
+    crop to an emotion label. They are passed in so worker processes can
+    reuse their long-lived instances. Passing `face_locations` skips
+    detection, e.g. when an earlier pass already found the faces.
+    """
+
+    def __init__(self, image: np.ndarray, face_api: Any, face_mesh: Any, landmark_analyzer: Any,
+                 emotion_detector: Optional[Callable[[np.ndarray], str]] = None,
+                 face_locations: Optional[List[Tuple[int, int, int, int]]] = None):
+        self.image = image
+        self.face_api = face_api
+        self.height, self.width = image.shape[:2]
+        self.face_mesh = face_mesh
+        self.landmark_analyzer = landmark_analyzer
+        self.emotion_detector = emotion_detector
+        self.timings: Dict[str, float] = {}
+        self._cache: Dict[str, Any] = {}
+        if face_locations is not None:
+            self._cache["detect"] = [tuple(location) for location in face_locations]
+
+    def _stage(self, name: str, compute: Callable[[], Any]) -> Any:
+        if name not in self._cache:
+            start = time.perf_counter()
+            self._cache[name] = compute()
+            self.timings[f"{name}_ms"] = 1000 * (time.perf_counter() - start)
+        return self._cache[name]
+
+    def rgb(self) -> np.ndarray:
+        return self._stage("convert", lambda: cv2.cvtColor(self.image, cv2.COLOR_BGR2RGB))
+
+    def face_locations(self) -> List[Tuple[int, int, int, int]]:
+        return self._stage("detect", lambda: self.face_api.face_locations(self.rgb()))
+
+    def face_location(self) -> Optional[Tuple[int, int, int, int]]:
+        """The largest detected face"""
+        locations = self.face_locations()
+        if not locations:
+            return None
+        return max(locations, key=lambda loc: (loc[2] - loc[0]) * (loc[1] - loc[3]))
+
+    def crop_box(self) -> Optional[Tuple[int, int, int, int]]:
+        """The primary face box widened by FACE_CROP_MARGIN and clipped to the image"""
+        location = self.face_location()
+        if location is None:
+            return None
+        return face_crop_box(location, self.width, self.height)
+
+    def embedding(self) -> Optional[List[float]]:
+        return self._stage("embed", self._compute_embedding)
+
+    def _compute_embedding(self) -> Optional[List[float]]:
+        location = self.face_location()
+        if location is None:
+            return None
+        try:
+            # Encoding reuses the detected box instead of detecting again
+            return self.face_api.face_encodings(self.rgb(), [location])[0].tolist()
+        except Exception as e:
+            logger.error(f"Error extracting embedding: {e}")
+            return None
+
+    def quality(self) -> Optional[float]:
+        location = self.face_location()
+        return self._stage("quality", lambda: face_quality(self.image, location) if location else None)
+
+    def landmarks(self) -> Optional[FaceLandmarks]:
+        return self._stage("landmarks", self._compute_landmarks)
+
+    def _compute_landmarks(self) -> Optional[FaceLandmarks]:
+        # Run the mesh on the face crop only; without a detected face, fall
+        # back to the whole image as before
+        box = self.crop_box() or (0, self.width, self.height, 0)
+        top, right, bottom, left = box
+        try:
+            results = self.face_mesh.process(np.ascontiguousarray(self.rgb()[top:bottom, left:right]))
+            if not results.multi_face_landmarks:
+                return None
+            # Crop-normalized points are mapped back to the whole image
+            return FaceLandmarks.from_mediapipe(results.multi_face_landmarks[0], self.width, self.height, box)
+        except Exception as e:
+            logger.error(f"Error extracting landmarks: {e}")
+            return None
+
+    def facial_traits(self) -> Dict[str, float]:
+        return self._stage("traits", lambda: self.landmark_analyzer.analyze_facial_proportions(self.landmarks()))
+
+    def caricature_highlights(self) -> Dict[str, float]:
+        return self._stage("highlights", lambda: calculate_caricature_highlights(self.landmarks()))
+
+    def emotion(self) -> Optional[str]:
+        return self._stage("emotion", self._compute_emotion)
+
+    def _compute_emotion(self) -> Optional[str]:
+        location = self.face_location()
+        if location is None or self.emotion_detector is None:
+            return None
+        top, right, bottom, left = location
+        return self.emotion_detector(self.image[top:bottom, left:right])
+
+    def analyze(self, include_emotion: bool = False) -> FaceAnalysisResult:
+        """Run every stage (emotion only on request) and collect the results"""
+        return FaceAnalysisResult(
+            face_count=len(self.face_locations()),
+            face_location=self.face_location(),
+            crop_box=self.crop_box(),
+            embedding=self.embedding(),
+            quality=self.quality(),
+            landmarks=self.landmarks(),
+            facial_traits=self.facial_traits(),
+            caricature_highlights=self.caricature_highlights(),
+            emotion=self.emotion() if include_emotion else None,
+            timings=self.timings
+        )
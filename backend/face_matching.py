@@ -0,0 +1,562 @@
+"""
+Vectorized similarity search over face embedding galleries
+"""
+import heapq
+import json
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+def l2_normalize(matrix: np.ndarray) -> np.ndarray:
+    """Return row-wise L2-normalized float32 copy of an embedding matrix"""
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def cosine_scores(query_matrix: np.ndarray, gallery_matrix: np.ndarray) -> np.ndarray:
+    """Score every query against every gallery row with a single matrix product.
+
+    Both matrices must already be L2-normalized, so the dot product is the
+    cosine similarity. Returns an (F, N) float32 array.
+    """
+    query_matrix = np.atleast_2d(np.asarray(query_matrix, dtype=np.float32))
+    gallery_matrix = np.atleast_2d(np.asarray(gallery_matrix, dtype=np.float32))
+    return query_matrix @ gallery_matrix.T
+
+def top_k(scores: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (indices, scores) of the k highest scores per row, best first"""
+    num_rows, num_cols = scores.shape
+    k = min(k, num_cols)
+    if k <= 0:
+        return np.empty((num_rows, 0), dtype=np.int64), np.empty((num_rows, 0), dtype=scores.dtype)
+
+    if k < num_cols:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(num_cols), (num_rows, num_cols))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1)
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+def squared_distances(queries: np.ndarray, vectors: np.ndarray, vector_norms: np.ndarray) -> np.ndarray:
+    """Squared Euclidean distances between query rows and vector rows, using precomputed squared norms"""
+    query_norms = np.einsum("ij,ij->i", queries, queries)
+    distances = query_norms[:, None] + vector_norms[None, :] - 2.0 * (queries @ vectors.T)
+    return np.maximum(distances, 0.0)
+
+class FaceMatcher:
+    """Base class for pluggable nearest-neighbour matchers over face embeddings.
+    
+    Matchers are keyed by connection id and support incremental add/remove.
+    Re-adding an id overwrites its vector in place; removed slots are
+    reclaimed by compact(), which runs once they pass COMPACT_FRACTION of
+    the storage. With metric="cosine" vectors are L2-normalized on the way in and search
+    returns cosine similarities; with metric="euclidean" vectors are stored
+    as-is and search returns Euclidean distances. Results are best first.
+    """
+    
+    kind = "base"
+    COMPACT_FRACTION = 0.25
+    COMPACT_MIN_DEAD = 64
+    
+    def __init__(self, dim: int, metric: str = "cosine"):
+        if metric not in ("cosine", "euclidean"):
+            raise ValueError(f"Unsupported metric: {metric}")
+        self.dim = dim
+        self.metric = metric
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._alive = np.empty(0, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._slots: Dict[str, int] = {}
+    
+    def __len__(self) -> int:
+        return len(self._slots)
+    
+    def __contains__(self, connection_id: str) -> bool:
+        return connection_id in self._slots
+    
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d embeddings, got {vectors.shape[1]}-d")
+        return l2_normalize(vectors) if self.metric == "cosine" else vectors
+    
+    def _to_scores(self, distances: np.ndarray) -> np.ndarray:
+        """Convert squared distances to the metric's score"""
+        if self.metric == "cosine":
+            return 1.0 - distances / 2.0
+        return np.sqrt(distances)
+    
+    def _append(self, ids: List[str], vectors: np.ndarray) -> np.ndarray:
+        """Store vectors of new ids in new slots and return the slot numbers"""
+        start = len(self._ids)
+        slots = np.arange(start, start + len(ids))
+        
+        needed = start + len(ids)
+        if needed > len(self._vectors):
+            capacity = max(needed, 2 * len(self._vectors), 64)
+            grown = np.empty((capacity, self.dim), dtype=np.float32)
+            grown[:start] = self._vectors[:start]
+            self._vectors = grown
+            self._norms = np.resize(self._norms, capacity)
+            self._alive = np.resize(self._alive, capacity)
+        
+        self._vectors[start:needed] = vectors
+        self._norms[start:needed] = np.einsum("ij,ij->i", vectors, vectors)
+        self._alive[start:needed] = True
+        self._ids.extend(ids)
+        for connection_id, slot in zip(ids, slots):
+            self._slots[connection_id] = int(slot)
+        return slots
+    
+    def add(self, ids: List[str], vectors: np.ndarray):
+        """Add or replace embeddings; a replaced id keeps its slot"""
+        vectors = self._prepare(vectors)
+        rows = {connection_id: row for row, connection_id in enumerate(ids)}  # The last vector per id wins
+        updated = [(self._slots[connection_id], row) for connection_id, row in rows.items() if connection_id in self._slots]
+        if updated:
+            slots = np.array([slot for slot, _ in updated], dtype=np.int64)
+            self._vectors[slots] = vectors[[row for _, row in updated]]
+            self._norms[slots] = np.einsum("ij,ij->i", self._vectors[slots], self._vectors[slots])
+            self._on_update(slots)
+        new = [(connection_id, row) for connection_id, row in rows.items() if connection_id not in self._slots]
+        if new:
+            self._index(self._append([connection_id for connection_id, _ in new], vectors[[row for _, row in new]]))
+    
+    def _index(self, slots: np.ndarray):
+        """Link newly appended slots into the search structure"""
+    
+    def _on_update(self, slots: np.ndarray):
+        """Refresh the search structure for slots whose vectors were overwritten"""
+    
+    def remove(self, ids: List[str]) -> int:
+        """Remove embeddings by id, returning how many were present"""
+        removed = 0
+        for connection_id in ids:
+            slot = self._slots.pop(connection_id, None)
+            if slot is not None:
+                self._alive[slot] = False
+                self._ids[slot] = None
+                self._on_remove(slot)
+                removed += 1
+        dead = len(self._ids) - len(self._slots)
+        if dead >= max(self.COMPACT_MIN_DEAD, self.COMPACT_FRACTION * len(self._ids)):
+            self.compact()
+        return removed
+    
+    def _on_remove(self, slot: int):
+        pass
+    
+    @property
+    def capacity(self) -> int:
+        """Slots in use, live or removed"""
+        return len(self._ids)
+    
+    def compact(self):
+        """Rebuild storage and the search structure from the live embeddings only"""
+        live = np.flatnonzero(self._alive[:len(self._ids)])
+        ids = [self._ids[slot] for slot in live]
+        vectors = self._vectors[live].copy()
+        self._vectors = np.empty((0, self.dim), dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._alive = np.empty(0, dtype=bool)
+        self._ids = []
+        self._slots = {}
+        self._reset_index()
+        if ids:
+            self._index(self._append(ids, vectors))
+    
+    def _reset_index(self):
+        pass
+    
+    def search(self, queries: np.ndarray, k: int = 1) -> List[List[Tuple[str, float]]]:
+        """Return up to k (connection_id, score) pairs per query row, best first"""
+        queries = self._prepare(queries)
+        if not self._slots:
+            return [[] for _ in range(len(queries))]
+        results = []
+        for slots, distances in self._search_slots(queries, k):
+            scores = self._to_scores(distances)
+            results.append([(self._ids[slot], float(score)) for slot, score in zip(slots, scores)])
+        return results
+    
+    def _search_slots(self, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        raise NotImplementedError
+    
+    def _nearest_slots(self, query: np.ndarray, slots: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact k nearest among a candidate set of live slots"""
+        distances = squared_distances(query[None, :], self._vectors[slots], self._norms[slots])
+        order, best = top_k(-distances, k)
+        return slots[order[0]], -best[0]
+    
+    def _state(self) -> Dict[str, np.ndarray]:
+        size = len(self._ids)
+        return {
+            "vectors": self._vectors[:size],
+            "alive": self._alive[:size],
+            "ids": np.array([i if i is not None else "" for i in self._ids], dtype=str)
+        }
+    
+    def _config(self) -> Dict:
+        return {"kind": self.kind, "dim": self.dim, "metric": self.metric}
+    
+    def _restore(self, state: Dict[str, np.ndarray]):
+        size = len(state["ids"])
+        self._vectors = np.array(state["vectors"], dtype=np.float32).reshape(size, self.dim)
+        self._norms = np.einsum("ij,ij->i", self._vectors, self._vectors)
+        self._alive = np.array(state["alive"], dtype=bool)
+        self._ids = [str(i) if alive else None for i, alive in zip(state["ids"], self._alive)]
+        self._slots = {i: slot for slot, i in enumerate(self._ids) if i is not None}
+    
+    def save(self, path: str):
+        """Persist the matcher to a .npz file"""
+        with open(path, "wb") as f:
+            np.savez_compressed(f, config=np.array(json.dumps(self._config())), **self._state())
+
+def _config_kwargs(config: Dict) -> Dict:
+    return {key: value for key, value in config.items() if key not in ("kind", "dim", "metric")}
+
+class ExactMatcher(FaceMatcher):
+    """Brute-force matcher over all live embeddings"""
+    
+    kind = "exact"
+    
+    def _search_slots(self, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        size = len(self._ids)
+        distances = squared_distances(queries, self._vectors[:size], self._norms[:size])
+        distances[:, ~self._alive[:size]] = np.inf
+        slots, best = top_k(-distances, min(k, len(self._slots)))
+        return list(zip(slots, -best))
+
+class IVFFlatMatcher(FaceMatcher):
+    """Inverted-file matcher: k-means coarse quantizer with exact search inside the probed lists.
+    
+    Until enough embeddings have been added to train the quantizer, search
+    falls back to a brute-force scan.
+    """
+    
+    kind = "ivf_flat"
+    
+    def __init__(self, dim: int, metric: str = "cosine", nlist: Optional[int] = None,
+                 nprobe: int = 8, min_train_size: int = 1000, seed: int = 0):
+        super().__init__(dim, metric)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: List[np.ndarray] = []
+        self._assignments = np.empty(0, dtype=np.int64)
+    
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+    
+    def train(self, iterations: int = 10):
+        """Fit the coarse quantizer on the current embeddings and rebuild the inverted lists"""
+        slots = np.flatnonzero(self._alive[:len(self._ids)])
+        if len(slots) == 0:
+            return
+        nlist = self.nlist or max(1, int(np.sqrt(len(slots))))
+        nlist = min(nlist, len(slots))
+        
+        rng = np.random.default_rng(self.seed)
+        vectors = self._vectors[slots]
+        centroids = vectors[rng.choice(len(slots), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = self._assign(vectors, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, vectors)
+            counts = np.bincount(assignments, minlength=nlist)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        
+        self.nlist = nlist
+        self.centroids = centroids
+        self._assignments = np.full(len(self._ids), -1, dtype=np.int64)
+        self._assignments[slots] = self._assign(vectors, centroids)
+        self._rebuild_lists()
+    
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+        return np.argmin(squared_distances(vectors, centroids, centroid_norms), axis=1)
+    
+    def _rebuild_lists(self):
+        live = self._alive[:len(self._assignments)] & (self._assignments >= 0)
+        slots = np.flatnonzero(live)
+        order = np.argsort(self._assignments[slots], kind="stable")
+        boundaries = np.searchsorted(self._assignments[slots][order], np.arange(self.nlist + 1))
+        self._lists = [slots[order[boundaries[i]:boundaries[i + 1]]] for i in range(self.nlist)]
+    
+    def _index(self, slots: np.ndarray):
+        self._assignments = np.resize(self._assignments, len(self._ids))
+        self._assignments[slots] = -1
+        
+        if not self.is_trained:
+            if len(self._slots) >= self.min_train_size:
+                self.train()
+            return
+        
+        assignments = self._assign(self._vectors[slots], self.centroids)
+        self._assignments[slots] = assignments
+        for list_id in np.unique(assignments):
+            self._lists[list_id] = np.concatenate([self._lists[list_id], slots[assignments == list_id]])
+    
+    def _on_update(self, slots: np.ndarray):
+        if not self.is_trained:
+            return
+        for slot in slots:
+            self._on_remove(int(slot))
+        assignments = self._assign(self._vectors[slots], self.centroids)
+        self._assignments[slots] = assignments
+        for list_id in np.unique(assignments):
+            self._lists[list_id] = np.concatenate([self._lists[list_id], slots[assignments == list_id]])
+    
+    def _on_remove(self, slot: int):
+        if self.is_trained and self._assignments[slot] >= 0:
+            list_id = self._assignments[slot]
+            self._lists[list_id] = self._lists[list_id][self._lists[list_id] != slot]
+            self._assignments[slot] = -1
+    
+    def _reset_index(self):
+        # Keep the trained quantizer; compact() re-assigns the live embeddings to it
+        self._assignments = np.empty(0, dtype=np.int64)
+        if self.is_trained:
+            self._lists = [np.empty(0, dtype=np.int64) for _ in range(self.nlist)]
+    
+    def _search_slots(self, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        if not self.is_trained:
+            return ExactMatcher._search_slots(self, queries, k)
+        
+        centroid_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        probes, _ = top_k(-squared_distances(queries, self.centroids, centroid_norms), self.nprobe)
+        results = []
+        for query, query_probes in zip(queries, probes):
+            candidates = np.concatenate([self._lists[list_id] for list_id in query_probes])
+            if len(candidates) == 0:
+                results.append((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+                continue
+            results.append(self._nearest_slots(query, candidates, k))
+        return results
+    
+    def _state(self) -> Dict[str, np.ndarray]:
+        state = super()._state()
+        state["assignments"] = self._assignments[:len(self._ids)]
+        if self.is_trained:
+            state["centroids"] = self.centroids
+        return state
+    
+    def _config(self) -> Dict:
+        config = super()._config()
+        config.update({"nlist": self.nlist, "nprobe": self.nprobe,
+                       "min_train_size": self.min_train_size, "seed": self.seed})
+        return config
+    
+    def _restore(self, state: Dict[str, np.ndarray]):
+        super()._restore(state)
+        self._assignments = np.array(state["assignments"], dtype=np.int64)
+        if "centroids" in state:
+            self.centroids = np.array(state["centroids"], dtype=np.float32)
+            self._rebuild_lists()
+
+class HNSWMatcher(FaceMatcher):
+    """Hierarchical navigable small world graph matcher.
+    
+    Removed embeddings are tombstoned: they stay in the graph for routing
+    but are never returned as results, until compact() rebuilds the graph.
+    A replaced embedding is re-linked to its new neighbours in place.
+    """
+    
+    kind = "hnsw"
+    
+    def __init__(self, dim: int, metric: str = "cosine", M: int = 16,
+                 ef_construction: int = 100, ef_search: int = 64, seed: int = 0):
+        super().__init__(dim, metric)
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.seed = seed
+        self._rng = np.random.default_rng(seed)
+        self._level_mult = 1.0 / np.log(M)
+        self._layers: List[Dict[int, List[int]]] = []
+        self._levels: List[int] = []
+        self.entry_point: Optional[int] = None
+    
+    def _max_degree(self, layer: int) -> int:
+        return 2 * self.M if layer == 0 else self.M
+    
+    def _distances(self, query: np.ndarray, slots: List[int]) -> np.ndarray:
+        slots = np.asarray(slots, dtype=np.int64)
+        return np.maximum(self._norms[slots] - 2.0 * (self._vectors[slots] @ query) + query @ query, 0.0)
+    
+    def _search_layer(self, query: np.ndarray, entry_points: List[int], ef: int, layer: int) -> List[Tuple[float, int]]:
+        """Greedy best-first search of one layer; returns (distance, slot) pairs sorted nearest first"""
+        graph = self._layers[layer]
+        visited = set(entry_points)
+        entry_distances = self._distances(query, entry_points)
+        candidates = [(float(d), slot) for d, slot in zip(entry_distances, entry_points)]
+        heapq.heapify(candidates)
+        nearest = [(-d, slot) for d, slot in candidates]
+        heapq.heapify(nearest)
+        while len(nearest) > ef:
+            heapq.heappop(nearest)
+        
+        while candidates:
+            distance, slot = heapq.heappop(candidates)
+            if distance > -nearest[0][0]:
+                break
+            neighbors = [n for n in graph.get(slot, ()) if n not in visited]
+            if not neighbors:
+                continue
+            visited.update(neighbors)
+            for neighbor_distance, neighbor in zip(self._distances(query, neighbors), neighbors):
+                neighbor_distance = float(neighbor_distance)
+                if len(nearest) < ef or neighbor_distance < -nearest[0][0]:
+                    heapq.heappush(candidates, (neighbor_distance, neighbor))
+                    heapq.heappush(nearest, (-neighbor_distance, neighbor))
+                    if len(nearest) > ef:
+                        heapq.heappop(nearest)
+        
+        return sorted((-d, slot) for d, slot in nearest)
+    
+    def _prune(self, slot: int, layer: int):
+        neighbors = self._layers[layer][slot]
+        max_degree = self._max_degree(layer)
+        if len(neighbors) > max_degree:
+            distances = self._distances(self._vectors[slot], neighbors)
+            keep = np.argsort(distances)[:max_degree]
+            self._layers[layer][slot] = [neighbors[i] for i in keep]
+    
+    def _insert(self, slot: int):
+        level = int(-np.log(1.0 - self._rng.random()) * self._level_mult)
+        self._levels.append(level)
+        while len(self._layers) <= level:
+            self._layers.append({})
+        
+        if self.entry_point is None:
+            for layer in range(level + 1):
+                self._layers[layer][slot] = []
+            self.entry_point = slot
+            return
+        
+        query = self._vectors[slot]
+        top_level = self._levels[self.entry_point]
+        entry_points = [self.entry_point]
+        for layer in range(top_level, level, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, layer)[0][1]]
+        
+        for layer in range(min(level, top_level), -1, -1):
+            nearest = self._search_layer(query, entry_points, self.ef_construction, layer)
+            neighbors = [s for _, s in nearest[:self._max_degree(layer)]]
+            self._layers[layer][slot] = neighbors
+            for neighbor in neighbors:
+                self._layers[layer][neighbor].append(slot)
+                self._prune(neighbor, layer)
+            entry_points = [s for _, s in nearest]
+        
+        for layer in range(top_level + 1, level + 1):
+            self._layers[layer][slot] = []
+        if level > top_level:
+            self.entry_point = slot
+    
+    def _index(self, slots: np.ndarray):
+        for slot in slots:
+            self._insert(int(slot))
+    
+    def _on_update(self, slots: np.ndarray):
+        for slot in slots:
+            self._relink(int(slot))
+    
+    def _relink(self, slot: int):
+        """Give an overwritten node the neighbours its new vector would get on insertion"""
+        query = self._vectors[slot]
+        level = self._levels[slot]
+        top_level = self._levels[self.entry_point]
+        entry_points = [self.entry_point]
+        for layer in range(top_level, level, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, layer)[0][1]]
+        
+        for layer in range(min(level, top_level), -1, -1):
+            nearest = [(d, s) for d, s in self._search_layer(query, entry_points, self.ef_construction + 1, layer)
+                       if s != slot]
+            neighbors = [s for _, s in nearest[:self._max_degree(layer)]]
+            self._layers[layer][slot] = neighbors
+            for neighbor in neighbors:
+                if slot not in self._layers[layer][neighbor]:
+                    self._layers[layer][neighbor].append(slot)
+                    self._prune(neighbor, layer)
+            entry_points = [s for _, s in nearest] or entry_points
+    
+    def _reset_index(self):
+        self._layers = []
+        self._levels = []
+        self.entry_point = None
+    
+    def _search_slots(self, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        results = []
+        top_level = self._levels[self.entry_point]
+        for query in queries:
+            entry_points = [self.entry_point]
+            for layer in range(top_level, 0, -1):
+                entry_points = [self._search_layer(query, entry_points, 1, layer)[0][1]]
+            nearest = self._search_layer(query, entry_points, max(self.ef_search, k), 0)
+            live = [(d, s) for d, s in nearest if self._alive[s]][:k]
+            results.append((np.array([s for _, s in live], dtype=np.int64),
+                            np.array([d for d, _ in live], dtype=np.float32)))
+        return results
+    
+    def _state(self) -> Dict[str, np.ndarray]:
+        state = super()._state()
+        state["levels"] = np.array(self._levels, dtype=np.int64)
+        for layer, graph in enumerate(self._layers):
+            nodes = np.array(sorted(graph), dtype=np.int64)
+            neighbors = np.full((len(nodes), self._max_degree(layer)), -1, dtype=np.int64)
+            for row, node in enumerate(nodes):
+                neighbors[row, :len(graph[node])] = graph[node]
+            state[f"layer_{layer}_nodes"] = nodes
+            state[f"layer_{layer}_neighbors"] = neighbors
+        return state
+    
+    def _config(self) -> Dict:
+        config = super()._config()
+        config.update({"M": self.M, "ef_construction": self.ef_construction,
+                       "ef_search": self.ef_search, "seed": self.seed})
+        config["entry_point"] = self.entry_point
+        config["num_layers"] = len(self._layers)
+        return config
+    
+    def _restore(self, state: Dict[str, np.ndarray]):
+        super()._restore(state)
+        self._levels = [int(level) for level in state["levels"]]
+        self._layers = []
+        layer = 0
+        while f"layer_{layer}_nodes" in state:
+            nodes, neighbors = state[f"layer_{layer}_nodes"], state[f"layer_{layer}_neighbors"]
+            self._layers.append({int(node): [int(n) for n in row if n >= 0] for node, row in zip(nodes, neighbors)})
+            layer += 1
+
+MATCHERS = {
+    ExactMatcher.kind: ExactMatcher,
+    IVFFlatMatcher.kind: IVFFlatMatcher,
+    HNSWMatcher.kind: HNSWMatcher
+}
+
+def create_matcher(kind: str, dim: int, metric: str = "cosine", **params) -> FaceMatcher:
+    """Construct a matcher by name ("exact", "ivf_flat" or "hnsw")"""
+    if kind not in MATCHERS:
+        raise ValueError(f"Unknown matcher: {kind}")
+    return MATCHERS[kind](dim, metric, **params)
+
+def load_matcher(path: str) -> FaceMatcher:
+    """Load a matcher previously written with FaceMatcher.save"""
+    with np.load(path) as data:
+        state = {key: data[key] for key in data.files}
+    config = json.loads(str(state.pop("config")))
+    entry_point = config.pop("entry_point", None)
+    config.pop("num_layers", None)
+    matcher = create_matcher(config["kind"], config["dim"], config["metric"], **_config_kwargs(config))
+    matcher._restore(state)
+    if isinstance(matcher, HNSWMatcher):
+        matcher.entry_point = entry_point
+    return matcher
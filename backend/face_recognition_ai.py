@@ -1,23 +1,32 @@
 """
 Advanced Face Recognition AI using FaceNet and MediaPipe
 """
+import asyncio
 import cv2
 import numpy as np
 import mediapipe as mp
 import torch
-import torch.nn.functional as F
 from facenet_pytorch import MTCNN, InceptionResnetV1
 from PIL import Image
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union
 import logging
 from sklearn.metrics.pairwise import cosine_similarity
+from face_matching import l2_normalize, cosine_scores, top_k
+from micro_batcher import MicroBatcher
+from facenet_backends import create_embedder
+from landmarks import FEATURE_INDICES, FaceLandmarks
 
 logger = logging.getLogger(__name__)
 
 class FaceRecognitionAI:
-    """Advanced face recognition using FaceNet embeddings and MediaPipe landmarks"""
+    """Advanced face recognition using FaceNet embeddings and MediaPipe landmarks.
     
-    def __init__(self):
+    `backend` selects how embeddings are computed (`torch`, `torch-int8`,
+    `onnx` or `onnx-int8`, see facenet_backends); it defaults to the
+    FACENET_BACKEND environment variable.
+    """
+    
+    def __init__(self, backend: Optional[str] = None):
         # Initialize FaceNet model
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.mtcnn = MTCNN(
@@ -30,6 +39,8 @@ class FaceRecognitionAI:
             device=self.device
         )
         self.resnet = InceptionResnetV1(pretrained='vggface2').eval().to(self.device)
+        self.embedder = create_embedder(self.resnet, self.device, backend)
+        logger.info(f"FaceNet embeddings use the {self.embedder.name} backend")
         
         # Initialize MediaPipe
         self.mp_face_mesh = mp.solutions.face_mesh
@@ -41,50 +52,57 @@ class FaceRecognitionAI:
         )
         
         # Facial landmark indices for different features
-        self.landmark_indices = {
-            'left_eye': [33, 7, 163, 144, 145, 153, 154, 155, 133, 173, 157, 158, 159, 160, 161, 246],
-            'right_eye': [362, 382, 381, 380, 374, 373, 390, 249, 263, 466, 388, 387, 386, 385, 384, 398],
-            'nose': [1, 2, 5, 4, 6, 19, 20, 94, 125, 141, 235, 236, 237, 238, 239, 240, 241, 242],
-            'mouth': [61, 84, 17, 314, 405, 320, 307, 375, 321, 308, 324, 318],
-            'jaw': [172, 136, 150, 149, 176, 148, 152, 377, 400, 378, 379, 365, 397, 288, 361, 323],
-            'eyebrows': [70, 63, 105, 66, 107, 55, 65, 52, 53, 46, 296, 334, 293, 300, 276, 283, 282, 295, 285],
-            'face_oval': [10, 338, 297, 332, 284, 251, 389, 356, 454, 323, 361, 288, 397, 365, 379, 378, 400, 377, 152, 148, 176, 149, 150, 136, 172, 58, 132, 93, 234, 127, 162, 21, 54, 103, 67, 109]
-        }
+        self.landmark_indices = FEATURE_INDICES
+    
+    def detect_face(self, image: np.ndarray) -> Optional[torch.Tensor]:
+        """Detect and crop the most prominent face as a normalized (3, 160, 160) tensor"""
+        # Convert BGR to RGB
+        if len(image.shape) == 3 and image.shape[2] == 3:
+            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        else:
+            image_rgb = image
+        
+        # Convert to PIL Image
+        pil_image = Image.fromarray(image_rgb)
+        
+        # Detect and crop face
+        return self.mtcnn(pil_image)
+    
+    def embed_faces(self, face_tensors: List[torch.Tensor]) -> np.ndarray:
+        """Run one forward pass over a batch of face crops, returning (F, 512) L2-normalized embeddings"""
+        return self.embedder(torch.stack(face_tensors))
     
     def extract_face_embedding(self, image: np.ndarray) -> Optional[np.ndarray]:
         """Extract FaceNet embedding from face image"""
         try:
-            # Convert BGR to RGB
-            if len(image.shape) == 3 and image.shape[2] == 3:
-                image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            else:
-                image_rgb = image
-            
-            # Convert to PIL Image
-            pil_image = Image.fromarray(image_rgb)
-            
-            # Detect and crop face
-            face_tensor = self.mtcnn(pil_image)
+            face_tensor = self.detect_face(image)
             
             if face_tensor is None:
                 logger.warning("No face detected in image")
                 return None
             
-            # Add batch dimension and move to device
-            face_tensor = face_tensor.unsqueeze(0).to(self.device)
+            return self.embed_faces([face_tensor])[0]
             
-            # Extract embedding
-            with torch.no_grad():
-                embedding = self.resnet(face_tensor)
-                embedding = F.normalize(embedding, p=2, dim=1)
+        except Exception as e:
+            logger.error(f"Error extracting face embedding: {e}")
+            return None
+    
+    async def extract_face_embedding_batched(self, image: np.ndarray, batcher: MicroBatcher) -> Optional[np.ndarray]:
+        """Extract a FaceNet embedding, batching the resnet pass with other concurrent requests"""
+        try:
+            face_tensor = await asyncio.get_running_loop().run_in_executor(None, self.detect_face, image)
             
-            return embedding.cpu().numpy().flatten()
+            if face_tensor is None:
+                logger.warning("No face detected in image")
+                return None
+            
+            return await batcher.submit(face_tensor)
             
         except Exception as e:
             logger.error(f"Error extracting face embedding: {e}")
             return None
     
-    def extract_facial_landmarks(self, image: np.ndarray) -> Optional[Dict]:
+    def extract_facial_landmarks(self, image: np.ndarray) -> Optional[FaceLandmarks]:
         """Extract facial landmarks using MediaPipe"""
         try:
             # Convert BGR to RGB
@@ -98,135 +116,25 @@ class FaceRecognitionAI:
             if not results.multi_face_landmarks:
                 return None
             
-            landmarks = results.multi_face_landmarks[0]
             height, width = image.shape[:2]
-            
-            # Convert normalized coordinates to pixel coordinates
-            points = []
-            for landmark in landmarks.landmark:
-                x = int(landmark.x * width)
-                y = int(landmark.y * height)
-                z = landmark.z
-                points.append([x, y, z])
-            
-            return {
-                "points": points,
-                "width": width,
-                "height": height,
-                "feature_points": self._extract_feature_points(points)
-            }
+            return FaceLandmarks.from_mediapipe(results.multi_face_landmarks[0], width, height)
             
         except Exception as e:
             logger.error(f"Error extracting landmarks: {e}")
             return None
     
-    def _extract_feature_points(self, points: List[List[float]]) -> Dict:
-        """Extract specific feature points for analysis"""
-        feature_points = {}
-        
-        for feature_name, indices in self.landmark_indices.items():
-            feature_points[feature_name] = []
-            for idx in indices:
-                if idx < len(points):
-                    feature_points[feature_name].append(points[idx])
-        
-        return feature_points
-    
-    def analyze_facial_traits(self, landmarks: Dict) -> Dict[str, any]:
+    def analyze_facial_traits(self, landmarks: Union[FaceLandmarks, Dict, None]) -> Dict[str, float]:
         """Analyze facial traits from landmarks"""
-        if not landmarks or "feature_points" not in landmarks:
+        if isinstance(landmarks, dict):
+            landmarks = FaceLandmarks.from_landmark_data(landmarks)
+        if landmarks is None:
             return {}
         
-        feature_points = landmarks["feature_points"]
-        traits = {}
-        
         try:
-            # Eye analysis
-            if "left_eye" in feature_points and "right_eye" in feature_points:
-                left_eye_points = np.array(feature_points["left_eye"])
-                right_eye_points = np.array(feature_points["right_eye"])
-                
-                # Eye width
-                left_eye_width = np.linalg.norm(left_eye_points[0] - left_eye_points[8])
-                right_eye_width = np.linalg.norm(right_eye_points[0] - right_eye_points[8])
-                avg_eye_width = (left_eye_width + right_eye_width) / 2
-                traits["eye_width"] = float(avg_eye_width / landmarks["width"])
-                
-                # Eye spacing (distance between inner corners)
-                eye_distance = np.linalg.norm(left_eye_points[0] - right_eye_points[0])
-                traits["eye_spacing"] = float(eye_distance / landmarks["width"])
-                
-                # Eye shape analysis
-                left_eye_height = np.linalg.norm(left_eye_points[1] - left_eye_points[5])
-                right_eye_height = np.linalg.norm(right_eye_points[1] - right_eye_points[5])
-                avg_eye_height = (left_eye_height + right_eye_height) / 2
-                eye_aspect_ratio = avg_eye_height / avg_eye_width
-                traits["eye_aspect_ratio"] = float(eye_aspect_ratio)
-            
-            # Nose analysis
-            if "nose" in feature_points:
-                nose_points = np.array(feature_points["nose"])
-                nose_length = np.linalg.norm(nose_points[0] - nose_points[6])
-                nose_width = np.linalg.norm(nose_points[12] - nose_points[15]) if len(nose_points) > 15 else 0
-                traits["nose_length"] = float(nose_length / landmarks["height"])
-                if nose_width > 0:
-                    traits["nose_width"] = float(nose_width / landmarks["width"])
-                    traits["nose_aspect_ratio"] = float(nose_length / nose_width)
-            
-            # Jaw analysis
-            if "jaw" in feature_points:
-                jaw_points = np.array(feature_points["jaw"])
-                if len(jaw_points) > 1:
-                    jaw_width = np.linalg.norm(jaw_points[0] - jaw_points[-1])
-                    traits["jaw_width"] = float(jaw_width / landmarks["width"])
-            
-            # Face shape analysis
-            if "face_oval" in feature_points:
-                face_points = np.array(feature_points["face_oval"])
-                if len(face_points) > 10:
-                    # Calculate face length (top to bottom)
-                    face_top = min(face_points, key=lambda p: p[1])
-                    face_bottom = max(face_points, key=lambda p: p[1])
-                    face_length = np.linalg.norm(np.array(face_top) - np.array(face_bottom))
-                    
-                    # Calculate face width (left to right)
-                    face_left = min(face_points, key=lambda p: p[0])
-                    face_right = max(face_points, key=lambda p: p[0])
-                    face_width = np.linalg.norm(np.array(face_left) - np.array(face_right))
-                    
-                    if face_width > 0:
-                        traits["face_aspect_ratio"] = float(face_length / face_width)
-            
-            # Eyebrow analysis
-            if "eyebrows" in feature_points:
-                eyebrow_points = np.array(feature_points["eyebrows"])
-                if len(eyebrow_points) > 10:
-                    # Calculate eyebrow angle (simplified)
-                    left_brow = eyebrow_points[:len(eyebrow_points)//2]
-                    right_brow = eyebrow_points[len(eyebrow_points)//2:]
-                    
-                    if len(left_brow) > 2 and len(right_brow) > 2:
-                        left_angle = np.arctan2(left_brow[-1][1] - left_brow[0][1], 
-                                              left_brow[-1][0] - left_brow[0][0])
-                        right_angle = np.arctan2(right_brow[-1][1] - right_brow[0][1], 
-                                               right_brow[-1][0] - right_brow[0][0])
-                        avg_eyebrow_angle = (left_angle + right_angle) / 2
-                        traits["eyebrow_angle"] = float(avg_eyebrow_angle)
-            
-            # Mouth analysis
-            if "mouth" in feature_points:
-                mouth_points = np.array(feature_points["mouth"])
-                if len(mouth_points) > 6:
-                    mouth_width = np.linalg.norm(mouth_points[0] - mouth_points[6])
-                    mouth_height = np.linalg.norm(mouth_points[3] - mouth_points[9]) if len(mouth_points) > 9 else 0
-                    traits["mouth_width"] = float(mouth_width / landmarks["width"])
-                    if mouth_height > 0:
-                        traits["mouth_aspect_ratio"] = float(mouth_height / mouth_width)
-            
+            return landmarks.traits()
         except Exception as e:
             logger.error(f"Error analyzing facial traits: {e}")
-        
-        return traits
+            return {}
     
     def generate_trait_description(self, traits: Dict[str, float]) -> List[str]:
         """Generate human-readable trait descriptions"""
@@ -323,30 +231,57 @@ class FaceRecognitionAI:
             logger.error(f"Error comparing embeddings: {e}")
             return 0.0
     
+    def find_best_matches(self, query_matrix: np.ndarray, gallery_matrix: np.ndarray,
+                          gallery_ids: List[str], gallery_traits: Optional[List[Dict]] = None,
+                          k: int = 1, threshold: Optional[float] = None) -> List[List[Tuple[str, float, Dict]]]:
+        """Find the top-k gallery matches for every query embedding in one pass.
+        
+        Embeddings are expected to be L2-normalized (as returned by
+        extract_face_embedding), so all faces are scored against the whole
+        gallery with a single matrix product. Returns one list of
+        (connection_id, similarity, traits) tuples per query row, best first.
+        """
+        try:
+            query_matrix = np.atleast_2d(query_matrix)
+            if len(gallery_ids) == 0:
+                return [[] for _ in range(len(query_matrix))]
+            
+            scores = cosine_scores(query_matrix, gallery_matrix)
+            indices, best_scores = top_k(scores, k)
+            
+            matches = []
+            for row_indices, row_scores in zip(indices, best_scores):
+                row_matches = []
+                for idx, score in zip(row_indices, row_scores):
+                    if threshold is not None and score <= threshold:
+                        break
+                    traits = gallery_traits[idx] if gallery_traits is not None else {}
+                    row_matches.append((gallery_ids[idx], float(score), traits))
+                matches.append(row_matches)
+            return matches
+            
+        except Exception as e:
+            logger.error(f"Error finding best matches: {e}")
+            return [[] for _ in range(len(np.atleast_2d(query_matrix)))]
+    
     def find_best_match(self, query_embedding: np.ndarray, stored_embeddings: List[Tuple[str, np.ndarray, Dict]]) -> Optional[Tuple[str, float, Dict]]:
         """Find the best matching face from stored embeddings"""
         try:
             if not stored_embeddings or query_embedding is None:
                 return None
             
-            best_match = None
-            best_similarity = 0.0
-            best_traits = {}
-            
-            for connection_id, stored_embedding, traits in stored_embeddings:
-                similarity = self.compare_embeddings(query_embedding, stored_embedding)
-                
-                if similarity > best_similarity:
-                    best_similarity = similarity
-                    best_match = connection_id
-                    best_traits = traits
+            connection_ids, embeddings, traits = zip(*stored_embeddings)
+            matches = self.find_best_matches(
+                l2_normalize(query_embedding),
+                l2_normalize(np.stack(embeddings)),
+                list(connection_ids),
+                list(traits),
+                k=1,
+                threshold=0.6  # Adjustable threshold
+            )
             
-            # Only return matches above threshold
-            if best_similarity > 0.6:  # Adjustable threshold
-                return (best_match, best_similarity, best_traits)
-            
-            return None
+            return matches[0][0] if matches[0] else None
             
         except Exception as e:
             logger.error(f"Error finding best match: {e}")
-            return None
\ No newline at end of file
+            return None
@@ -0,0 +1,51 @@
+"""
+Multi-photo face templates for connections
+
+A connection keeps up to MAX_EXEMPLARS embeddings ("exemplars"), each with
+a 0-1 quality score, in its `face_templates` column, and their
+quality-weighted centroid in `face_embedding`. Scans search centroids first
+and then only the exemplars of the closest candidates, so extra photos
+improve recognition without growing the cost of a scan. Rows from before
+templates existed are read as a single exemplar.
+"""
+import time
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+MAX_EXEMPLARS = 5
+LEGACY_QUALITY = 0.5  # Assumed quality of a row's single pre-template embedding
+MIN_WEIGHT = 0.05     # So zero-quality exemplars still count a little
+
+def row_templates(row: Dict) -> List[Dict]:
+    """A connections row's templates, treating a lone face_embedding as one exemplar"""
+    templates = [t for t in row.get("face_templates") or [] if t.get("embedding")]
+    if not templates and row.get("face_embedding"):
+        templates = [{"embedding": row["face_embedding"], "quality": LEGACY_QUALITY}]
+    return templates
+
+def template_centroid(templates: Sequence[Dict]) -> Optional[List[float]]:
+    """Quality-weighted mean exemplar, rescaled to the exemplars' mean norm.
+
+    Keeping the exemplars' scale means Euclidean match thresholds apply to
+    centroids unchanged.
+    """
+    if not templates:
+        return None
+    embeddings = np.asarray([t["embedding"] for t in templates], dtype=np.float32)
+    weights = np.maximum(np.asarray([t.get("quality", LEGACY_QUALITY) for t in templates], dtype=np.float32), MIN_WEIGHT)
+    mean = weights @ embeddings / weights.sum()
+    norm = np.linalg.norm(mean)
+    if norm > 0:
+        mean *= np.linalg.norm(embeddings, axis=1).mean() / norm
+    return mean.tolist()
+
+def add_template(templates: Sequence[Dict], embedding: Sequence[float], quality: float,
+                 max_exemplars: int = MAX_EXEMPLARS) -> List[Dict]:
+    """A new template list with the embedding added, keeping the `max_exemplars` best by quality"""
+    template = {"embedding": [float(v) for v in embedding], "quality": round(float(quality), 4), "added_at": time.time()}
+    combined = list(templates) + [template]
+    if len(combined) > max_exemplars:
+        # Drop the lowest quality; among equals, the oldest
+        combined.sort(key=lambda t: (t.get("quality", LEGACY_QUALITY), t.get("added_at", 0)), reverse=True)
+        combined = combined[:max_exemplars]
+    return combined
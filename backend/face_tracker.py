@@ -0,0 +1,165 @@
+"""
+Temporal face tracking for streaming scans
+
+Faces are detected every few frames and followed in between with
+Lucas-Kanade optical flow, so identities and emotions only need to be
+recomputed when a new track appears or a track's certainty decays.
+"""
+import cv2
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+def bbox_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between (A, 4) and (B, 4) arrays of [left, top, right, bottom] boxes"""
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    left = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    top = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    right = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    bottom = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-6), 0.0)
+
+class FaceTrack:
+    """A face followed across frames, with its last identification result"""
+
+    def __init__(self, track_id: int, bbox: np.ndarray):
+        self.track_id = track_id
+        self.bbox = np.asarray(bbox, dtype=np.float32)
+        self.points: Optional[np.ndarray] = None
+        self.missed_detections = 0
+        self.certainty = 0.0  # Trust in the current identity; decays every frame
+        self.result: Optional[Dict] = None
+        self.emotion = "neutral"
+        self.frames_since_emotion = 0
+
+    @property
+    def location(self) -> Tuple[int, int, int, int]:
+        """Bounding box as a face_recognition (top, right, bottom, left) tuple"""
+        left, top, right, bottom = self.bbox.round().astype(int)
+        return (int(top), int(right), int(bottom), int(left))
+
+    def to_dict(self) -> Dict:
+        face = dict(self.result or {})
+        face["track_id"] = self.track_id
+        face["bbox"] = [int(v) for v in self.bbox.round()]
+        face["emotion"] = self.emotion
+        return face
+
+class FaceTracker:
+    """IoU + optical-flow tracker that decides when faces need re-identification"""
+
+    def __init__(self, detect_interval: int = 5, iou_threshold: float = 0.3, max_missed: int = 2,
+                 certainty_decay: float = 0.97, reidentify_below: float = 0.5, emotion_interval: int = 15):
+        self.detect_interval = detect_interval
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.certainty_decay = certainty_decay
+        self.reidentify_below = reidentify_below
+        self.emotion_interval = emotion_interval
+        self.tracks: List[FaceTrack] = []
+        self.frame_count = 0
+        self._frames_since_detection = 0
+        self._prev_gray: Optional[np.ndarray] = None
+        self._next_id = 1
+
+    def needs_detection(self) -> bool:
+        """Run the detector on a fixed cadence, or whenever flow has lost a track"""
+        return (self._prev_gray is None
+                or not self.tracks
+                or self._frames_since_detection >= self.detect_interval
+                or any(track.points is None for track in self.tracks))
+
+    def _seed_points(self, gray: np.ndarray, track: FaceTrack):
+        height, width = gray.shape[:2]
+        left, top, right, bottom = track.bbox.round().astype(int)
+        left, top = max(left, 0), max(top, 0)
+        right, bottom = min(right, width), min(bottom, height)
+        if right - left < 8 or bottom - top < 8:
+            track.points = None
+            return
+        mask = np.zeros_like(gray)
+        mask[top:bottom, left:right] = 255
+        track.points = cv2.goodFeaturesToTrack(gray, maxCorners=40, qualityLevel=0.01, minDistance=5, mask=mask)
+
+    def _start_frame(self):
+        self.frame_count += 1
+        for track in self.tracks:
+            track.certainty *= self.certainty_decay
+            track.frames_since_emotion += 1
+
+    def update_with_detections(self, gray: np.ndarray, boxes: List[List[float]]) -> List[int]:
+        """Associate fresh detections with tracks; returns ids of removed tracks"""
+        self._start_frame()
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        unmatched_tracks = set(range(len(self.tracks)))
+        unmatched_boxes = set(range(len(boxes)))
+
+        if self.tracks and len(boxes):
+            ious = bbox_iou(np.stack([track.bbox for track in self.tracks]), boxes)
+            # Greedy assignment, highest overlap first
+            for flat in np.argsort(-ious, axis=None):
+                t, b = np.unravel_index(flat, ious.shape)
+                if ious[t, b] < self.iou_threshold:
+                    break
+                if t in unmatched_tracks and b in unmatched_boxes:
+                    unmatched_tracks.discard(t)
+                    unmatched_boxes.discard(b)
+                    self.tracks[t].bbox = boxes[b]
+                    self.tracks[t].missed_detections = 0
+
+        for b in sorted(unmatched_boxes):
+            self.tracks.append(FaceTrack(self._next_id, boxes[b]))
+            self._next_id += 1
+
+        removed = []
+        for t in unmatched_tracks:
+            self.tracks[t].missed_detections += 1
+            if self.tracks[t].missed_detections > self.max_missed:
+                removed.append(self.tracks[t].track_id)
+        self.tracks = [track for track in self.tracks if track.track_id not in removed]
+
+        for track in self.tracks:
+            self._seed_points(gray, track)
+        self._prev_gray = gray
+        self._frames_since_detection = 0
+        return removed
+
+    def update_with_flow(self, gray: np.ndarray):
+        """Move every track by the median optical flow of its feature points"""
+        self._start_frame()
+        for track in self.tracks:
+            if track.points is None or len(track.points) == 0:
+                track.points = None
+                continue
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, track.points, None,
+                                                        winSize=(15, 15), maxLevel=2)
+            good = status.reshape(-1) == 1
+            if good.sum() < 3:
+                track.points = None
+                continue
+            shift = np.median((moved[good] - track.points[good]).reshape(-1, 2), axis=0)
+            track.bbox = track.bbox + np.array([shift[0], shift[1], shift[0], shift[1]], dtype=np.float32)
+            track.points = moved[good].reshape(-1, 1, 2)
+        self._prev_gray = gray
+        self._frames_since_detection += 1
+
+    def tracks_needing_identity(self) -> List[FaceTrack]:
+        return [track for track in self.tracks if track.certainty < self.reidentify_below]
+
+    def tracks_needing_emotion(self) -> List[FaceTrack]:
+        return [track for track in self.tracks if track.frames_since_emotion >= self.emotion_interval]
+
+    def set_identity(self, track: FaceTrack, result: Dict):
+        track.result = result
+        track.certainty = 1.0
+
+    def set_emotion(self, track: FaceTrack, emotion: str):
+        track.emotion = emotion
+        track.frames_since_emotion = 0
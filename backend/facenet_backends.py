@@ -0,0 +1,180 @@
+"""
+CPU inference backends for the FaceNet (InceptionResnetV1) embedder
+
+`torch` runs the float PyTorch model as before. `torch-int8` fuses every
+conv/batch-norm/ReLU block and applies dynamic int8 quantization to the
+linear layers. `onnx` exports the model once to an ONNX file with a dynamic
+batch axis and runs it with ONNX Runtime; `onnx-int8` quantizes that file to
+int8, statically (QLinearConv) when a calibration directory of face images is
+configured and dynamically otherwise. Exported files are cached on disk, so
+only the first process pays for the export.
+"""
+import os
+import copy
+import glob
+import tempfile
+from typing import Callable, List, Optional
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+import logging
+from face_matching import l2_normalize
+
+logger = logging.getLogger(__name__)
+
+FACENET_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+FACE_SIZE = 160
+DEFAULT_ONNX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "facenet")
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png", "*.webp")
+
+# Embedder: (F, 3, 160, 160) prewhitened face tensor -> (F, 512) L2-normalized float32 embeddings
+Embedder = Callable[[torch.Tensor], np.ndarray]
+
+def fuse_conv_blocks(model: torch.nn.Module) -> torch.nn.Module:
+    """Fold each BasicConv2d's batch norm (and ReLU) into its convolution, in place"""
+    for module in model.modules():
+        if all(hasattr(module, name) for name in ("conv", "bn", "relu")):
+            torch.ao.quantization.fuse_modules(module, [["conv", "bn", "relu"]], inplace=True)
+        elif all(hasattr(module, name) for name in ("conv", "bn")):
+            torch.ao.quantization.fuse_modules(module, [["conv", "bn"]], inplace=True)
+    return model
+
+class TorchEmbedder:
+    """Runs a (possibly quantized) PyTorch module"""
+
+    def __init__(self, model: torch.nn.Module, device: torch.device, name: str = "torch"):
+        self.model = model
+        self.device = device
+        self.name = name
+
+    def __call__(self, batch: torch.Tensor) -> np.ndarray:
+        with torch.no_grad():
+            embeddings = F.normalize(self.model(batch.to(self.device)), p=2, dim=1)
+        return embeddings.cpu().numpy()
+
+class OnnxEmbedder:
+    """Runs an exported FaceNet ONNX file with an ONNX Runtime CPU session"""
+
+    def __init__(self, model_path: str, threads: int = 0, name: str = "onnx"):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.name = name
+
+    def __call__(self, batch: torch.Tensor) -> np.ndarray:
+        faces = batch.detach().cpu().numpy().astype(np.float32, copy=False)
+        return l2_normalize(self.session.run(None, {self.input_name: faces})[0])
+
+def _atomic_path(path: str) -> str:
+    # Inference worker processes may build the same file concurrently; each
+    # writes a private temp file and the last rename wins
+    handle, temp_path = tempfile.mkstemp(suffix=".onnx", dir=os.path.dirname(path))
+    os.close(handle)
+    return temp_path
+
+def export_onnx(model: torch.nn.Module, path: str, opset: int = 17) -> str:
+    """Export the float model with a dynamic batch axis, unless `path` already exists"""
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = _atomic_path(path)
+    dummy = torch.zeros(1, 3, FACE_SIZE, FACE_SIZE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model.cpu().eval(), dummy, temp_path,
+            input_names=["faces"], output_names=["embeddings"],
+            dynamic_axes={"faces": {0: "batch"}, "embeddings": {0: "batch"}},
+            opset_version=opset
+        )
+    os.replace(temp_path, path)
+    logger.info(f"Exported FaceNet to {path}")
+    return path
+
+def load_calibration_faces(directory: str, limit: int = 256) -> np.ndarray:
+    """(N, 3, 160, 160) prewhitened face tensors from a directory of face images.
+
+    Images are expected to be face crops already (as MTCNN produces); they
+    are resized and normalized the way MTCNN's post-processing does.
+    """
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(directory, pattern)))[:limit]
+    faces = []
+    for path in paths:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        rgb = cv2.cvtColor(cv2.resize(image, (FACE_SIZE, FACE_SIZE)), cv2.COLOR_BGR2RGB)
+        faces.append((rgb.astype(np.float32).transpose(2, 0, 1) - 127.5) / 128.0)
+    return np.stack(faces) if faces else np.empty((0, 3, FACE_SIZE, FACE_SIZE), np.float32)
+
+def quantize_onnx(float_path: str, int8_path: str, calibration_faces: Optional[np.ndarray] = None) -> str:
+    """Write an int8 copy of the exported model, unless `int8_path` already exists"""
+    if os.path.exists(int8_path):
+        return int8_path
+    from onnxruntime import quantization
+    temp_path = _atomic_path(int8_path)
+    if calibration_faces is not None and len(calibration_faces):
+        class FaceReader(quantization.CalibrationDataReader):
+            def __init__(self):
+                self._faces = iter(calibration_faces)
+
+            def get_next(self):
+                face = next(self._faces, None)
+                return None if face is None else {"faces": face[None]}
+
+        quantization.quantize_static(
+            float_path, temp_path, FaceReader(),
+            quant_format=quantization.QuantFormat.QOperator, per_channel=True,
+            activation_type=quantization.QuantType.QUInt8, weight_type=quantization.QuantType.QInt8
+        )
+    else:
+        quantization.quantize_dynamic(float_path, temp_path, weight_type=quantization.QuantType.QInt8)
+    os.replace(temp_path, int8_path)
+    logger.info(f"Quantized FaceNet to {int8_path}")
+    return int8_path
+
+def onnx_paths(onnx_dir: str, calibrated: bool) -> List[str]:
+    """(float, int8) ONNX file paths for the vggface2 weights"""
+    base = os.path.join(onnx_dir, "inception_resnet_v1_vggface2")
+    return [f"{base}.onnx", f"{base}_int8{'_static' if calibrated else ''}.onnx"]
+
+def create_embedder(model: torch.nn.Module, device: torch.device, backend: Optional[str] = None,
+                    onnx_dir: Optional[str] = None, calibration_dir: Optional[str] = None,
+                    threads: int = 0) -> Embedder:
+    """Build the embedder for `backend` (default: FACENET_BACKEND, else `torch`).
+
+    Quantized and ONNX backends are CPU-only; on a GPU, or when building one
+    fails (e.g. onnxruntime is not installed), the float PyTorch model is used.
+    """
+    backend = (backend or os.getenv("FACENET_BACKEND", "torch")).strip().lower() or "torch"
+    if backend not in FACENET_BACKENDS:
+        logger.error(f"Unknown FaceNet backend {backend!r}; expected one of {', '.join(FACENET_BACKENDS)}")
+        backend = "torch"
+    if backend != "torch" and device.type != "cpu":
+        logger.warning(f"FaceNet backend {backend!r} is CPU-only; using the float model on {device}")
+        backend = "torch"
+    if backend == "torch":
+        return TorchEmbedder(model, device)
+
+    try:
+        if backend == "torch-int8":
+            fused = fuse_conv_blocks(copy.deepcopy(model).cpu().eval())
+            quantized = torch.ao.quantization.quantize_dynamic(fused, {torch.nn.Linear}, dtype=torch.qint8)
+            return TorchEmbedder(quantized, device, name=backend)
+
+        onnx_dir = onnx_dir or os.getenv("FACENET_ONNX_DIR") or DEFAULT_ONNX_DIR
+        calibration_dir = calibration_dir if calibration_dir is not None else os.getenv("FACENET_CALIBRATION_DIR")
+        faces = load_calibration_faces(calibration_dir) if backend == "onnx-int8" and calibration_dir else None
+        float_path, int8_path = onnx_paths(onnx_dir, calibrated=faces is not None and len(faces) > 0)
+        path = export_onnx(copy.deepcopy(model).cpu(), float_path)
+        if backend == "onnx-int8":
+            path = quantize_onnx(float_path, int8_path, faces)
+        return OnnxEmbedder(path, threads, name=backend)
+
+    except Exception as e:
+        logger.error(f"Failed to build FaceNet backend {backend!r}, using the float model: {e}")
+        return TorchEmbedder(model, device)
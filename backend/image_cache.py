@@ -0,0 +1,272 @@
+"""
+Two-tier cache for training exercise images
+
+Decoded 256x256 RGB arrays are kept in an in-memory LRU, backed by an
+on-disk store of the original image bytes addressed by their SHA-256. Once
+an image has been fetched (or pre-seeded) /learn/* never needs the network
+for it again.
+
+Pre-seed the disk store with the sample faces, e.g. while building an image:
+    python image_cache.py --seed
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import urlparse
+import numpy as np
+import requests
+from PIL import Image
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "training_images")
+
+class TrainingImageCache:
+    """Memory LRU of decoded images over a size-bounded content-addressed disk store.
+
+    The disk store keeps `objects/<sha256[:2]>/<sha256>` files plus an
+    `index.json` mapping each source URL to its digest. When the store grows
+    past `max_disk_bytes` the least recently used objects are deleted. With
+    `offline=True` missing images are never downloaded.
+
+    The lock only guards the memory LRU and the disk store; downloads and
+    decoding run outside it, and concurrent requests for the same URL wait
+    on the first one's load instead of fetching it again.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_memory_items: int = 64,
+                 max_disk_bytes: int = 256 * 1024 * 1024, image_size: Tuple[int, int] = (256, 256),
+                 offline: bool = False, timeout: float = 10.0):
+        self.cache_dir = cache_dir
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.image_size = image_size
+        self.offline = offline
+        self.timeout = timeout
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._index: Optional[Dict[str, str]] = None
+        self._sizes: Dict[str, int] = {}
+        self._disk_bytes = 0
+        self._loading: Dict[str, Future] = {}
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.downloads = 0
+        self.failures = 0
+        self.memory_evictions = 0
+        self.disk_evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "TrainingImageCache":
+        return cls(
+            cache_dir=os.getenv("TRAINING_IMAGE_CACHE_DIR", DEFAULT_CACHE_DIR),
+            max_memory_items=int(os.getenv("TRAINING_IMAGE_CACHE_ITEMS", "64")),
+            max_disk_bytes=int(float(os.getenv("TRAINING_IMAGE_CACHE_MAX_MB", "256")) * 1024 * 1024),
+            offline=os.getenv("TRAINING_IMAGE_OFFLINE", "false").lower() in ("1", "true", "yes")
+        )
+
+    def _index_path(self) -> str:
+        return os.path.join(self.cache_dir, "index.json")
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, "objects", digest[:2], digest)
+
+    def _load_index(self) -> Dict[str, str]:
+        if self._index is None:
+            try:
+                with open(self._index_path()) as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+            # Sized once here; writes and evictions keep the running total
+            for digest in set(self._index.values()):
+                try:
+                    self._sizes[digest] = os.path.getsize(self._object_path(digest))
+                except OSError:
+                    continue
+            self._disk_bytes = sum(self._sizes.values())
+        return self._index
+
+    def _save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self._index_path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path())
+
+    def _read_disk(self, url: str) -> Optional[bytes]:
+        digest = self._load_index().get(url)
+        if digest is None:
+            return None
+        path = self._object_path(digest)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        # Reads refresh the object's place in the disk LRU
+        os.utime(path)
+        return data
+
+    def _write_disk(self, url: str, data: bytes):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        index = self._load_index()
+        if digest not in self._sizes:
+            self._sizes[digest] = len(data)
+            self._disk_bytes += len(data)
+        index[url] = digest
+        self._evict_disk()
+        self._save_index()
+
+    def _evict_disk(self):
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        objects = []
+        for digest in set(self._index.values()):
+            try:
+                objects.append((os.stat(self._object_path(digest)).st_mtime, digest))
+            except OSError:
+                continue
+        removed = set()
+        for _, digest in sorted(objects):
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            os.remove(self._object_path(digest))
+            removed.add(digest)
+            self._disk_bytes -= self._sizes.pop(digest, 0)
+            self.disk_evictions += 1
+        if removed:
+            self._index = {url: digest for url, digest in self._index.items() if digest not in removed}
+
+    def _fetch(self, url: str) -> Optional[bytes]:
+        """Download an http(s) URL or read a local path / file:// URL"""
+        parsed = urlparse(url)
+        if parsed.scheme in ("http", "https"):
+            if self.offline:
+                return None
+            response = requests.get(url, timeout=self.timeout)
+            return response.content if response.status_code == 200 else None
+        with open(parsed.path if parsed.scheme == "file" else url, "rb") as f:
+            return f.read()
+
+    def _decode(self, data: bytes) -> np.ndarray:
+        # Same resize and colour conversion the exercises have always used
+        image = Image.open(io.BytesIO(data))
+        image = image.resize(self.image_size, Image.Resampling.LANCZOS)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        array = np.asarray(image)
+        # Cached arrays are shared between exercises, so guard them against edits
+        array.flags.writeable = False
+        return array
+
+    def get(self, url: str) -> Optional[np.ndarray]:
+        """Return the decoded RGB image for a URL, or None if it cannot be loaded"""
+        with self._lock:
+            if url in self._memory:
+                self._memory.move_to_end(url)
+                self.memory_hits += 1
+                return self._memory[url]
+            loading = self._loading.get(url)
+            if loading is not None:
+                owner = False
+            else:
+                loading = self._loading[url] = Future()
+                owner = True
+        if not owner:
+            return loading.result()
+
+        image = None
+        try:
+            image = self._load(url)
+        finally:
+            with self._lock:
+                del self._loading[url]
+                if image is not None:
+                    self._memory[url] = image
+                    while len(self._memory) > self.max_memory_items:
+                        self._memory.popitem(last=False)
+                        self.memory_evictions += 1
+            loading.set_result(image)
+        return image
+
+    def _load(self, url: str) -> Optional[np.ndarray]:
+        """Read an image from the disk store or its source and decode it, holding the lock only for disk store access"""
+        try:
+            with self._lock:
+                data = self._read_disk(url)
+                if data is not None:
+                    self.disk_hits += 1
+            if data is None:
+                data = self._fetch(url)
+                if data is None:
+                    with self._lock:
+                        self.failures += 1
+                    return None
+                with self._lock:
+                    self.downloads += 1
+                    self._write_disk(url, data)
+            return self._decode(data)
+        except Exception as e:
+            logger.error(f"Error loading training image {url}: {e}")
+            with self._lock:
+                self.failures += 1
+            return None
+
+    def seed(self, urls: Iterable[str]) -> Dict[str, bool]:
+        """Make sure every URL is in the disk store; returns which ones succeeded"""
+        return {url: self.get(url) is not None for url in urls}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            index = self._load_index()
+            lookups = self.memory_hits + self.disk_hits + self.downloads + self.failures
+            return {
+                "memory_items": len(self._memory),
+                "disk_items": len(index),
+                "disk_bytes": self._disk_bytes,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "downloads": self.downloads,
+                "failures": self.failures,
+                "memory_evictions": self.memory_evictions,
+                "disk_evictions": self.disk_evictions,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+            }
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Pre-seed the training image cache")
+    parser.add_argument("--seed", action="store_true", help="download the sample faces (and any given URLs)")
+    parser.add_argument("--dir", default=os.getenv("TRAINING_IMAGE_CACHE_DIR", DEFAULT_CACHE_DIR), help="cache directory")
+    parser.add_argument("urls", nargs="*", help="extra image URLs or local paths to add")
+    args = parser.parse_args()
+
+    urls = list(args.urls)
+    if args.seed:
+        from training_ai import SAMPLE_FACES
+        urls = [face["image_url"] for face in SAMPLE_FACES] + urls
+
+    cache = TrainingImageCache.from_env()
+    cache.cache_dir = args.dir
+    cache.offline = False
+    results = cache.seed(urls)
+    for url, ok in results.items():
+        print(f"{'ok  ' if ok else 'FAIL'} {url}")
+    print(f"{sum(results.values())}/{len(results)} images cached in {args.dir}")
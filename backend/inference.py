@@ -0,0 +1,341 @@
+"""
+CPU-bound face inference for Memora
+
+These functions run either inline or inside InferencePool worker processes,
+so each process lazily builds and owns its own model instances through the
+model registry.
+"""
+import cv2
+import numpy as np
+import os
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+import logging
+from ai_models import EmotionDetector, FacialLandmarkAnalyzer
+from face_analysis import FaceAnalysisPipeline, FaceAnalysisResult, face_crop_box, face_quality
+from landmarks import FaceLandmarks, batch_traits, stack_landmarks
+from model_registry import registry, resident_memory_mb
+
+logger = logging.getLogger(__name__)
+
+# cv2.imdecode flags that decode JPEGs directly at 1/2, 1/4 or 1/8 resolution
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+def _load_face_api():
+    # Importing face_recognition loads dlib's detector, landmark and encoder models
+    import face_recognition
+    face_recognition.face_locations(np.zeros((64, 64, 3), dtype=np.uint8))
+    return face_recognition
+
+def _load_face_mesh():
+    import mediapipe as mp
+    face_mesh = mp.solutions.face_mesh.FaceMesh(static_image_mode=True, max_num_faces=10)
+    face_mesh.process(np.zeros((64, 64, 3), dtype=np.uint8))
+    return face_mesh
+
+def _load_emotion_model() -> Optional[EmotionDetector]:
+    # No emotion model ships with the app; point EMOTION_MODEL_PATH at a
+    # Keras, TFLite or ONNX model to enable one
+    model_path = os.getenv("EMOTION_MODEL_PATH")
+    if not model_path:
+        return None
+    detector = EmotionDetector(model_path, os.getenv("EMOTION_BACKEND") or None)
+    if detector.model is None:
+        logger.warning("Emotion detection model not found")
+        return None
+    # Build the graph (and the interpreter's tensors) before the first request
+    detector.detect_batch([np.zeros((48, 48, 3), dtype=np.uint8)])
+    return detector
+
+registry.register("face_recognition", _load_face_api)
+registry.register("face_mesh", _load_face_mesh)
+registry.register("landmark_analyzer", FacialLandmarkAnalyzer)
+registry.register("emotion_model", _load_emotion_model)
+
+INFERENCE_MODELS = ["face_recognition", "face_mesh", "landmark_analyzer", "emotion_model"]
+
+def get_face_api():
+    """Return the face_recognition module (dlib detection and 128-d encodings)"""
+    return registry.get("face_recognition")
+
+def get_face_mesh():
+    """Return this process's MediaPipe FaceMesh graph"""
+    return registry.get("face_mesh")
+
+def get_landmark_analyzer() -> FacialLandmarkAnalyzer:
+    """Return this process's landmark proportion analyzer"""
+    return registry.get("landmark_analyzer")
+
+def get_emotion_model() -> Optional[EmotionDetector]:
+    """Return this process's emotion detector, or None if no model is configured"""
+    return registry.get("emotion_model")
+
+def load_models():
+    """Warm up the inference models named in MODEL_WARMUP so the first real request pays no start-up cost"""
+    # training_ai, facenet and anthropic belong to the API process, which warms them at startup
+    registry.warm_up(os.getenv("MODEL_WARMUP", "all"), only=INFERENCE_MODELS)
+
+def worker_status() -> Dict:
+    """Model load times and memory of the process this runs in"""
+    return {"pid": os.getpid(), "memory_mb": resident_memory_mb(), "models": registry.stats()}
+
+def analyze_face(image: np.ndarray, include_emotion: bool = False) -> FaceAnalysisResult:
+    """Detect the primary face in a BGR image once and derive every enrollment feature from it"""
+    pipeline = FaceAnalysisPipeline(image, get_face_api(), get_face_mesh(), get_landmark_analyzer(), detect_emotion)
+    return pipeline.analyze(include_emotion)
+
+def embed_enrollment_face(image_bytes: bytes) -> Optional[FaceAnalysisResult]:
+    """Detect the primary face in JPEG/PNG bytes and compute only its embedding.
+
+    This is the synchronous part of enrollment; enrich_enrollment_face fills
+    in the rest later. Returns None if the bytes do not decode.
+    """
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    pipeline = FaceAnalysisPipeline(image, get_face_api(), None, None)
+    return FaceAnalysisResult(
+        face_count=len(pipeline.face_locations()),
+        face_location=pipeline.face_location(),
+        crop_box=pipeline.crop_box(),
+        embedding=pipeline.embedding(),
+        quality=pipeline.quality(),
+        timings=pipeline.timings
+    )
+
+def enrich_enrollment_face(image_bytes: bytes, face_location: Optional[Tuple[int, int, int, int]]) -> Dict:
+    """Landmarks, proportions, caricature highlights and a JPEG crop of an enrolled face.
+
+    `face_location` comes from embed_enrollment_face, so detection is not
+    repeated; without one the mesh runs on the whole image.
+    """
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Invalid image data")
+    pipeline = FaceAnalysisPipeline(image, get_face_api(), get_face_mesh(), get_landmark_analyzer(),
+                                    face_locations=[face_location] if face_location else [])
+    landmarks = pipeline.landmarks()
+    result = FaceAnalysisResult(crop_box=pipeline.crop_box(), landmarks=landmarks)
+    return {
+        "landmark_data": result.landmark_data,
+        "facial_traits": pipeline.facial_traits(),
+        "caricature_highlights": pipeline.caricature_highlights(),
+        "face_jpeg": cv2.imencode(".jpg", result.crop(image))[1].tobytes()
+    }
+
+def embed_enrollment_batch(images: List[bytes], max_detection_side: int = 0, preview_side: int = 800) -> List[Optional[Dict]]:
+    """Detect and embed the primary face of every image in one worker call, for bulk enrollment.
+
+    Faces are detected on a copy downscaled to `max_detection_side` and
+    encoded at full resolution. Each result has the face count, the primary
+    face's embedding (None without a face) and quality score, and a JPEG
+    preview of at most `preview_side` pixels with the face location in its
+    coordinates, which is all the later enrichment job needs. Images that do
+    not decode give None.
+    """
+    results = []
+    for image_bytes in images:
+        image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            results.append(None)
+            continue
+        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        locations = locate_faces_rgb(rgb_image, max_detection_side)
+        location = max(locations, key=lambda loc: (loc[2] - loc[0]) * (loc[1] - loc[3])) if locations else None
+        embedding = get_face_api().face_encodings(rgb_image, [location])[0].tolist() if location else None
+
+        height, width = image.shape[:2]
+        scale = min(1.0, preview_side / max(height, width))
+        preview = image if scale == 1.0 else cv2.resize(
+            image, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+        results.append({
+            "face_count": len(locations),
+            "face_location": tuple(int(v * scale) for v in location) if location else None,
+            "embedding": embedding,
+            "quality": face_quality(image, location) if location else None,
+            "preview_jpeg": cv2.imencode(".jpg", preview, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+        })
+    return results
+
+def detect_emotion(face_image: np.ndarray, rgb: bool = False) -> str:
+    """Detect emotion from face image (BGR unless rgb=True)"""
+    return detect_emotion_batch([face_image], rgb)[0]
+
+def detect_emotion_batch(face_images: List[np.ndarray], rgb: bool = False) -> List[str]:
+    """Detect the emotion of every face crop with one model call"""
+    emotion_model = get_emotion_model()
+    if not emotion_model:
+        return [random.choice(["neutral", "happy", "focused", "thoughtful"]) for _ in face_images]
+    return emotion_model.detect_batch(face_images, rgb)
+
+def locate_faces_rgb(rgb_image: np.ndarray, max_detection_side: int = 0, upsample: int = 1) -> List[Tuple[int, int, int, int]]:
+    """Detect faces on a downscaled copy of an RGB image and map the boxes back to full resolution.
+
+    The detector runs on a copy whose longest side is at most
+    `max_detection_side` (0 detects at full resolution), upsampled
+    `upsample` times to find smaller faces.
+    """
+    height, width = rgb_image.shape[:2]
+    longest_side = max(height, width)
+    if not max_detection_side or longest_side <= max_detection_side:
+        return get_face_api().face_locations(rgb_image, number_of_times_to_upsample=upsample)
+
+    scale = max_detection_side / longest_side
+    small_image = cv2.resize(rgb_image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                             interpolation=cv2.INTER_AREA)
+    return [
+        (max(int(top / scale), 0), min(int(round(right / scale)), width),
+         min(int(round(bottom / scale)), height), max(int(left / scale), 0))
+        for top, right, bottom, left in get_face_api().face_locations(small_image, number_of_times_to_upsample=upsample)
+    ]
+
+def detect_faces(image: np.ndarray, max_detection_side: int = 0, upsample: int = 1) -> List[Tuple[int, int, int, int]]:
+    """Detect faces in a BGR image, returning face_recognition (top, right, bottom, left) tuples"""
+    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return locate_faces_rgb(rgb_image, max_detection_side, upsample)
+
+def encode_faces(image: np.ndarray, face_locations: List[Tuple[int, int, int, int]]) -> List[List[float]]:
+    """Encode already-located faces in a BGR image"""
+    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return [encoding.tolist() for encoding in get_face_api().face_encodings(rgb_image, face_locations)]
+
+def detect_emotions(image: np.ndarray, face_locations: List[Tuple[int, int, int, int]], rgb: bool = False) -> List[str]:
+    """Detect the emotion of each located face in a BGR (or RGB) image"""
+    height, width = image.shape[:2]
+    crops = [image[max(top, 0):min(bottom, height), max(left, 0):min(right, width)]
+             for top, right, bottom, left in face_locations]
+    emotions = iter(detect_emotion_batch([crop for crop in crops if crop.size], rgb))
+    # Empty crops (boxes outside the image) stay neutral
+    return [next(emotions) if crop.size else "neutral" for crop in crops]
+
+def _match_mesh(landmarks: FaceLandmarks, face_locations: List[Tuple[int, int, int, int]],
+                assigned: List[Optional[FaceLandmarks]]) -> Optional[int]:
+    """Index of the free face box containing the mesh centre, nearest centre first"""
+    center_x, center_y = landmarks.pixels().mean(axis=0)
+    best, best_distance = None, None
+    for i, (top, right, bottom, left) in enumerate(face_locations):
+        if assigned[i] is not None or not (left <= center_x <= right and top <= center_y <= bottom):
+            continue
+        distance = ((left + right) / 2 - center_x) ** 2 + ((top + bottom) / 2 - center_y) ** 2
+        if best_distance is None or distance < best_distance:
+            best, best_distance = i, distance
+    return best
+
+def landmarks_for_faces(rgb_image: np.ndarray, face_locations: List[Tuple[int, int, int, int]]) -> List[Optional[FaceLandmarks]]:
+    """Face-mesh landmarks for every located face, aligned with face_locations.
+
+    One mesh pass over the whole image is matched to the boxes by mesh
+    centre; faces it missed (small or beyond the graph's max_num_faces) get
+    a pass on their own crop. Faces without a mesh get None.
+    """
+    height, width = rgb_image.shape[:2]
+    landmarks: List[Optional[FaceLandmarks]] = [None] * len(face_locations)
+    if not face_locations:
+        return landmarks
+    face_mesh = get_face_mesh()
+
+    try:
+        results = face_mesh.process(rgb_image)
+        for face_landmarks in results.multi_face_landmarks or []:
+            mesh = FaceLandmarks.from_mediapipe(face_landmarks, width, height)
+            i = _match_mesh(mesh, face_locations, landmarks)
+            if i is not None:
+                landmarks[i] = mesh
+
+        for i, location in enumerate(face_locations):
+            if landmarks[i] is not None:
+                continue
+            box = face_crop_box(location, width, height)
+            top, right, bottom, left = box
+            results = face_mesh.process(np.ascontiguousarray(rgb_image[top:bottom, left:right]))
+            meshes = [FaceLandmarks.from_mediapipe(face_landmarks, width, height, box)
+                      for face_landmarks in results.multi_face_landmarks or []]
+            # A crop can hold a neighbour's face too; keep the one in this box
+            landmarks[i] = next((mesh for mesh in meshes if _match_mesh(mesh, [location], [None]) == 0), None)
+    except Exception as e:
+        logger.error(f"Error extracting landmarks: {e}")
+    return landmarks
+
+def analyze_traits(rgb_image: np.ndarray, face_locations: List[Tuple[int, int, int, int]]) -> List[Dict[str, float]]:
+    """Facial traits for every located face in one batched pass ({} where no mesh was found)"""
+    landmarks = landmarks_for_faces(rgb_image, face_locations)
+    height, width = rgb_image.shape[:2]
+    points, present = stack_landmarks(landmarks)
+    traits: List[Dict[str, float]] = [{} for _ in face_locations]
+    for i, face_traits in zip(present, batch_traits(points, width, height)):
+        traits[i] = face_traits
+    return traits
+
+def analyze_tracked_faces(image: np.ndarray, identify_locations: List[Tuple[int, int, int, int]],
+                          emotion_locations: List[Tuple[int, int, int, int]]) -> Tuple[List[List[float]], List[str]]:
+    """Encode the faces that need identification and read emotions for the given faces"""
+    encodings = encode_faces(image, identify_locations) if identify_locations else []
+    emotions = detect_emotions(image, emotion_locations) if emotion_locations else []
+    return encodings, emotions
+
+def decode_image_rgb(image_bytes: bytes, reduce_factor: int = 1) -> Optional[np.ndarray]:
+    """Decode JPEG/PNG bytes straight into an RGB array, optionally at 1/2, 1/4 or 1/8 resolution"""
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), REDUCED_DECODE_FLAGS[reduce_factor])
+    if image is None:
+        return None
+    # Swap channels in place so the decoded buffer is the only copy
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+
+ScanResult = Tuple[List[Tuple[int, int, int, int]], List[List[float]], List[str], List[Dict[str, float]], Dict[str, float]]
+
+def scan_faces_rgb(rgb_image: np.ndarray, show_emotion: bool = True, max_detection_side: int = 0,
+                   upsample: int = 1, show_traits: bool = False) -> ScanResult:
+    """Detect, encode and read the emotion (and optionally traits) of every face in an RGB image.
+
+    Returns (face_locations, face_encodings, emotions, traits, timings) with
+    one entry per face; locations are face_recognition (top, right, bottom,
+    left) tuples, traits are empty dicts unless show_traits is set, and
+    timings holds milliseconds spent in each stage. Detection may run on a
+    downscaled copy, but encoding always reads the full-resolution pixels
+    inside each face box.
+    """
+    timings = {}
+    start = time.perf_counter()
+    face_locations = locate_faces_rgb(rgb_image, max_detection_side, upsample)
+    timings["detect_ms"] = 1000 * (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    face_encodings = get_face_api().face_encodings(rgb_image, face_locations) if face_locations else []
+    timings["encode_ms"] = 1000 * (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    emotions = detect_emotions(rgb_image, face_locations, rgb=True) if show_emotion else ["neutral"] * len(face_locations)
+    timings["emotion_ms"] = 1000 * (time.perf_counter() - start)
+
+    traits = [{} for _ in face_locations]
+    if show_traits:
+        start = time.perf_counter()
+        traits = analyze_traits(rgb_image, face_locations)
+        timings["traits_ms"] = 1000 * (time.perf_counter() - start)
+    return face_locations, [encoding.tolist() for encoding in face_encodings], emotions, traits, timings
+
+def scan_image_bytes(image_bytes: bytes, show_emotion: bool = True, reduce_factor: int = 1, max_detection_side: int = 0,
+                     upsample: int = 1, show_traits: bool = False) -> Optional[ScanResult]:
+    """Decode and scan compressed image bytes; returns None if the bytes are not an image.
+
+    Decoding happens here, on the worker, so only the compressed bytes cross
+    the process boundary. Face locations are reported in full-resolution
+    coordinates even when decoding at reduced resolution.
+    """
+    start = time.perf_counter()
+    rgb_image = decode_image_rgb(image_bytes, reduce_factor)
+    if rgb_image is None:
+        return None
+    decode_ms = 1000 * (time.perf_counter() - start)
+
+    face_locations, face_encodings, emotions, traits, timings = scan_faces_rgb(rgb_image, show_emotion, max_detection_side,
+                                                                               upsample, show_traits)
+    if reduce_factor > 1:
+        face_locations = [tuple(v * reduce_factor for v in location) for location in face_locations]
+    return face_locations, face_encodings, emotions, traits, {"decode_ms": decode_ms, **timings}
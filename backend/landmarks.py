@@ -0,0 +1,227 @@
+"""
+Compact face-mesh landmarks for Memora
+
+A FaceLandmarks holds one face's MediaPipe points as a single (N, 3)
+float32 array normalized to the image it was detected in. Feature groups are
+index arrays into that array, and every proportion and trait is computed in
+one vectorized distance pass over an (F, N, 3) stack of faces, so a group
+photo costs about as much as a single face. `landmark_data` is stored as
+16-bit quantized points in base64 (about 4 KB per face instead of ~28 KB of
+JSON lists). Legacy `{"points": [...]}` landmark_data is still read.
+"""
+import base64
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Key landmark indices for different facial features
+FEATURE_INDICES = {
+    'left_eye': [33, 7, 163, 144, 145, 153, 154, 155, 133, 173, 157, 158, 159, 160, 161, 246],
+    'right_eye': [362, 382, 381, 380, 374, 373, 390, 249, 263, 466, 388, 387, 386, 385, 384, 398],
+    'nose': [1, 2, 5, 4, 6, 19, 20, 94, 125, 141, 235, 236, 237, 238, 239, 240, 241, 242],
+    'mouth': [61, 84, 17, 314, 405, 320, 307, 375, 321, 308, 324, 318],
+    'jaw': [172, 136, 150, 149, 176, 148, 152, 377, 400, 378, 379, 365, 397, 288, 361, 323],
+    'eyebrows': [70, 63, 105, 66, 107, 55, 65, 52, 53, 46, 296, 334, 293, 300, 276, 283, 282, 295, 285],
+    'face_oval': [10, 338, 297, 332, 284, 251, 389, 356, 454, 323, 361, 288, 397, 365, 379, 378, 400, 377, 152, 148, 176, 149, 150, 136, 172, 58, 132, 93, 234, 127, 162, 21, 54, 103, 67, 109]
+}
+FEATURE_INDEX_ARRAYS = {name: np.array(indices, dtype=np.intp) for name, indices in FEATURE_INDICES.items()}
+
+# Point pairs behind every measurement, as (feature, position) pairs into the
+# feature groups they have always been taken from
+_MEASUREMENTS = {
+    "left_eye_width": (("left_eye", 0), ("left_eye", 8)),
+    "right_eye_width": (("right_eye", 0), ("right_eye", 8)),
+    "eye_distance": (("left_eye", 0), ("right_eye", 0)),
+    "left_eye_height": (("left_eye", 1), ("left_eye", 5)),
+    "right_eye_height": (("right_eye", 1), ("right_eye", 5)),
+    "nose_length": (("nose", 0), ("nose", 6)),
+    "nose_width": (("nose", 12), ("nose", 15)),
+    "jaw_width": (("jaw", 0), ("jaw", -1)),
+    "face_length": (("nose", 0), ("jaw", 7)),
+    "mouth_width": (("mouth", 0), ("mouth", 6)),
+    "mouth_height": (("mouth", 3), ("mouth", 9)),
+    "left_brow": (("eyebrows", 0), ("eyebrows", 8)),  # Left half of the eyebrow points
+    "right_brow": (("eyebrows", 9), ("eyebrows", -1))
+}
+_MEASUREMENT_NAMES = list(_MEASUREMENTS)
+_PAIR_STARTS = np.array([FEATURE_INDICES[name][i] for (name, i), _ in _MEASUREMENTS.values()], dtype=np.intp)
+_PAIR_ENDS = np.array([FEATURE_INDICES[name][i] for _, (name, i) in _MEASUREMENTS.values()], dtype=np.intp)
+
+# Highest point index any measurement reads
+_MIN_POINTS = max(max(indices) for indices in FEATURE_INDICES.values())
+
+# Compact landmark_data: x and y are quantized over [-0.5, 1.5) and z over
+# [-1, 1) in 16-bit steps (~3e-5 of the image, well below a pixel)
+LANDMARK_FORMAT = "mesh-u16"
+_QUANT_LOW = np.array([-0.5, -0.5, -1.0], dtype=np.float32)
+_QUANT_RANGE = np.array([2.0, 2.0, 2.0], dtype=np.float32)
+_QUANT_LEVELS = 65535
+
+def stack_landmarks(landmarks: Sequence[Optional["FaceLandmarks"]]) -> Tuple[np.ndarray, List[int]]:
+    """(F, N, 3) points of the faces that have landmarks, and their positions in `landmarks`"""
+    present = [i for i, face in enumerate(landmarks) if face is not None and len(face) > _MIN_POINTS]
+    if not present:
+        return np.zeros((0, _MIN_POINTS + 1, 3), dtype=np.float32), []
+    count = min(len(landmarks[i]) for i in present)
+    return np.stack([landmarks[i].points[:count] for i in present]), present
+
+def batch_measurements(points: np.ndarray, width: int, height: int) -> Dict[str, np.ndarray]:
+    """(F,) pixel lengths, brow angles and face-oval extents for (F, N, 3) normalized points"""
+    pixels = points[..., :2] * np.array([width, height], dtype=np.float32)
+    deltas = pixels[:, _PAIR_ENDS] - pixels[:, _PAIR_STARTS]  # (F, M, 2)
+    lengths = np.hypot(deltas[..., 0], deltas[..., 1])
+    angles = np.arctan2(deltas[..., 1], deltas[..., 0])
+    measures = {name: lengths[:, i] for i, name in enumerate(_MEASUREMENT_NAMES)}
+    measures["left_brow_angle"] = angles[:, _MEASUREMENT_NAMES.index("left_brow")]
+    measures["right_brow_angle"] = angles[:, _MEASUREMENT_NAMES.index("right_brow")]
+
+    # Face length and width between the extreme points of the face oval
+    oval = pixels[:, FEATURE_INDEX_ARRAYS["face_oval"]]  # (F, K, 2)
+    def extreme(axis: int, pick) -> np.ndarray:
+        return np.take_along_axis(oval, pick(oval[..., axis], axis=1)[:, None, None], axis=1)[:, 0]
+    measures["oval_length"] = np.linalg.norm(extreme(1, np.argmax) - extreme(1, np.argmin), axis=-1)
+    measures["oval_width"] = np.linalg.norm(extreme(0, np.argmax) - extreme(0, np.argmin), axis=-1)
+    return measures
+
+def _per_face(values: Dict[str, np.ndarray], masks: Dict[str, np.ndarray], faces: int) -> List[Dict[str, float]]:
+    columns = {name: value.tolist() for name, value in values.items()}
+    valid = {name: mask.tolist() for name, mask in masks.items()}
+    return [{name: column[i] for name, column in columns.items() if name not in valid or valid[name][i]}
+            for i in range(faces)]
+
+def batch_proportions(points: np.ndarray, width: int, height: int) -> List[Dict[str, float]]:
+    """FacialLandmarkAnalyzer proportions for every face in (F, N, 3) normalized points"""
+    if points.shape[0] == 0 or points.shape[1] <= _MIN_POINTS:
+        return [{} for _ in range(points.shape[0])]
+    m = batch_measurements(points, width, height)
+    jaw_width = np.where(m["jaw_width"] > 0, m["jaw_width"], 1)
+    values = {
+        "eye_width": (m["left_eye_width"] + m["right_eye_width"]) / 2 / width,
+        "eye_spacing": m["eye_distance"] / width,
+        "nose_length": m["nose_length"] / height,
+        "nose_width": m["nose_width"] / width,
+        "jaw_width": m["jaw_width"] / width,
+        "face_ratio": m["face_length"] / jaw_width
+    }
+    return _per_face(values, {"face_ratio": m["jaw_width"] > 0}, points.shape[0])
+
+def batch_traits(points: np.ndarray, width: int, height: int) -> List[Dict[str, float]]:
+    """FaceRecognitionAI traits for every face in (F, N, 3) normalized points"""
+    if points.shape[0] == 0 or points.shape[1] <= _MIN_POINTS:
+        return [{} for _ in range(points.shape[0])]
+    m = batch_measurements(points, width, height)
+    eye_width = (m["left_eye_width"] + m["right_eye_width"]) / 2
+
+    def ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+        return numerator / np.where(denominator > 0, denominator, 1)
+
+    values = {
+        "eye_width": eye_width / width,
+        "eye_spacing": m["eye_distance"] / width,
+        "eye_aspect_ratio": ratio((m["left_eye_height"] + m["right_eye_height"]) / 2, eye_width),
+        "nose_length": m["nose_length"] / height,
+        "nose_width": m["nose_width"] / width,
+        "nose_aspect_ratio": ratio(m["nose_length"], m["nose_width"]),
+        "jaw_width": m["jaw_width"] / width,
+        "face_aspect_ratio": ratio(m["oval_length"], m["oval_width"]),
+        "eyebrow_angle": (m["left_brow_angle"] + m["right_brow_angle"]) / 2,
+        "mouth_width": m["mouth_width"] / width,
+        "mouth_aspect_ratio": ratio(m["mouth_height"], m["mouth_width"])
+    }
+    masks = {
+        "eye_aspect_ratio": eye_width > 0,
+        "nose_width": m["nose_width"] > 0,
+        "nose_aspect_ratio": m["nose_width"] > 0,
+        "face_aspect_ratio": m["oval_width"] > 0,
+        "mouth_aspect_ratio": (m["mouth_height"] > 0) & (m["mouth_width"] > 0)
+    }
+    return _per_face(values, masks, points.shape[0])
+
+class FaceLandmarks:
+    """One face's (N, 3) float32 mesh points, normalized to a width x height image"""
+
+    __slots__ = ("points", "width", "height")
+
+    def __init__(self, points: Any, width: int, height: int):
+        self.points = np.ascontiguousarray(points, dtype=np.float32).reshape(-1, 3)
+        self.width = int(width)
+        self.height = int(height)
+
+    @classmethod
+    def from_mediapipe(cls, face_landmarks: Any, width: int, height: int,
+                       box: Optional[Tuple[int, int, int, int]] = None) -> "FaceLandmarks":
+        """Build from a MediaPipe NormalizedLandmarkList.
+
+        With `box` (top, right, bottom, left) the mesh ran on that crop of a
+        width x height image, and points are mapped back to the whole image.
+        """
+        points = np.array([(point.x, point.y, point.z) for point in face_landmarks.landmark], dtype=np.float32)
+        if box is not None:
+            top, right, bottom, left = box
+            crop_width, crop_height = right - left, bottom - top
+            points[:, 0] = (left + points[:, 0] * crop_width) / width
+            points[:, 1] = (top + points[:, 1] * crop_height) / height
+            points[:, 2] *= crop_width / width
+        return cls(points, width, height)
+
+    @classmethod
+    def from_landmark_data(cls, data: Optional[Dict]) -> Optional["FaceLandmarks"]:
+        """Read stored landmark_data, compact or legacy; None if there are no points"""
+        if not data:
+            return None
+        try:
+            if data.get("format") == LANDMARK_FORMAT:
+                quantized = np.frombuffer(base64.b64decode(data["data"]), dtype="<u2").reshape(-1, 3)
+                points = _QUANT_LOW + quantized.astype(np.float32) * (_QUANT_RANGE / _QUANT_LEVELS)
+                return cls(points, data.get("width", 1), data.get("height", 1))
+            if data.get("points"):
+                points = np.array([point[:3] for point in data["points"]], dtype=np.float32)
+                if "width" in data and "height" in data:
+                    # Legacy analyzer output held pixel x, y
+                    points[:, :2] /= np.array([data["width"], data["height"]], dtype=np.float32)
+                    return cls(points, data["width"], data["height"])
+                return cls(points, 1, 1)
+        except Exception as e:
+            logger.error(f"Error reading landmark data: {e}")
+        return None
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def pixels(self, size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+        """(N, 2) x, y in pixels of an image of `size` (width, height), by default the source image"""
+        width, height = size or (self.width, self.height)
+        return self.points[:, :2] * np.array([width, height], dtype=np.float32)
+
+    def feature(self, name: str) -> np.ndarray:
+        """(k, 2) pixel points of one feature group"""
+        indices = FEATURE_INDEX_ARRAYS[name]
+        return self.pixels()[indices[indices < len(self.points)]]
+
+    def proportions(self) -> Dict[str, float]:
+        """Proportions used for caricature highlights and the enrollment `facial_traits`"""
+        return batch_proportions(self.points[None], self.width, self.height)[0]
+
+    def traits(self) -> Dict[str, float]:
+        """The fuller trait set used for trait descriptions"""
+        return batch_traits(self.points[None], self.width, self.height)[0]
+
+    def to_landmark_data(self) -> Dict:
+        """Compact JSON-safe form for the `landmark_data` column"""
+        quantized = np.round((self.points - _QUANT_LOW) / _QUANT_RANGE * _QUANT_LEVELS)
+        quantized = np.clip(quantized, 0, _QUANT_LEVELS).astype("<u2")
+        return {
+            "format": LANDMARK_FORMAT,
+            "count": len(self.points),
+            "width": self.width,
+            "height": self.height,
+            "data": base64.b64encode(quantized.tobytes()).decode("ascii")
+        }
+
+    def __getstate__(self):
+        return self.points, self.width, self.height
+
+    def __setstate__(self, state):
+        self.points, self.width, self.height = state
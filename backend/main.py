@@ -1,26 +1,37 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 import cv2
 import numpy as np
-import mediapipe as mp
-import face_recognition
-from sklearn.metrics.pairwise import cosine_similarity
 import base64
-import io
-from PIL import Image
 import json
 import os
 from typing import List, Dict, Optional, Tuple
 import logging
 from supabase import create_client, Client
-from anthropic import Anthropic
-import tensorflow as tf
-from tensorflow import keras
 import random
 import math
 import time
+import uuid
+import asyncio
+import zipfile
 from training_ai import TrainingAI, AdaptiveDifficultyManager
+from embedding_index import EmbeddingIndexCache, connection_metadata
+from model_pool import InferencePool, PoolSaturatedError
+from micro_batcher import MicroBatcher
+from model_registry import registry, resident_memory_mb
+from inference import load_models, worker_status, scan_image_bytes, detect_faces, analyze_tracked_faces, \
+    embed_enrollment_face, enrich_enrollment_face, embed_enrollment_batch, REDUCED_DECODE_FLAGS
+from face_tracker import FaceTracker
+from exercise_pool import ExercisePool
+from scan_cache import ScanResponseCache, perceptual_hash
+from enrollment_jobs import EnrollmentEnricher, EnrollmentJob, EnrollmentJobQueue, EnrollmentQueueFullError, \
+    InMemoryEnrollmentStore, SupabaseEnrollmentStore, local_trait_descriptions
+from bulk_enrollment import BulkEnrollment, UploadTooLargeError, iter_uploaded_images
+from face_templates import add_template, row_templates, template_centroid
+from template_refinement import TemplateRefiner
+from scan_logs import ScanLogBuffer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -47,24 +58,163 @@ supabase_key = os.getenv("SUPABASE_ANON_KEY")
 anthropic_key = os.getenv("ANTHROPIC_API_KEY")
 
 supabase: Client = create_client(supabase_url, supabase_key) if supabase_url and supabase_key else None
-anthropic_client = Anthropic(api_key=anthropic_key) if anthropic_key else None
 
-# Initialize AI training system
-training_ai = TrainingAI()
+def _create_anthropic_client():
+    from anthropic import Anthropic
+    return Anthropic(api_key=anthropic_key)
 
-# Initialize MediaPipe
-mp_face_mesh = mp.solutions.face_mesh
-mp_face_detection = mp.solutions.face_detection
-face_mesh = mp_face_mesh.FaceMesh(static_image_mode=True, max_num_faces=10)
-face_detection = mp_face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5)
+def _create_facenet():
+    from face_recognition_ai import FaceRecognitionAI
+    return FaceRecognitionAI()
 
-# Load emotion detection model (placeholder - you'd load a real model)
-try:
-    # emotion_model = keras.models.load_model('emotion_model.h5')
-    emotion_model = None  # Placeholder
-except:
-    emotion_model = None
-    logger.warning("Emotion detection model not found")
+# Models and clients are built on first use (or at startup, see MODEL_WARMUP)
+registry.register("training_ai", TrainingAI)
+registry.register("facenet", _create_facenet)
+if anthropic_key:
+    registry.register("anthropic", _create_anthropic_client)
+
+def get_training_ai() -> TrainingAI:
+    """Return the AI training system"""
+    return registry.get("training_ai")
+
+def get_facenet():
+    """Return the FaceNet embedder used by /faces/embedding"""
+    return registry.get("facenet")
+
+def get_anthropic_client():
+    """Return the Anthropic client, or None if no API key is configured"""
+    return registry.get("anthropic") if anthropic_key else None
+
+def load_user_connections(user_id: str) -> List[Dict]:
+    """Fetch a user's connections with stored face embeddings and templates"""
+    if not supabase:
+        return []
+    result = supabase.table("connections").select("id, name, description, notes, trait_descriptions, face_embedding, face_templates") \
+        .eq("user_id", user_id) \
+        .execute()
+    return result.data or []
+
+# Photos kept per connection; scans compare against the closest candidates' photos
+face_max_exemplars = int(os.getenv("FACE_MAX_EXEMPLARS", "5"))
+
+# Concurrent /faces/embedding requests share FaceNet forward passes; the
+# model is built on the batcher's thread by the first batch
+facenet_batcher = MicroBatcher(
+    lambda faces: get_facenet().embed_faces(faces),
+    max_batch_size=int(os.getenv("FACENET_BATCH_SIZE", "16")),
+    max_wait_ms=float(os.getenv("FACENET_BATCH_WAIT_MS", "5"))
+)
+
+# Resident per-user embedding index used by /scan/identify
+embedding_cache = EmbeddingIndexCache(
+    loader=load_user_connections,
+    max_users=int(os.getenv("EMBEDDING_CACHE_MAX_USERS", "1000")),
+    ttl_seconds=float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "300")),
+    matcher_kind=os.getenv("FACE_MATCHER", "exact"),
+    matcher_min_size=int(os.getenv("FACE_MATCHER_MIN_GALLERY", "5000")),
+    max_exemplars=face_max_exemplars,
+    candidates=int(os.getenv("FACE_MATCH_CANDIDATES", "5"))
+)
+
+# Worker processes for detection/embedding/landmark/emotion inference
+inference_workers = int(os.getenv("INFERENCE_WORKERS", "2"))
+inference_pool = InferencePool(
+    workers=inference_workers,
+    max_pending=max(1, inference_workers) * int(os.getenv("INFERENCE_QUEUE_DEPTH", "4")),
+    initializer=load_models,
+    reporter=worker_status
+)
+
+def generate_exercise(user_id: str, module_type: str, difficulty_level: int) -> Dict:
+    """Build one /learn/* exercise from the user's connections (or the sample faces)"""
+    # Get user's faces from connections table
+    faces = []
+    if supabase:
+        connections_result = supabase.table("connections").select("*").eq("user_id", user_id).execute()
+        faces = connections_result.data or []
+    
+    training_ai = get_training_ai()
+    # Always use sample faces for consistent training experience
+    if not faces:
+        faces = training_ai.face_generator.get_sample_faces()
+    
+    target_face = random.choice(faces)
+    generate = {
+        "caricature": training_ai.generate_caricature_exercise,
+        "spacing": training_ai.generate_spacing_exercise,
+        "trait_tagging": training_ai.generate_trait_identification_exercise,
+        "morph_matching": training_ai.generate_morph_matching_exercise
+    }[module_type]
+    return generate(target_face, difficulty_level, faces)
+
+# Ready-made exercises per (user, module, difficulty), refilled in the background
+exercise_pool = ExercisePool(
+    generate=generate_exercise,
+    capacity=int(os.getenv("EXERCISE_POOL_SIZE", "4")),
+    low_water=int(os.getenv("EXERCISE_POOL_LOW_WATER", "2")),
+    max_age_seconds=float(os.getenv("EXERCISE_POOL_MAX_AGE_SECONDS", "600")),
+    workers=int(os.getenv("EXERCISE_POOL_WORKERS", "2"))
+)
+
+# Scans detect on a copy whose longest side is at most this many pixels (0 = full resolution)
+scan_max_detection_side = int(os.getenv("SCAN_MAX_DETECTION_SIDE", "800"))
+scan_detection_upsample = int(os.getenv("SCAN_DETECTION_UPSAMPLE", "1"))
+
+# Recent /scan/identify responses per user, reused for near-identical frames
+scan_cache = ScanResponseCache(
+    ttl_seconds=float(os.getenv("SCAN_CACHE_TTL_SECONDS", "1.0")),
+    max_distance=int(os.getenv("SCAN_CACHE_MAX_DISTANCE", "4")),
+    entries_per_user=int(os.getenv("SCAN_CACHE_ENTRIES", "4")),
+    max_users=int(os.getenv("SCAN_CACHE_MAX_USERS", "1000"))
+)
+
+def insert_scan_logs(rows: List[Dict]):
+    supabase.table("face_recognition_logs").insert(rows).execute()
+
+# Scan history for face_recognition_logs, written in batches off the scan path
+scan_logs = ScanLogBuffer(
+    write=insert_scan_logs,
+    capacity=int(os.getenv("SCAN_LOG_BUFFER_SIZE", "10000")),
+    batch_size=int(os.getenv("SCAN_LOG_BATCH_SIZE", "500")),
+    flush_seconds=float(os.getenv("SCAN_LOG_FLUSH_SECONDS", "5")),
+    enabled=supabase is not None and os.getenv("SCAN_LOG_ENABLED", "true").lower() in ("1", "true", "yes")
+)
+
+# Opt-in drift of connection centroids towards confident scan matches
+template_refiner = TemplateRefiner(
+    gallery=embedding_cache,
+    store=SupabaseEnrollmentStore(supabase) if supabase else InMemoryEnrollmentStore(),
+    enabled=os.getenv("TEMPLATE_REFINEMENT", "false").lower() in ("1", "true", "yes"),
+    min_confidence=float(os.getenv("TEMPLATE_REFINEMENT_MIN_CONFIDENCE", "0.7")),
+    alpha=float(os.getenv("TEMPLATE_REFINEMENT_ALPHA", "0.05")),
+    interval_seconds=float(os.getenv("TEMPLATE_REFINEMENT_INTERVAL_SECONDS", "60")),
+    max_writes=int(os.getenv("TEMPLATE_REFINEMENT_MAX_WRITES", "200"))
+)
+
+@app.on_event("startup")
+async def start_inference_pool():
+    # Inference models are warmed inside the pool's workers by load_models;
+    # FaceNet (PyTorch) is only built at startup when MODEL_WARMUP names it
+    model_warmup = os.getenv("MODEL_WARMUP", "all")
+    registry.warm_up(model_warmup, only=["training_ai", "anthropic"])
+    registry.warm_up(model_warmup, only=["facenet"] if "facenet" in [name.strip() for name in model_warmup.split(",")] else [])
+    inference_pool.start()
+    enrollment_jobs.start()
+    template_refiner.start()
+    scan_logs.start()
+
+@app.on_event("shutdown")
+async def stop_inference_pool():
+    await enrollment_jobs.close()
+    await template_refiner.close()
+    await scan_logs.close()
+    inference_pool.shutdown()
+    exercise_pool.close()
+    facenet_batcher.close()
+
+@app.exception_handler(PoolSaturatedError)
+async def pool_saturated_handler(request, exc: PoolSaturatedError):
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": "1"})
 
 # Pydantic models
 class FaceData(BaseModel):
@@ -89,6 +239,10 @@ class ScanRequest(BaseModel):
     image_data: str  # base64 encoded
     show_caricature: bool = True
     show_emotion: bool = True
+    reduce_factor: int = 1  # Decode at 1/2, 1/4 or 1/8 resolution
+    max_detection_side: Optional[int] = None  # Defaults to SCAN_MAX_DETECTION_SIDE
+    detection_upsample: Optional[int] = None  # Defaults to SCAN_DETECTION_UPSAMPLE
+    show_traits: bool = False  # Per-face landmark proportions, computed for all faces in one pass
 
 class TrainingResponse(BaseModel):
     success: bool
@@ -98,89 +252,35 @@ class TrainingResponse(BaseModel):
 class ScanResponse(BaseModel):
     faces: List[Dict]
     processing_time: float
+    timings: Dict[str, float] = {}  # Milliseconds per stage
 
 # Utility functions
-def decode_base64_image(image_data: str) -> np.ndarray:
-    """Decode base64 image to OpenCV format"""
+def decode_base64_bytes(image_data: str) -> bytes:
+    """Decode a base64 (or data URL) image to its compressed bytes"""
     try:
         # Remove data URL prefix if present
         if ',' in image_data:
             image_data = image_data.split(',')[1]
         
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes))
-        return cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+        return base64.b64decode(image_data)
     except Exception as e:
         logger.error(f"Error decoding image: {e}")
         raise HTTPException(status_code=400, detail="Invalid image data")
 
+def decode_image_bytes(image_bytes: bytes) -> Optional[np.ndarray]:
+    """Decode raw JPEG/PNG bytes to OpenCV format"""
+    return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
 def encode_image_to_base64(image: np.ndarray) -> str:
     """Encode OpenCV image to base64"""
     _, buffer = cv2.imencode('.jpg', image)
     return base64.b64encode(buffer).decode('utf-8')
 
-def extract_face_embedding(image: np.ndarray) -> Optional[List[float]]:
-    """Extract face embedding using face_recognition library"""
-    try:
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        face_encodings = face_recognition.face_encodings(rgb_image)
-        if face_encodings:
-            return face_encodings[0].tolist()
-        return None
-    except Exception as e:
-        logger.error(f"Error extracting embedding: {e}")
-        return None
-
-def extract_facial_landmarks(image: np.ndarray) -> Optional[Dict]:
-    """Extract facial landmarks using MediaPipe"""
-    try:
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        results = face_mesh.process(rgb_image)
-        
-        if results.multi_face_landmarks:
-            landmarks = results.multi_face_landmarks[0]
-            points = []
-            for landmark in landmarks.landmark:
-                points.append([landmark.x, landmark.y, landmark.z])
-            return {"points": points}
-        return None
-    except Exception as e:
-        logger.error(f"Error extracting landmarks: {e}")
-        return None
-
-def calculate_caricature_highlights(landmarks: Dict) -> Dict[str, float]:
-    """Calculate caricature highlights based on facial landmarks"""
-    if not landmarks or "points" not in landmarks:
-        return {}
-    
-    points = np.array(landmarks["points"])
-    
-    # Calculate distinctive features (simplified)
-    highlights = {}
-    
-    # Eye size (distance between eye corners)
-    if len(points) > 130:
-        left_eye_width = np.linalg.norm(points[33] - points[133])
-        right_eye_width = np.linalg.norm(points[362] - points[263])
-        avg_eye_width = (left_eye_width + right_eye_width) / 2
-        highlights["eyes"] = min(avg_eye_width * 10, 1.0)  # Normalize
-    
-    # Jaw width
-    if len(points) > 150:
-        jaw_width = np.linalg.norm(points[172] - points[397])
-        highlights["jaw"] = min(jaw_width * 5, 1.0)  # Normalize
-    
-    # Nose length
-    if len(points) > 19:
-        nose_length = np.linalg.norm(points[19] - points[1])
-        highlights["nose"] = min(nose_length * 8, 1.0)  # Normalize
-    
-    return highlights
-
 def generate_traits_with_claude(image_data: str, landmarks: Dict) -> List[str]:
-    """Generate facial traits using Claude AI"""
+    """Generate facial traits using Claude AI; errors propagate so enrollment jobs can retry them"""
+    anthropic_client = get_anthropic_client()
     if not anthropic_client:
-        return ["distinctive eyes", "defined jawline", "prominent nose"]
+        return local_trait_descriptions(image_data, landmarks)
     
     try:
         prompt = f"""
@@ -211,28 +311,7 @@ def generate_traits_with_claude(image_data: str, landmarks: Dict) -> List[str]:
         
     except Exception as e:
         logger.error(f"Error generating traits with Claude: {e}")
-        return ["distinctive features", "memorable appearance"]
-
-def detect_emotion(face_image: np.ndarray) -> str:
-    """Detect emotion from face image"""
-    if not emotion_model:
-        return random.choice(["neutral", "happy", "focused", "thoughtful"])
-    
-    try:
-        # Preprocess face for emotion detection
-        face_resized = cv2.resize(face_image, (48, 48))
-        face_gray = cv2.cvtColor(face_resized, cv2.COLOR_BGR2GRAY)
-        face_normalized = face_gray / 255.0
-        face_reshaped = face_normalized.reshape(1, 48, 48, 1)
-        
-        # Predict emotion
-        predictions = emotion_model.predict(face_reshaped)
-        emotions = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
-        emotion_idx = np.argmax(predictions[0])
-        return emotions[emotion_idx]
-    except Exception as e:
-        logger.error(f"Error detecting emotion: {e}")
-        return "neutral"
+        raise
 
 def create_caricature_overlay(image: np.ndarray, highlights: Dict[str, float]) -> np.ndarray:
     """Create caricature overlay highlighting distinctive features"""
@@ -270,15 +349,137 @@ def generate_morphed_faces(face1: np.ndarray, face2: np.ndarray, alpha: float =
         face1_resized = cv2.resize(face1, (width, height))
         face2_resized = cv2.resize(face2, (width, height))
         
-        # Simple alpha blending (in production, use more sophisticated morphing)
-        morphed = cv2.addWeighted(face1_resized, alpha, face2_resized, 1-alpha, 0)
-        return morphed
+        # Landmark-aligned morph; alpha weights face1 here, the engine's alpha weights its second image
+        morphed = get_training_ai().morph_engine.morph(
+            cv2.cvtColor(face1_resized, cv2.COLOR_BGR2RGB), cv2.cvtColor(face2_resized, cv2.COLOR_BGR2RGB), 1 - alpha
+        )
+        return cv2.cvtColor(morphed, cv2.COLOR_RGB2BGR)
     except Exception as e:
         logger.error(f"Error generating morphed face: {e}")
         return face1
 
+# Minimum confidence for a scan match to count as an identification
+confidence_threshold = 0.6
+
+async def identify_encodings(user_id: str, face_encodings: List[List[float]]) -> List[Tuple[Optional[Dict], float]]:
+    """Match face encodings against the user's resident embedding index.
+    
+    Returns (connection_data, confidence) per encoding; connection_data is
+    None when the best match is below the confidence threshold.
+    """
+    if not face_encodings:
+        return []
+    
+    # Get user's resident embedding index (loaded from Supabase on first use,
+    # off the event loop)
+    index = await asyncio.to_thread(embedding_cache.get, user_id)
+    
+    matches = []
+    for encoding, (nearest_index, nearest_distance) in zip(face_encodings, index.nearest(np.array(face_encodings))):
+        if nearest_index is None:
+            matches.append((None, 0.0))
+            continue
+        
+        # Convert distance to confidence (lower distance = higher confidence)
+        confidence = max(float(1 - nearest_distance), 0.0)
+        if confidence >= confidence_threshold:
+            matches.append((index.metadata[nearest_index], confidence))
+            template_refiner.observe(user_id, index.ids[nearest_index], encoding, confidence)
+        else:
+            matches.append((None, confidence))
+    return matches
+
+def describe_face(bbox: List[int], connection_data: Optional[Dict], confidence: float, emotion: str) -> Dict:
+    """Build the per-face scan result for an identified or unknown face"""
+    if connection_data:
+        # Person identified
+        return {
+            "bbox": bbox,
+            "name": connection_data["name"],
+            "role": connection_data["role"],
+            "confidence": float(confidence),
+            "emotion": emotion,
+            "traits": connection_data["traits"],
+            "context": connection_data["context"]
+        }
+    
+    # Person not identified
+    return {
+        "bbox": bbox,
+        "name": "Unknown Person",
+        "role": "Not identified",
+        "confidence": float(confidence),
+        "emotion": emotion,
+        "traits": [],
+        "context": "No match found in your connections"
+    }
+
 # API Endpoints
 
+async def analyze_enrollment_face(image_bytes: bytes, face_location: Optional[Tuple[int, int, int, int]]) -> Dict:
+    return await inference_pool.run(enrich_enrollment_face, image_bytes, face_location)
+
+def finish_enrollment(job: EnrollmentJob):
+    """Refresh state that was built before an enrolled face's traits were known"""
+    if job.kind != "connection":
+        return
+    if job.metadata.get("embedding"):
+        embedding_cache.update_metadata(job.user_id, job.metadata["index_id"], connection_metadata({
+            "id": job.metadata["index_id"],
+            "name": job.metadata["name"],
+            "description": job.metadata["role"],
+            "notes": job.metadata["context"],
+            "trait_descriptions": job.result.get("trait_descriptions", [])
+        }))
+    exercise_pool.invalidate(job.user_id)
+    scan_cache.invalidate(job.user_id)
+
+# Background enrichment of enrolled faces (landmarks, highlights, Claude traits);
+# without Supabase the results stay in memory
+enrollment_jobs = EnrollmentJobQueue(
+    process=EnrollmentEnricher(
+        analyze=analyze_enrollment_face,
+        describe=generate_traits_with_claude,
+        store=SupabaseEnrollmentStore(supabase) if supabase else InMemoryEnrollmentStore(),
+        on_complete=finish_enrollment
+    ),
+    concurrency=int(os.getenv("ENROLLMENT_JOB_WORKERS", "2")),
+    max_attempts=int(os.getenv("ENROLLMENT_JOB_MAX_ATTEMPTS", "4")),
+    backoff_seconds=float(os.getenv("ENROLLMENT_JOB_BACKOFF_SECONDS", "1.0")),
+    retain_seconds=float(os.getenv("ENROLLMENT_JOB_RETAIN_SECONDS", "3600")),
+    max_queued=int(os.getenv("ENROLLMENT_JOB_MAX_QUEUED", "1000"))
+)
+
+async def embed_bulk_batch(images: List[bytes]) -> List[Optional[Dict]]:
+    # Bulk imports yield to interactive requests: a full inference queue is
+    # waited out with backoff instead of failing the batch
+    for attempt in range(5):
+        try:
+            return await inference_pool.run(embed_enrollment_batch, images, scan_max_detection_side)
+        except PoolSaturatedError:
+            if attempt == 4:
+                raise
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+def insert_connection_rows(rows: List[Dict]) -> List[Dict]:
+    """Insert connections rows in one request, returning them with their ids"""
+    if not supabase:
+        return [{**row, "id": f"mock_{uuid.uuid4().hex[:12]}"} for row in rows]
+    return supabase.table("connections").insert(rows).execute().data or []
+
+# Album imports for /connections/bulk
+bulk_enrollment = BulkEnrollment(
+    embed_batch=embed_bulk_batch,
+    insert_rows=insert_connection_rows,
+    batch_size=int(os.getenv("BULK_BATCH_SIZE", "16")),
+    max_in_flight=max(1, inference_workers),
+    insert_batch_size=int(os.getenv("BULK_INSERT_BATCH_SIZE", "50")),
+    dedupe_distance=float(os.getenv("BULK_DEDUPE_DISTANCE", "0.25")),
+    max_exemplars=face_max_exemplars
+)
+bulk_max_images = int(os.getenv("BULK_MAX_IMAGES", "500"))
+bulk_max_bytes = int(float(os.getenv("BULK_MAX_MB", "1024")) * 1024 * 1024)
+
 @app.get("/")
 async def root():
     return {
@@ -295,34 +496,33 @@ async def add_face(
     context: str = Form(""),
     file: UploadFile = File(...)
 ):
-    """Add a new face to the user's database"""
+    """Add a new face to the user's database.
+    
+    Only detection and the embedding run before responding; landmarks,
+    caricature highlights and trait descriptions are added to the row by a
+    background job (see /enrollment/jobs/{job_id}).
+    """
     try:
-        # Read and process image
+        # Refuse before inserting the row if its enrollment job could not be queued
+        enrollment_jobs.check_capacity()
         image_data = await file.read()
-        image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
-        
-        # Extract features
-        embedding = extract_face_embedding(image)
+        analysis = await inference_pool.run(embed_enrollment_face, image_data)
+        if analysis is None:
+            raise HTTPException(status_code=400, detail="Invalid image format")
+        embedding = analysis.embedding
         if not embedding:
             raise HTTPException(status_code=400, detail="No face detected in image")
         
-        landmarks = extract_facial_landmarks(image)
-        caricature_highlights = calculate_caricature_highlights(landmarks) if landmarks else {}
-        
-        # Generate traits using Claude
-        image_b64 = encode_image_to_base64(image)
-        traits = generate_traits_with_claude(image_b64, landmarks)
-        
         # Store in Supabase
         face_data = {
             "user_id": user_id,
             "name": name,
             "role": role if role else None,
             "context": context if context else None,
-            "traits": traits,
+            "traits": [],
             "embedding": embedding,
-            "landmark_data": landmarks,
-            "caricature_highlights": caricature_highlights,
+            "landmark_data": None,
+            "caricature_highlights": {},
             "training_progress": {
                 "spacing": {"level": 1, "accuracy": 0},
                 "matching": {"level": 1, "accuracy": 0},
@@ -332,10 +532,19 @@ async def add_face(
         
         if supabase:
             result = supabase.table("faces").insert(face_data).execute()
-            return {"success": True, "face_id": result.data[0]["id"]}
+            face_id = result.data[0]["id"]
         else:
-            return {"success": True, "face_id": "mock_id", "data": face_data}
+            face_id = f"mock_{uuid.uuid4().hex[:12]}"
+        
+        job = enrollment_jobs.submit("face", user_id, image_data, analysis.face_location, record_id=face_id,
+                                     metadata={"name": name})
+        response = {"success": True, "face_id": face_id, "job_id": job.job_id, "job_status": job.status}
+        if not supabase:
+            response["data"] = face_data
+        return response
             
+    except (HTTPException, PoolSaturatedError):
+        raise
     except Exception as e:
         logger.error(f"Error adding face: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -346,55 +555,68 @@ async def add_connection(
     name: str = Form(...),
     role: str = Form(""),
     context: str = Form(""),
+    connection_id: str = Form(""),
     file: UploadFile = File(...)
 ):
-    """Add a new connection with face analysis"""
+    """Add a new connection with face analysis.
+    
+    The response carries the face embedding; facial traits, trait
+    descriptions and landmark data follow from a background job, which
+    writes them to the connection row when `connection_id` is given and
+    otherwise keeps them on the job (see /enrollment/jobs/{job_id}).
+    """
     try:
-        # Read and process image
+        # Refuse before touching the index if the enrollment job could not be queued
+        enrollment_jobs.check_capacity()
         image_data = await file.read()
-        image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
-        
-        if image is None:
+        analysis = await inference_pool.run(embed_enrollment_face, image_data)
+        if analysis is None:
             raise HTTPException(status_code=400, detail="Invalid image format")
-        
-        # Extract face embedding
-        embedding = extract_face_embedding(image)
-        if not embedding:
-            # Still allow connection creation without face embedding
-            embedding = None
-        
-        # Extract facial landmarks
-        landmarks = extract_facial_landmarks(image)
-        caricature_highlights = calculate_caricature_highlights(landmarks) if landmarks else {}
-        
-        # Generate traits using Claude or fallback
-        image_b64 = encode_image_to_base64(image)
-        traits = generate_traits_with_claude(image_b64, landmarks)
-        
-        # Analyze facial traits from landmarks
-        facial_traits = {}
-        if landmarks:
-            try:
-                # Use the FaceRecognitionAI class if available
-                from face_recognition_ai import FacialLandmarkAnalyzer
-                analyzer = FacialLandmarkAnalyzer()
-                facial_traits = analyzer.analyze_facial_proportions(landmarks)
-            except:
-                # Fallback to basic analysis
-                facial_traits = {"basic_analysis": True}
+        # Still allow connection creation without face embedding
+        embedding = analysis.embedding
+        templates = add_template([], embedding, analysis.quality or 0.0, face_max_exemplars) if embedding else []
+        
+        # Keep the resident scan index in sync; rows without a known id get a
+        # provisional one until the index is next reloaded from Supabase
+        index_id = connection_id or f"pending:{uuid.uuid4()}"
+        if embedding:
+            embedding_cache.add_connection(user_id, index_id, embedding, connection_metadata({
+                "id": index_id,
+                "name": name,
+                "description": role,
+                "notes": context
+            }), exemplars=[embedding])
+        
+        # Queued exercises and cached scans were built from the old connection list
+        exercise_pool.invalidate(user_id)
+        scan_cache.invalidate(user_id)
+        
+        job = enrollment_jobs.submit("connection", user_id, image_data, analysis.face_location,
+                                     record_id=connection_id or None, metadata={
+                                         "name": name,
+                                         "role": role,
+                                         "context": context,
+                                         "index_id": index_id,
+                                         "embedding": embedding
+                                     })
         
         return {
             "success": True,
-            "message": "Connection processed successfully",
+            "message": "Connection processed; facial traits are being analyzed",
+            "job_id": job.job_id,
+            "job_status": job.status,
             "data": {
                 "face_embedding": embedding,
-                "facial_traits": facial_traits,
-                "trait_descriptions": traits,
-                "landmark_data": landmarks,
-                "caricature_highlights": caricature_highlights
+                "face_templates": templates,
+                "facial_traits": {},
+                "trait_descriptions": [],
+                "landmark_data": {},
+                "caricature_highlights": {}
             }
         }
         
+    except PoolSaturatedError:
+        raise
     except Exception as e:
         logger.error(f"Error processing connection: {e}")
         return {
@@ -402,6 +624,7 @@ async def add_connection(
             "error": str(e),
             "data": {
                 "face_embedding": None,
+                "face_templates": [],
                 "facial_traits": {},
                 "trait_descriptions": [],
                 "landmark_data": {},
@@ -409,24 +632,156 @@ async def add_connection(
             }
         }
 
+@app.post("/connections/bulk")
+async def add_connections_bulk(
+    user_id: str = Form(...),
+    role: str = Form(""),
+    context: str = Form(""),
+    enrich: bool = Form(True),
+    files: List[UploadFile] = File(...)
+):
+    """Import a photo album as connections, streaming progress as newline-delimited JSON.
+    
+    `files` are images and/or zip archives; each album folder becomes one
+    connection named after it, with up to FACE_MAX_EXEMPLARS of its photos
+    as face templates, and each loose photo its own connection. Faces within
+    BULK_DEDUPE_DISTANCE of an existing connection or an earlier photo are
+    skipped as duplicates. With `enrich`, every new connection gets an
+    enrollment job for its traits and landmarks while ENROLLMENT_JOB_MAX_QUEUED
+    allows; an import that starts with the queue full is refused with 429.
+    """
+    uploads = [(upload.filename or f"upload_{i}", await upload.read()) for i, upload in enumerate(files)]
+    try:
+        images = list(iter_uploaded_images(uploads, bulk_max_images, bulk_max_bytes))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid zip archive")
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if not images:
+        raise HTTPException(status_code=400, detail="No images found in upload")
+    if enrich:
+        enrollment_jobs.check_capacity()
+    
+    index = await asyncio.to_thread(embedding_cache.get, user_id)
+    
+    def on_inserted(rows: List[Dict], results: List[Dict]):
+        for row, result in zip(rows, results):
+            embedding_cache.add_connection(user_id, row["id"], row["face_embedding"], connection_metadata(row),
+                                           exemplars=[t["embedding"] for t in row_templates(row)])
+            if not enrich:
+                continue
+            try:
+                enrollment_jobs.submit("connection", user_id, result["preview_jpeg"], result["face_location"],
+                                       record_id=row["id"], metadata={
+                                           "name": row["name"],
+                                           "role": role,
+                                           "context": context,
+                                           "index_id": row["id"],
+                                           "embedding": row["face_embedding"]
+                                       })
+            except EnrollmentQueueFullError:
+                # The connection is already stored and matchable; only its traits are skipped
+                logger.warning(f"Enrollment queue full; connection {row['id']} imported without traits")
+    
+    async def events():
+        try:
+            async for event in bulk_enrollment.run(user_id, images, role, context,
+                                                   existing=(index.ids, index.embeddings), on_inserted=on_inserted):
+                yield json.dumps(event) + "\n"
+        finally:
+            # Queued exercises and cached scans were built from the old connection list
+            exercise_pool.invalidate(user_id)
+            scan_cache.invalidate(user_id)
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.post("/connections/{connection_id}/photos")
+async def add_connection_photo(
+    connection_id: str,
+    user_id: str = Form(...),
+    file: UploadFile = File(...)
+):
+    """Add another photo of a connection to its face templates.
+    
+    The connection keeps its FACE_MAX_EXEMPLARS best photos by quality, and
+    its face_embedding becomes their quality-weighted centroid.
+    """
+    image_data = await file.read()
+    analysis = await inference_pool.run(embed_enrollment_face, image_data)
+    if analysis is None:
+        raise HTTPException(status_code=400, detail="Invalid image format")
+    if not analysis.embedding:
+        raise HTTPException(status_code=400, detail="No face detected in image")
+    
+    try:
+        row = None
+        if supabase:
+            result = await asyncio.to_thread(
+                lambda: supabase.table("connections")
+                .select("id, user_id, name, description, notes, trait_descriptions, face_embedding, face_templates")
+                .eq("id", connection_id).execute())
+            row = (result.data or [None])[0]
+            if row is None or row["user_id"] != user_id:
+                raise HTTPException(status_code=404, detail="Connection not found")
+        
+        templates = add_template(row_templates(row) if row else [], analysis.embedding, analysis.quality or 0.0,
+                                 face_max_exemplars)
+        centroid = template_centroid(templates)
+        if supabase:
+            await asyncio.to_thread(
+                lambda: supabase.table("connections")
+                .update({"face_templates": templates, "face_embedding": centroid})
+                .eq("id", connection_id).execute())
+            embedding_cache.add_connection(user_id, connection_id, centroid, connection_metadata(row),
+                                           exemplars=[t["embedding"] for t in templates])
+        
+        # Cached scans were matched against the old templates
+        scan_cache.invalidate(user_id)
+        return {
+            "success": True,
+            "connection_id": connection_id,
+            "quality": analysis.quality,
+            "exemplars": len(templates),
+            "face_embedding": centroid,
+            "face_templates": templates
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error adding connection photo: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/faces/embedding")
+async def facenet_embedding(file: UploadFile = File(...)):
+    """FaceNet (512-d) embedding of the most prominent face in an image.
+    
+    Faces from concurrent requests are embedded together in one forward
+    pass (FACENET_BATCH_SIZE, FACENET_BATCH_WAIT_MS).
+    """
+    image = await asyncio.to_thread(decode_image_bytes, await file.read())
+    if image is None:
+        raise HTTPException(status_code=400, detail="Invalid image format")
+    facenet = await asyncio.to_thread(get_facenet)
+    embedding = await facenet.extract_face_embedding_batched(image, facenet_batcher)
+    if embedding is None:
+        raise HTTPException(status_code=400, detail="No face detected in image")
+    return {"embedding": embedding.tolist(), "dimensions": len(embedding), "backend": facenet.embedder.name}
+
+@app.get("/enrollment/jobs/{job_id}")
+async def get_enrollment_job(job_id: str):
+    """Status of a background enrollment job, with the results computed so far"""
+    job = enrollment_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired enrollment job")
+    return job.to_dict()
+
 @app.post("/learn/caricature")
 async def caricature_training(request: TrainingRequest):
     """Generate caricature training exercise"""
     try:
-        # Get user's faces from connections table (updated to use connections)
-        faces = []
-        if supabase:
-            connections_result = supabase.table("connections").select("*").eq("user_id", request.user_id).execute()
-            faces = connections_result.data or []
-        
-        # Always use sample faces for consistent training experience
-        if not faces:
-            faces = training_ai.face_generator.get_sample_faces()
-            
-        target_face = random.choice(faces)
-        exercise_data = training_ai.generate_caricature_exercise(
-            target_face, request.difficulty_level, faces
-        )
+        # Pop a pre-generated exercise (generated inline if none is ready)
+        exercise_data = await exercise_pool.get(request.user_id, "caricature", request.difficulty_level)
         
         if "error" in exercise_data:
             return TrainingResponse(
@@ -436,7 +791,7 @@ async def caricature_training(request: TrainingRequest):
             )
         
         # Calculate next difficulty
-        next_difficulty = training_ai.difficulty_manager.calculate_next_level(
+        next_difficulty = get_training_ai().difficulty_manager.calculate_next_level(
             request.difficulty_level, 0.8, 0  # Default values, will be updated on completion
         )
         
@@ -458,22 +813,8 @@ async def caricature_training(request: TrainingRequest):
 async def spacing_training(request: TrainingRequest):
     """Generate spacing awareness training exercise"""
     try:
-        # Get user's faces from connections table
-        faces = []
-        if supabase:
-            connections_result = supabase.table("connections").select("*").eq("user_id", request.user_id).execute()
-            faces = connections_result.data or []
-        
-        # Always use sample faces for consistent training experience
-        if not faces:
-            faces = training_ai.face_generator.get_sample_faces()
-            
-        target_face = random.choice(faces)
-        
-        # Generate spacing exercise using AI
-        exercise_data = training_ai.generate_spacing_exercise(
-            target_face, request.difficulty_level, faces
-        )
+        # Pop a pre-generated exercise (generated inline if none is ready)
+        exercise_data = await exercise_pool.get(request.user_id, "spacing", request.difficulty_level)
         
         if "error" in exercise_data:
             return TrainingResponse(
@@ -482,7 +823,7 @@ async def spacing_training(request: TrainingRequest):
                 next_difficulty=request.difficulty_level
             )
         
-        next_difficulty = training_ai.difficulty_manager.calculate_next_level(
+        next_difficulty = get_training_ai().difficulty_manager.calculate_next_level(
             request.difficulty_level, 0.8, 0
         )
         
@@ -499,22 +840,8 @@ async def spacing_training(request: TrainingRequest):
 async def trait_tagging_training(request: TrainingRequest):
     """Generate trait tagging training exercise"""
     try:
-        # Get user's faces from connections table
-        faces = []
-        if supabase:
-            connections_result = supabase.table("connections").select("*").eq("user_id", request.user_id).execute()
-            faces = connections_result.data or []
-        
-        # Always use sample faces for consistent training experience
-        if not faces:
-            faces = training_ai.face_generator.get_sample_faces()
-            
-        target_face = random.choice(faces)
-        
-        # Generate trait identification exercise using AI
-        exercise_data = training_ai.generate_trait_identification_exercise(
-            target_face, request.difficulty_level, faces
-        )
+        # Pop a pre-generated exercise (generated inline if none is ready)
+        exercise_data = await exercise_pool.get(request.user_id, "trait_tagging", request.difficulty_level)
         
         if "error" in exercise_data:
             return TrainingResponse(
@@ -523,7 +850,7 @@ async def trait_tagging_training(request: TrainingRequest):
                 next_difficulty=request.difficulty_level
             )
         
-        next_difficulty = training_ai.difficulty_manager.calculate_next_level(
+        next_difficulty = get_training_ai().difficulty_manager.calculate_next_level(
             request.difficulty_level, 0.8, 0
         )
         
@@ -540,22 +867,8 @@ async def trait_tagging_training(request: TrainingRequest):
 async def morph_matching_training(request: TrainingRequest):
     """Generate morph-based matching training exercise"""
     try:
-        # Get user's faces from connections table
-        faces = []
-        if supabase:
-            connections_result = supabase.table("connections").select("*").eq("user_id", request.user_id).execute()
-            faces = connections_result.data or []
-        
-        # Always use sample faces for consistent training experience
-        if not faces:
-            faces = training_ai.face_generator.get_sample_faces()
-            
-        target_face = random.choice(faces)
-        
-        # Generate morph matching exercise using AI
-        exercise_data = training_ai.generate_morph_matching_exercise(
-            target_face, request.difficulty_level, faces
-        )
+        # Pop a pre-generated exercise (generated inline if none is ready)
+        exercise_data = await exercise_pool.get(request.user_id, "morph_matching", request.difficulty_level)
         
         if "error" in exercise_data:
             return TrainingResponse(
@@ -564,7 +877,7 @@ async def morph_matching_training(request: TrainingRequest):
                 next_difficulty=request.difficulty_level
             )
         
-        next_difficulty = training_ai.difficulty_manager.calculate_next_level(
+        next_difficulty = get_training_ai().difficulty_manager.calculate_next_level(
             request.difficulty_level, 0.8, 0
         )
         
@@ -617,7 +930,7 @@ async def update_training_progress(
         
         # Calculate next difficulty level based on the new completed lessons count
         # The difficulty manager uses completed_lessons to determine level progression
-        next_level = training_ai.difficulty_manager.calculate_next_level(
+        next_level = get_training_ai().difficulty_manager.calculate_next_level(
             current_level, accuracy, new_completed_lessons
         )
         
@@ -653,130 +966,218 @@ async def update_training_progress(
         logger.error(f"Error updating progress: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def identify_image_bytes(user_id: str, image_bytes: bytes, show_emotion: bool, reduce_factor: int,
+                               max_detection_side: Optional[int], detection_upsample: Optional[int],
+                               start_time: float, show_traits: bool = False) -> ScanResponse:
+    """Detect, identify and describe every face in compressed image bytes"""
+    if reduce_factor not in REDUCED_DECODE_FLAGS:
+        raise HTTPException(status_code=400, detail="reduce_factor must be 1, 2, 4 or 8")
+    if max_detection_side is None:
+        max_detection_side = scan_max_detection_side
+    if detection_upsample is None:
+        detection_upsample = scan_detection_upsample
+    if max_detection_side < 0:
+        raise HTTPException(status_code=400, detail="max_detection_side must be 0 or positive")
+    if not 0 <= detection_upsample <= 3:
+        raise HTTPException(status_code=400, detail="detection_upsample must be between 0 and 3")
+    
+    # A frame that looks like one scanned moments ago (camera held still)
+    # gets the previous response without running detection
+    cache_start = time.time()
+    variant = (show_emotion, reduce_factor, max_detection_side, detection_upsample, show_traits)
+    frame_hash = await asyncio.to_thread(perceptual_hash, image_bytes) if scan_cache.enabled else None
+    generation = scan_cache.generation(user_id)
+    cached = scan_cache.get(user_id, frame_hash, variant)
+    cache_timings = {"cache_ms": 1000 * (time.time() - cache_start), "cache_hit": 0.0 if cached is None else 1.0}
+    if cached is not None:
+        response, age = cached
+        response = ScanResponse(faces=response.faces, processing_time=time.time() - start_time,
+                                timings={**cache_timings, "cache_age_ms": 1000 * age})
+    else:
+        response = await scan_and_match(user_id, image_bytes, show_emotion, reduce_factor, max_detection_side,
+                                        detection_upsample, start_time, show_traits)
+        scan_cache.put(user_id, frame_hash, variant, response, generation)
+        response.timings.update(cache_timings)
+    
+    scan_logs.record(user_id, response.faces, response.timings, response.processing_time)
+    return response
+
+async def scan_and_match(user_id: str, image_bytes: bytes, show_emotion: bool, reduce_factor: int,
+                         max_detection_side: int, detection_upsample: int, start_time: float,
+                         show_traits: bool) -> ScanResponse:
+    """Run detection, encoding and matching for one frame on an inference worker"""
+    # Decode, detect and encode faces (and read emotions) on an inference worker
+    inference_start = time.time()
+    scan = await inference_pool.run(scan_image_bytes, image_bytes, show_emotion, reduce_factor,
+                                    max_detection_side, detection_upsample, show_traits)
+    if scan is None:
+        raise HTTPException(status_code=400, detail="Invalid image data")
+    face_locations, face_encodings, emotions, face_traits, timings = scan
+    # Time spent waiting for a worker and moving data to and from it
+    timings["queue_ms"] = max(0.0, 1000 * (time.time() - inference_start) - sum(timings.values()))
+    
+    if not supabase:
+        # Mock response for development
+        if face_encodings:
+            mock_faces = [{
+                "bbox": [100, 100, 300, 300],
+                "name": "Mock Person",
+                "role": "Test Connection",
+                "confidence": 0.85,
+                "emotion": "neutral",
+                "traits": ["distinctive eyes", "strong jawline"],
+                "context": "This is a mock identification"
+            }]
+        else:
+            mock_faces = []
+        
+        return ScanResponse(
+            faces=mock_faces,
+            processing_time=time.time() - start_time,
+            timings=timings
+        )
+    
+    if not face_encodings:
+        return ScanResponse(faces=[], processing_time=time.time() - start_time, timings=timings)
+    
+    identified_faces = []
+    
+    # Match every detected face against the user's connections in one pass
+    match_start = time.time()
+    matches = await identify_encodings(user_id, face_encodings)
+    timings["match_ms"] = 1000 * (time.time() - match_start)
+    
+    # Process each detected face
+    for face_location, (connection_data, confidence), emotion, traits in zip(face_locations, matches, emotions, face_traits):
+        top, right, bottom, left = face_location
+        
+        # Convert face_location to bbox format [left, top, right, bottom]
+        bbox = [left, top, right, bottom]
+        face = describe_face(bbox, connection_data, confidence, emotion)
+        if show_traits:
+            face["facial_traits"] = traits
+        identified_faces.append(face)
+    
+    processing_time = time.time() - start_time
+    
+    return ScanResponse(
+        faces=identified_faces,
+        processing_time=processing_time,
+        timings=timings
+    )
+
 @app.post("/scan/identify")
 async def scan_and_identify(request: ScanRequest):
     """Scan image and identify faces in real-time"""
-    import time
     start_time = time.time()
     
     try:
-        # Decode image
-        image = decode_base64_image(request.image_data)
-        
-        # Detect faces in the image using face_recognition library
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_image)
-        face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
-        
-        if not supabase:
-            # Mock response for development
-            if face_encodings:
-                mock_faces = [{
-                    "bbox": [100, 100, 300, 300],
-                    "name": "Mock Person",
-                    "role": "Test Connection",
-                    "confidence": 0.85,
-                    "emotion": "neutral",
-                    "traits": ["distinctive eyes", "strong jawline"],
-                    "context": "This is a mock identification"
-                }]
-            else:
-                mock_faces = []
-            
-            return ScanResponse(
-                faces=mock_faces,
-                processing_time=time.time() - start_time
-            )
+        image_bytes = decode_base64_bytes(request.image_data)
+        return await identify_image_bytes(request.user_id, image_bytes, request.show_emotion, request.reduce_factor,
+                                          request.max_detection_side, request.detection_upsample, start_time,
+                                          request.show_traits)
         
-        if not face_encodings:
-            return ScanResponse(faces=[], processing_time=time.time() - start_time)
-        
-        # Get user's stored connections
-        connections_result = supabase.table("connections").select("*").eq("user_id", request.user_id).execute()
-        stored_connections = connections_result.data or []
-        
-        # Extract stored face encodings for comparison
-        stored_face_encodings = []
-        stored_face_data = []
-        
-        for connection in stored_connections:
-            if connection.get("face_embedding"):
-                stored_face_encodings.append(np.array(connection["face_embedding"]))
-                stored_face_data.append({
-                    "id": connection["id"],
-                    "name": connection["name"],
-                    "role": connection.get("description", "") or "Connection",
-                    "context": connection.get("notes", ""),
-                    "traits": connection.get("trait_descriptions", [])
-                })
+    except (HTTPException, PoolSaturatedError):
+        raise
+    except Exception as e:
+        logger.error(f"Error in scan and identify: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/scan/identify/bytes")
+async def scan_and_identify_bytes(request: Request, user_id: str, show_emotion: bool = True, reduce_factor: int = 1,
+                                  max_detection_side: Optional[int] = None, detection_upsample: Optional[int] = None,
+                                  show_traits: bool = False):
+    """Scan raw JPEG/PNG bytes, sent as a multipart `file` or an application/octet-stream body"""
+    start_time = time.time()
+    
+    try:
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=400, detail="Missing image file")
+            image_bytes = await upload.read()
+        else:
+            image_bytes = await request.body()
         
-        identified_faces = []
+        return await identify_image_bytes(user_id, image_bytes, show_emotion, reduce_factor,
+                                          max_detection_side, detection_upsample, start_time, show_traits)
         
-        # Process each detected face
-        for i, (face_location, face_encoding) in enumerate(zip(face_locations, face_encodings)):
-            top, right, bottom, left = face_location
-            
-            # Convert face_location to bbox format [left, top, right, bottom]
-            bbox = [left, top, right, bottom]
-            
-            # Find best match among stored connections
-            best_match_index = None
-            best_confidence = 0.0
-            
-            if stored_face_encodings:
-                # Compare with all stored faces
-                face_distances = face_recognition.face_distance(stored_face_encodings, face_encoding)
-                
-                # Convert distance to confidence (lower distance = higher confidence)
-                confidences = 1 - face_distances
-                best_match_index = np.argmax(confidences)
-                best_confidence = confidences[best_match_index]
+    except (HTTPException, PoolSaturatedError):
+        raise
+    except Exception as e:
+        logger.error(f"Error in scan and identify: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _prepare_stream_frame(frame_bytes: bytes) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    image = decode_image_bytes(frame_bytes)
+    if image is None:
+        return None, None
+    return image, cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+@app.websocket("/scan/stream")
+async def scan_stream(websocket: WebSocket, user_id: str, show_emotion: bool = True):
+    """Stream camera frames and receive per-track identity, emotion and bbox updates.
+    
+    Each binary message is one JPEG/PNG frame. Faces are detected every few
+    frames and followed with optical flow in between; embeddings and matches
+    are only recomputed for new tracks or tracks whose certainty has decayed.
+    """
+    await websocket.accept()
+    tracker = FaceTracker(
+        detect_interval=int(os.getenv("STREAM_DETECT_INTERVAL", "5")),
+        certainty_decay=float(os.getenv("STREAM_CERTAINTY_DECAY", "0.97"))
+    )
+    
+    try:
+        while True:
+            frame_bytes = await websocket.receive_bytes()
+            start_time = time.time()
             
-            # Determine if match is above threshold
-            confidence_threshold = 0.6
+            image, gray = await asyncio.to_thread(_prepare_stream_frame, frame_bytes)
+            if image is None:
+                await websocket.send_json({"error": "Invalid image data"})
+                continue
             
-            if best_confidence >= confidence_threshold and best_match_index is not None:
-                # Person identified
-                connection_data = stored_face_data[best_match_index]
-                
-                # Get emotion if requested
-                emotion = detect_emotion(image[top:bottom, left:right]) if request.show_emotion else "neutral"
+            try:
+                removed = []
+                detected = tracker.needs_detection()
+                if detected:
+                    face_locations = await inference_pool.run(detect_faces, image, scan_max_detection_side, scan_detection_upsample)
+                    removed = tracker.update_with_detections(gray, [[left, top, right, bottom] for top, right, bottom, left in face_locations])
+                else:
+                    await asyncio.to_thread(tracker.update_with_flow, gray)
                 
-                face_data = {
-                    "bbox": bbox,
-                    "name": connection_data["name"],
-                    "role": connection_data["role"],
-                    "confidence": float(best_confidence),
-                    "emotion": emotion,
-                    "traits": connection_data["traits"],
-                    "context": connection_data["context"]
-                }
-            else:
-                # Person not identified
-                emotion = detect_emotion(image[top:bottom, left:right]) if request.show_emotion else "neutral"
+                identify_tracks = tracker.tracks_needing_identity()
+                emotion_tracks = list({track.track_id: track for track in identify_tracks + tracker.tracks_needing_emotion()}.values()) if show_emotion else []
+                if identify_tracks or emotion_tracks:
+                    encodings, emotions = await inference_pool.run(
+                        analyze_tracked_faces, image,
+                        [track.location for track in identify_tracks],
+                        [track.location for track in emotion_tracks]
+                    )
+                    for track, emotion in zip(emotion_tracks, emotions):
+                        tracker.set_emotion(track, emotion)
+                    for track, (connection_data, confidence) in zip(identify_tracks, await identify_encodings(user_id, encodings)):
+                        tracker.set_identity(track, describe_face([], connection_data, confidence, track.emotion))
                 
-                face_data = {
-                    "bbox": bbox,
-                    "name": "Unknown Person",
-                    "role": "Not identified",
-                    "confidence": float(best_confidence) if best_confidence > 0 else 0.0,
-                    "emotion": emotion,
-                    "traits": [],
-                    "context": "No match found in your connections"
-                }
+                await websocket.send_json({
+                    "frame": tracker.frame_count,
+                    "detected": detected,
+                    "reidentified": [track.track_id for track in identify_tracks],
+                    "removed_tracks": removed,
+                    "faces": [track.to_dict() for track in tracker.tracks],
+                    "processing_time": time.time() - start_time
+                })
+            except PoolSaturatedError:
+                # Drop this frame; the client keeps streaming
+                await websocket.send_json({"frame": tracker.frame_count, "dropped": True})
             
-            identified_faces.append(face_data)
-        
-        processing_time = time.time() - start_time
-        
-        return ScanResponse(
-            faces=identified_faces,
-            processing_time=processing_time
-        )
-        
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
-        logger.error(f"Error in scan and identify: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error(f"Error in scan stream: {e}")
+        await websocket.close(code=1011)
 
 @app.get("/connections/{user_id}")
 async def get_user_connections(user_id: str):
@@ -796,10 +1197,18 @@ async def get_user_connections(user_id: str):
 async def delete_connection(connection_id: str):
     """Delete a connection from the database"""
     try:
+        embedding_cache.remove_connection(connection_id)
+        
         if not supabase:
             return {"success": True, "message": "Connection deleted (mock)"}
         
-        supabase.table("connections").delete().eq("id", connection_id).execute()
+        result = supabase.table("connections").delete().eq("id", connection_id).execute()
+        # The resident index may hold the connection under a provisional
+        # pending: id, and queued exercises and cached scans may still show it
+        for row in result.data or []:
+            embedding_cache.invalidate(row["user_id"])
+            exercise_pool.invalidate(row["user_id"])
+            scan_cache.invalidate(row["user_id"])
         return {"success": True, "message": "Connection deleted successfully"}
         
     except Exception as e:
@@ -813,11 +1222,22 @@ async def health_check():
         "status": "healthy",
         "services": {
             "supabase": "connected" if supabase else "not configured",
-            "anthropic": "connected" if anthropic_client else "not configured",
+            "anthropic": "connected" if anthropic_key else "not configured",
             "facenet": "available",
             "mediapipe": "available",
             "pytorch": "available"
-        }
+        },
+        "models": {"memory_mb": resident_memory_mb(), "models": registry.stats()},
+        "embedding_index": embedding_cache.stats(),
+        "exercise_pool": exercise_pool.stats(),
+        "scan_cache": scan_cache.stats(),
+        "enrollment_jobs": enrollment_jobs.stats(),
+        "template_refinement": template_refiner.stats(),
+        "scan_logs": scan_logs.stats(),
+        "training_images": get_training_ai().face_generator.image_cache.stats() if registry.is_loaded("training_ai") else None,
+        "facenet_batcher": facenet_batcher.stats(),
+        "morph_engine": get_training_ai().morph_engine.stats() if registry.is_loaded("training_ai") else None,
+        "inference_pool": inference_pool.stats()
     }
 
 if __name__ == "__main__":
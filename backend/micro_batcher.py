@@ -0,0 +1,98 @@
+"""
+Dynamic micro-batching of model calls across concurrent requests
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """Collects items submitted by concurrent requests and runs them through one batched call.
+
+    A batch is dispatched once `max_batch_size` items are waiting or the
+    oldest item has waited `max_wait_ms`, whichever comes first.
+    `process_batch` receives a list of items and must return one result per
+    item in the same order; it runs on a dedicated thread so the event loop
+    keeps accepting work while the model is busy.
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="micro-batcher")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        self.items = 0
+        self.batches = 0
+        self.queue_wait_seconds = 0.0
+        self.batch_seconds = 0.0
+
+    async def submit(self, item: Any) -> Any:
+        """Queue an item and wait for its result"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future, float]]:
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            started = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self._executor, self.process_batch, [item for item, _, _ in batch])
+                for (_, future, _), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                logger.error(f"Error processing batch of {len(batch)}: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+            finished = time.perf_counter()
+            self.items += len(batch)
+            self.batches += 1
+            self.queue_wait_seconds += sum(started - queued_at for _, _, queued_at in batch)
+            self.batch_seconds += finished - started
+
+    def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict:
+        """Report batch-size, latency and throughput counters"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "items": self.items,
+            "batches": self.batches,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "avg_queue_wait_ms": 1000 * self.queue_wait_seconds / self.items if self.items else 0.0,
+            "avg_batch_latency_ms": 1000 * self.batch_seconds / self.batches if self.batches else 0.0,
+            "items_per_second": self.items / self.batch_seconds if self.batch_seconds else 0.0
+        }
@@ -0,0 +1,99 @@
+"""
+Process pool that keeps CPU-bound model inference off the FastAPI event loop
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class PoolSaturatedError(Exception):
+    """Raised when the inference queue is full and the request should be retried later"""
+
+def _worker_pid() -> int:
+    return os.getpid()
+
+class InferencePool:
+    """Bounded queue in front of a pool of model-owning worker processes.
+
+    Each worker runs `initializer` once on start-up to build and warm its own
+    models, then `reporter` (if given) once so its load statistics can be
+    shown on /health. At most `max_pending` calls may be queued or running at once;
+    further calls fail fast with PoolSaturatedError. With workers=0 calls
+    run inline on the event loop, which is convenient for development.
+    """
+
+    def __init__(self, workers: int, max_pending: int, initializer: Optional[Callable] = None,
+                 reporter: Optional[Callable[[], Dict]] = None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.initializer = initializer
+        self.reporter = reporter
+        self.worker_reports: Dict[int, Dict] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+
+    def start(self):
+        """Spawn the workers and wait until every one has loaded its models"""
+        if self.workers <= 0:
+            if self.initializer:
+                self.initializer()
+            if self.reporter:
+                self.worker_reports = {os.getpid(): self.reporter()}
+            return
+
+        start = time.time()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=self.initializer
+        )
+        # Each submission that finds no idle worker spawns one, so this
+        # forces all workers up front and blocks until their warm-up is done
+        futures = [self._executor.submit(self.reporter or _worker_pid) for _ in range(self.workers)]
+        if self.reporter:
+            self.worker_reports = {report["pid"]: report for report in (future.result() for future in futures)}
+            pids = set(self.worker_reports)
+        else:
+            pids = {future.result() for future in futures}
+        logger.info(f"Inference pool ready: {len(pids)} workers warmed up in {time.time() - start:.1f}s")
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn: Callable, *args):
+        """Run fn(*args) on a worker, raising PoolSaturatedError if the queue is full"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PoolSaturatedError(f"Inference queue is full ({self.pending} pending)")
+
+        self.pending += 1
+        start = time.time()
+        try:
+            if self._executor is None:
+                return fn(*args)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            self.busy_seconds += time.time() - start
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_latency_ms": 1000 * self.busy_seconds / self.completed if self.completed else 0.0,
+            "worker_models": list(self.worker_reports.values())
+        }
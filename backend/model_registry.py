@@ -0,0 +1,89 @@
+"""
+Lazy model registry for Memora
+
+Heavy libraries (TensorFlow, MediaPipe, dlib, torch, Anthropic) are imported
+inside each model's factory, so a process only pays for the models it
+actually uses. Models are built on first use, or up front with warm_up().
+"""
+import os
+import resource
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+def resident_memory_mb() -> float:
+    """Current resident set size of this process in MiB"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        # No procfs: fall back to the peak RSS (bytes on macOS, KiB elsewhere)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+class ModelRegistry:
+    """Named model factories that are constructed once, on first use.
+
+    Each load records how long the factory took and how much the process's
+    resident memory grew, which /health reports per model.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._models: Dict[str, Any] = {}
+        self._load_stats: Dict[str, Dict] = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        self._factories[name] = factory
+
+    def get(self, name: str) -> Any:
+        """Return the named model, building it on first use"""
+        if name in self._models:
+            return self._models[name]
+        with self._lock:
+            if name not in self._models:
+                memory_before = resident_memory_mb()
+                start = time.perf_counter()
+                self._models[name] = self._factories[name]()
+                self._load_stats[name] = {
+                    "load_ms": 1000 * (time.perf_counter() - start),
+                    "memory_mb": max(resident_memory_mb() - memory_before, 0.0)
+                }
+                logger.info(f"Loaded model {name} in {self._load_stats[name]['load_ms']:.0f}ms")
+            return self._models[name]
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def warm_up(self, names: Union[str, Iterable[str]] = "all", only: Optional[Iterable[str]] = None) -> List[str]:
+        """Build the given models now; accepts "all", "none" or a comma-separated list.
+
+        Names this registry does not know, or that are not in `only`, are
+        ignored, so one setting can cover models loaded in different processes.
+        """
+        if isinstance(names, str):
+            if names.strip().lower() == "all":
+                names = list(self._factories)
+            elif names.strip().lower() in ("", "none"):
+                names = []
+            else:
+                names = [name.strip() for name in names.split(",")]
+        warmed = [name for name in names if name in self._factories and (only is None or name in only)]
+        for name in warmed:
+            self.get(name)
+        return warmed
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-model load state, load time and resident-memory growth"""
+        return {
+            name: {"loaded": name in self._models, **self._load_stats.get(name, {})}
+            for name in self._factories
+        }
+
+# Models registered by the modules loaded into this process
+registry = ModelRegistry()
@@ -0,0 +1,234 @@
+"""
+Landmark-aligned face morphing for morph-matching exercises
+
+Both faces are warped onto interpolated MediaPipe face-mesh landmarks with
+one affine per Delaunay triangle before they are cross-dissolved, so the
+result is a single face rather than a double exposure. The triangulation of
+the 468-point mesh (plus image border points) is computed once and reused
+for every pair, and each face's landmarks are cached, so an extra morph
+level costs one warp. A whole sequence of morph levels is rendered in one
+vectorized pass: every (level, triangle) affine comes from one batched
+closed-form inverse and each source image is sampled with one cv2.remap over the stacked
+per-level grids.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import cv2
+import numpy as np
+import logging
+from landmarks import FaceLandmarks
+
+logger = logging.getLogger(__name__)
+
+MESH_POINTS = 468  # Face-mesh points without the refined iris points
+
+# Image border anchors as fractions of (width, height), so the triangulation
+# covers the background and hair as well as the face
+BORDER_FRACTIONS = ((0, 0), (0.5, 0), (1, 0), (1, 0.5), (1, 1), (0.5, 1), (0, 1), (0, 0.5))
+
+# Sub-pixel precision used when rasterizing triangles
+RASTER_SHIFT = 4
+
+class MorphEngine:
+    """Renders landmark-aligned morphs between two RGB face images.
+
+    `alpha` weights the second image, as in TrainingAI.blend_images. Images
+    are resized to `size`; landmarks come from `landmark_analyzer`
+    (an ai_models.FacialLandmarkAnalyzer, created on first use) unless stored
+    normalized `landmark_data` is passed, and are cached by face key. When
+    either face has no landmarks the morph falls back to a cross-dissolve.
+    """
+
+    def __init__(self, landmark_analyzer: Any = None, size: Tuple[int, int] = (256, 256),
+                 max_cached_faces: int = 256):
+        self.size = size
+        self.max_cached_faces = max_cached_faces
+        self._landmark_analyzer = landmark_analyzer
+        self._landmarks: "OrderedDict[Any, Optional[np.ndarray]]" = OrderedDict()
+        self._triangles: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self._mesh_lock = threading.Lock()  # MediaPipe graphs are not thread-safe
+
+        self.landmark_hits = 0
+        self.landmark_misses = 0
+        self.aligned = 0
+        self.fallbacks = 0
+
+    @property
+    def landmark_analyzer(self):
+        if self._landmark_analyzer is None:
+            from ai_models import FacialLandmarkAnalyzer
+            self._landmark_analyzer = FacialLandmarkAnalyzer()
+        return self._landmark_analyzer
+
+    def _resize(self, image: np.ndarray) -> np.ndarray:
+        if image.shape[1::-1] != self.size:
+            image = cv2.resize(image, self.size, interpolation=cv2.INTER_LANCZOS4)
+        return image
+
+    def _border_points(self) -> np.ndarray:
+        width, height = self.size
+        return np.array(BORDER_FRACTIONS, dtype=np.float32) * np.array([width - 1, height - 1], dtype=np.float32)
+
+    def _detect_landmarks(self, image: np.ndarray, landmark_data: Optional[Dict]) -> Optional[np.ndarray]:
+        # Stored points are normalized to the whole image, which is what the
+        # training images are resized from
+        landmarks = FaceLandmarks.from_landmark_data(landmark_data)
+        if landmarks is None:
+            with self._mesh_lock:
+                landmarks = self.landmark_analyzer.extract_landmarks(cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+        if landmarks is None or len(landmarks) < MESH_POINTS:
+            return None
+        return landmarks.pixels(self.size)[:MESH_POINTS]
+
+    def landmarks(self, image: np.ndarray, key: Any = None, landmark_data: Optional[Dict] = None) -> Optional[np.ndarray]:
+        """(468 + border, 2) pixel control points for a `size` image, cached by `key`"""
+        cache_key = (key, self.size) if key is not None else None
+        if cache_key is not None:
+            with self._lock:
+                if cache_key in self._landmarks:
+                    self._landmarks.move_to_end(cache_key)
+                    self.landmark_hits += 1
+                    return self._landmarks[cache_key]
+
+        points = self._detect_landmarks(image, landmark_data)
+        if points is not None:
+            width, height = self.size
+            points = np.clip(points, 0, [width - 1, height - 1])
+            points = np.concatenate([points, self._border_points()]).astype(np.float32)
+
+        with self._lock:
+            self.landmark_misses += 1
+            if cache_key is not None:
+                # Faces without landmarks are cached too, so they are not re-run
+                self._landmarks[cache_key] = points
+                while len(self._landmarks) > self.max_cached_faces:
+                    self._landmarks.popitem(last=False)
+        return points
+
+    def triangles(self, points: np.ndarray) -> np.ndarray:
+        """(T, 3) vertex indices of the mesh triangulation, computed once from the first shape"""
+        if self._triangles is None:
+            triangles = self._triangulate(points)
+            with self._lock:
+                if self._triangles is None:
+                    self._triangles = triangles
+        return self._triangles
+
+    def _triangulate(self, points: np.ndarray) -> np.ndarray:
+        width, height = self.size
+        subdiv = cv2.Subdiv2D((0, 0, width, height))
+        index_of = {}
+        for i, (x, y) in enumerate(points):
+            # Coincident landmarks collapse to one vertex; keep the first index
+            index_of.setdefault((float(x), float(y)), i)
+        subdiv.insert([(float(x), float(y)) for x, y in points])
+
+        triangles = []
+        for x1, y1, x2, y2, x3, y3 in subdiv.getTriangleList():
+            vertices = [index_of.get((float(x), float(y))) for x, y in ((x1, y1), (x2, y2), (x3, y3))]
+            # Skip triangles that touch Subdiv2D's virtual outer vertices
+            if None not in vertices:
+                triangles.append(vertices)
+        logger.info(f"Morph triangulation: {len(triangles)} triangles over {len(points)} points")
+        return np.array(triangles, dtype=np.int32)
+
+    def _inverse_triangles(self, targets: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+        """(A, T, 3, 3) inverses of the homogeneous [x, y, 1] vertex matrix of every target triangle"""
+        vertices = targets[:, triangles]  # (A, T, 3, 2)
+        x1, x2, x3 = vertices[..., 0, 0], vertices[..., 1, 0], vertices[..., 2, 0]
+        y1, y2, y3 = vertices[..., 0, 1], vertices[..., 1, 1], vertices[..., 2, 1]
+        # Closed-form 3x3 inverse (adjugate / determinant) for all triangles at once
+        adjugate = np.stack([
+            np.stack([y2 - y3, y3 - y1, y1 - y2], axis=-1),
+            np.stack([x3 - x2, x1 - x3, x2 - x1], axis=-1),
+            np.stack([x2 * y3 - x3 * y2, x3 * y1 - x1 * y3, x1 * y2 - x2 * y1], axis=-1)
+        ], axis=-2)
+        determinant = x1 * (y2 - y3) + x2 * (y3 - y1) + x3 * (y1 - y2)
+        # Collapsed triangles cover no pixels; keep their inverse finite
+        determinant = np.where(np.abs(determinant) < 1e-6, 1.0, determinant)
+        return adjugate / determinant[..., None, None]
+
+    def _sampling_maps(self, inverse: np.ndarray, source: np.ndarray, labels: np.ndarray,
+                       triangles: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Fixed-point remap grids that pull `source` triangles onto every target shape"""
+        levels = inverse.shape[0]
+        width, height = self.size
+
+        # Affine per (level, triangle) mapping target pixels to source pixels:
+        # [x, y, 1] @ affine = [src_x, src_y]
+        affines = inverse @ source[triangles][None]  # (A, T, 3, 2)
+
+        # Pixels no triangle covers (rounding at the border) keep their position
+        identity = np.broadcast_to(np.array([[1, 0], [0, 1], [0, 0]], np.float32), (levels, 1, 3, 2))
+        coefficients = np.concatenate([affines.astype(np.float32), identity], axis=1).reshape(-1, 6).T.copy()
+
+        xs, ys = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        a, d, b, e, c, f = (coefficient.take(labels, mode="clip") for coefficient in coefficients)
+        map_x = (xs * a + ys * b + c).reshape(levels * height, width)
+        map_y = (xs * d + ys * e + f).reshape(levels * height, width)
+        return cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+    def _triangle_labels(self, targets: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+        """(A, H, W) flat (level, triangle) index of the affine covering each pixel.
+
+        Each level owns T + 1 consecutive slots; the last one is the identity
+        used for pixels no triangle covers.
+        """
+        width, height = self.size
+        slots = len(triangles) + 1
+        labels = np.empty((targets.shape[0], height, width), dtype=np.int32)
+        fixed_point = np.ascontiguousarray(np.round(targets[:, triangles] * (1 << RASTER_SHIFT)), dtype=np.int32)
+        for level in range(targets.shape[0]):
+            offset = level * slots
+            labels[level] = offset + slots - 1
+            for t, polygon in enumerate(fixed_point[level]):
+                cv2.fillConvexPoly(labels[level], polygon, offset + t, cv2.LINE_8, RASTER_SHIFT)
+        return labels
+
+    def morph_sequence(self, image1: np.ndarray, image2: np.ndarray, alphas: Sequence[float],
+                       key1: Any = None, key2: Any = None,
+                       landmark_data1: Optional[Dict] = None, landmark_data2: Optional[Dict] = None) -> List[np.ndarray]:
+        """Render one morph per alpha (the weight of image2) in a single pass"""
+        image1, image2 = self._resize(image1), self._resize(image2)
+        alphas = np.asarray(alphas, dtype=np.float32)
+        points1 = self.landmarks(image1, key1, landmark_data1)
+        points2 = self.landmarks(image2, key2, landmark_data2)
+
+        if points1 is None or points2 is None:
+            with self._lock:
+                self.fallbacks += 1
+            return [cv2.addWeighted(image1, 1 - float(alpha), image2, float(alpha), 0) for alpha in alphas]
+
+        triangles = self.triangles((points1 + points2) / 2)
+        weights = alphas[:, None, None]
+        targets = (1 - weights) * points1[None] + weights * points2[None]  # (A, P, 2)
+        labels = self._triangle_labels(targets, triangles)
+        inverse = self._inverse_triangles(targets, triangles)
+
+        width, height = self.size
+        warped = []
+        for image, points in ((image1, points1), (image2, points2)):
+            map1, map2 = self._sampling_maps(inverse, points, labels, triangles)
+            rendered = cv2.remap(image, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+            warped.append(rendered.reshape(len(alphas), height, width, -1).astype(np.float32))
+
+        blend = alphas[:, None, None, None]
+        morphs = np.clip((1 - blend) * warped[0] + blend * warped[1] + 0.5, 0, 255).astype(np.uint8)
+        with self._lock:
+            self.aligned += 1
+        return list(morphs)
+
+    def morph(self, image1: np.ndarray, image2: np.ndarray, alpha: float = 0.5, **kwargs) -> np.ndarray:
+        return self.morph_sequence(image1, image2, [alpha], **kwargs)[0]
+
+    def stats(self) -> Dict:
+        return {
+            "cached_faces": len(self._landmarks),
+            "triangles": 0 if self._triangles is None else len(self._triangles),
+            "landmark_hits": self.landmark_hits,
+            "landmark_misses": self.landmark_misses,
+            "aligned_morphs": self.aligned,
+            "fallbacks": self.fallbacks
+        }
@@ -0,0 +1,121 @@
+"""
+Short-lived per-user cache of /scan/identify responses for repeated frames
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Hashable, Optional, Tuple
+import cv2
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+HASH_SIDE = 32  # Frames are shrunk to 32x32 before the DCT
+HASH_BITS = 8   # The lowest 8x8 frequencies make the 64-bit hash
+
+def perceptual_hash(image_bytes: bytes) -> Optional[int]:
+    """64-bit DCT perceptual hash of compressed JPEG/PNG bytes, or None if they do not decode.
+
+    JPEGs are decoded at 1/4 scale straight from the DCT coefficients, so
+    hashing costs a small fraction of a full decode.
+    """
+    gray = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        return None
+    small = cv2.resize(gray, (HASH_SIDE, HASH_SIDE), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:HASH_BITS, :HASH_BITS].flatten()
+    # Compare against the median without the DC term, so brightness shifts don't flip bits
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+class ScanResponseCache:
+    """Recent scan responses per user, looked up by perceptual-hash distance.
+
+    A frame hits when one of the user's last `entries_per_user` responses
+    was computed for a frame whose hash differs in at most `max_distance`
+    bits, with the same request `variant` (options that change the
+    response), less than `ttl_seconds` ago. invalidate() drops a user's
+    responses and discards ones still being computed from before the call;
+    `ttl_seconds <= 0` disables the cache.
+    """
+
+    def __init__(self, ttl_seconds: float = 1.0, max_distance: int = 4, entries_per_user: int = 4,
+                 max_users: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.entries_per_user = entries_per_user
+        self.max_users = max_users
+        self._entries: "OrderedDict[str, Deque[Tuple[float, int, Hashable, Any]]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def generation(self, user_id: str) -> int:
+        """Token to pass to put(), so responses computed before an invalidation are not stored"""
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def get(self, user_id: str, frame_hash: Optional[int], variant: Hashable) -> Optional[Tuple[Any, float]]:
+        """(response, age in seconds) of the closest fresh match for the frame, or None"""
+        if not self.enabled or frame_hash is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entries = self._entries.get(user_id)
+            best = None
+            if entries:
+                while entries and now - entries[0][0] >= self.ttl_seconds:
+                    entries.popleft()
+                for stored_at, stored_hash, stored_variant, response in entries:
+                    distance = (stored_hash ^ frame_hash).bit_count()
+                    if stored_variant == variant and distance <= self.max_distance and \
+                            (best is None or distance < best[0]):
+                        best = (distance, response, now - stored_at)
+                self._entries.move_to_end(user_id)
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return best[1], best[2]
+
+    def put(self, user_id: str, frame_hash: Optional[int], variant: Hashable, response: Any, generation: int):
+        if not self.enabled or frame_hash is None:
+            return
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation:
+                return
+            entries = self._entries.setdefault(user_id, deque(maxlen=self.entries_per_user))
+            entries.append((time.monotonic(), frame_hash, variant, response))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+            self.stores += 1
+
+    def invalidate(self, user_id: str):
+        """Drop a user's cached responses, e.g. after their connections change"""
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self._entries.pop(user_id, None)
+            self.invalidations += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "users": len(self._entries),
+                "responses": sum(len(entries) for entries in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,131 @@
+"""
+Asynchronous face_recognition_logs writer for scan events
+
+Scans record one event each into a bounded in-memory ring buffer, which
+costs a deque append; a background task drains the buffer, builds the rows
+and inserts them in batches. When the buffer is full the oldest events are
+dropped and counted, so a slow or unreachable database never holds up a
+scan.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (user id, response faces, response timings, processing time in seconds, epoch seconds)
+ScanEvent = Tuple[str, Sequence[Dict], Dict[str, float], float, float]
+
+def scan_log_row(user_id: str, faces: Sequence[Dict], timings: Dict[str, float], processing_time: float,
+                 scanned_at: float) -> Dict:
+    """The face_recognition_logs row for one scan response"""
+    confidences = [round(float(face.get("confidence", 0.0)), 4) for face in faces]
+    best = max(range(len(faces)), key=lambda i: confidences[i]) if faces else None
+    return {
+        "user_id": user_id,
+        "confidence_score": confidences[best] if best is not None else 0.0,
+        "emotion_detected": faces[best].get("emotion") if best is not None else None,
+        "face_count": len(faces),
+        "face_confidences": confidences,
+        "timings": {stage: round(float(ms), 3) for stage, ms in timings.items()},
+        "cache_hit": bool(timings.get("cache_hit")),
+        "processing_ms": round(1000 * processing_time, 3),
+        "created_at": datetime.fromtimestamp(scanned_at, timezone.utc).isoformat()
+    }
+
+class ScanLogBuffer:
+    """Ring buffer of scan events flushed by `write(rows)` in batches.
+
+    Every `flush_seconds`, the buffered events are turned into rows and
+    handed to `write` on a thread, `batch_size` at a time, until the buffer
+    is empty. A batch whose write fails is counted as failed and not
+    retried. With `enabled` false, record() does nothing.
+    """
+
+    def __init__(self, write: Callable[[List[Dict]], None], capacity: int = 10000, batch_size: int = 500,
+                 flush_seconds: float = 5.0, enabled: bool = True):
+        self.write = write
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.enabled = enabled and capacity > 0
+        self._events: Deque[ScanEvent] = deque(maxlen=max(1, capacity))
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+
+    def record(self, user_id: str, faces: Sequence[Dict], timings: Dict[str, float], processing_time: float):
+        """Queue a scan response's event, dropping the oldest one if the buffer is full"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append((user_id, faces, timings, processing_time, time.time()))
+            self.recorded += 1
+
+    def start(self):
+        """Start the periodic flush task on the running event loop"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """Stop the flush task and write out the buffered events"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+    def _take(self) -> List[ScanEvent]:
+        with self._lock:
+            return [self._events.popleft() for _ in range(min(self.batch_size, len(self._events)))]
+
+    async def flush(self) -> int:
+        """Write every buffered event in batches; returns how many were written"""
+        written = 0
+        while True:
+            batch = self._take()
+            if not batch:
+                return written
+            self.batches += 1
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"Failed to write {len(batch)} scan log events: {e}")
+                continue
+            self.written += len(batch)
+            written += len(batch)
+
+    def _write_batch(self, batch: List[ScanEvent]):
+        self.write([scan_log_row(*event) for event in batch])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            buffered = len(self._events)
+        return {
+            "enabled": self.enabled,
+            "buffered": buffered,
+            "capacity": self.capacity,
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches
+        }
@@ -0,0 +1,168 @@
+"""
+Online refinement of connection centroids from confident scan matches
+
+Scans that match a connection with at least `min_confidence` hand their
+fresh embedding to observe(), which only adds it to a per-connection running
+sum. Every `interval_seconds` a background task folds each connection's
+observations into its centroid with an exponential moving average, updates
+the resident embedding index and writes the centroid back to the database,
+so a connection is written at most once per interval however often it is
+seen. Centroids then follow gradual changes in appearance (aging, a new
+hairstyle) without any extra work in the scan itself.
+
+Adding a photo recomputes the centroid from the connection's face
+templates, which resets the drift accumulated here.
+"""
+import asyncio
+import itertools
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class _Observations:
+    user_id: str
+    connection_id: str
+    total: np.ndarray
+    count: int = 1
+
+class TemplateRefiner:
+    """Batches confident scan embeddings into EMA updates of connection centroids.
+
+    `gallery` is the EmbeddingIndexCache (centroid() and update_embeddings());
+    `store.update(table, record_id, fields)` writes a row, as the enrollment
+    stores do. Each flush moves a centroid by 1 - (1 - alpha)^n towards the
+    mean of its n observations (n capped at `max_observations`), keeping the
+    centroid's norm so match thresholds still apply. At most `max_writes`
+    connections are written per flush and the rest wait for the next one;
+    beyond `max_pending` connections, new observations are dropped.
+    Observations for users whose index is no longer resident are discarded.
+    """
+
+    def __init__(self, gallery: Any, store: Any, enabled: bool = False, min_confidence: float = 0.7,
+                 alpha: float = 0.05, interval_seconds: float = 60.0, max_observations: int = 10,
+                 max_writes: int = 200, max_pending: int = 10000):
+        self.gallery = gallery
+        self.store = store
+        self.enabled = enabled
+        self.min_confidence = min_confidence
+        self.alpha = alpha
+        self.interval_seconds = interval_seconds
+        self.max_observations = max_observations
+        self.max_writes = max_writes
+        self.max_pending = max_pending
+        self._pending: Dict[str, _Observations] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.observed = 0
+        self.dropped = 0
+        self.applied = 0
+        self.discarded = 0
+        self.written = 0
+        self.write_errors = 0
+        self.flushes = 0
+
+    def observe(self, user_id: str, connection_id: str, embedding: Sequence[float], confidence: float):
+        """Record a scan match; cheap enough to call for every identified face"""
+        if not self.enabled or confidence < self.min_confidence or connection_id.startswith("pending:"):
+            return
+        vector = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            observations = self._pending.get(connection_id)
+            if observations is None:
+                if len(self._pending) >= self.max_pending:
+                    self.dropped += 1
+                    return
+                self._pending[connection_id] = _Observations(user_id, connection_id, vector.copy())
+            elif observations.count < self.max_observations:
+                observations.total += vector
+                observations.count += 1
+            self.observed += 1
+
+    def start(self):
+        """Start the periodic flush task on the running event loop"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """Stop the flush task, writing out what is still pending"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        while self._pending:
+            await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Template refinement flush failed: {e}")
+
+    def _refined(self, observations: _Observations) -> Optional[np.ndarray]:
+        centroid = self.gallery.centroid(observations.user_id, observations.connection_id)
+        if centroid is None or centroid.shape != observations.total.shape:
+            return None
+        weight = 1.0 - (1.0 - self.alpha) ** observations.count
+        refined = (1.0 - weight) * centroid + weight * observations.total / observations.count
+        norm = np.linalg.norm(refined)
+        if norm > 0:
+            refined *= np.linalg.norm(centroid) / norm
+        return refined
+
+    async def flush(self) -> int:
+        """Apply and write up to `max_writes` connections' observations; returns how many were applied"""
+        with self._lock:
+            batch = [self._pending.pop(connection_id)
+                     for connection_id in list(itertools.islice(self._pending, self.max_writes))]
+        if not batch:
+            return 0
+        self.flushes += 1
+
+        by_user: Dict[str, Dict[str, np.ndarray]] = {}
+        for observations in batch:
+            refined = self._refined(observations)
+            if refined is None:
+                self.discarded += 1
+                continue
+            by_user.setdefault(observations.user_id, {})[observations.connection_id] = refined
+
+        rows: List[Tuple[str, np.ndarray]] = []
+        for user_id, centroids in by_user.items():
+            self.applied += self.gallery.update_embeddings(user_id, centroids)
+            rows.extend(centroids.items())
+        if rows:
+            await asyncio.to_thread(self._write, rows)
+        return len(rows)
+
+    def _write(self, rows: List[Tuple[str, np.ndarray]]):
+        for connection_id, centroid in rows:
+            try:
+                self.store.update("connections", connection_id, {"face_embedding": centroid.tolist()})
+                self.written += 1
+            except Exception as e:
+                self.write_errors += 1
+                logger.error(f"Failed to write refined centroid of connection {connection_id}: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "enabled": self.enabled,
+            "pending": pending,
+            "observed": self.observed,
+            "dropped": self.dropped,
+            "applied": self.applied,
+            "discarded": self.discarded,
+            "written": self.written,
+            "write_errors": self.write_errors,
+            "flushes": self.flushes
+        }
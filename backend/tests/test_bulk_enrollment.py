@@ -0,0 +1,90 @@
+"""
+BulkEnrollment folder grouping and iter_uploaded_images limits, with a stand-in embedder
+
+Run from the backend directory:
+    python -m pytest tests
+"""
+import asyncio
+import io
+import os
+import sys
+import zipfile
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bulk_enrollment import BulkEnrollment, UploadTooLargeError, iter_uploaded_images
+from face_templates import template_centroid
+
+DIM = 8
+
+def album(files) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+def embedding(data: bytes):
+    """Each image's bytes name its embedding: b"<person>:<photo>" """
+    person, photo = data.decode().split(":")
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[int(person)] = 1.0
+    vector[-1] = 0.3 * int(photo)  # Photos of one person are further apart than the dedupe distance
+    return vector.tolist()
+
+async def embed_batch(images):
+    return [{"embedding": embedding(data), "face_count": 1, "face_location": (0, 10, 10, 0),
+             "quality": 0.1 * int(data.decode().split(":")[1]), "preview_jpeg": data} for data in images]
+
+def run(images, **params):
+    inserted_rows = []
+    callbacks = []
+
+    def insert_rows(rows):
+        rows = [{**row, "id": f"conn-{len(inserted_rows) + i}"} for i, row in enumerate(rows)]
+        inserted_rows.extend(rows)
+        return rows
+
+    enrollment = BulkEnrollment(embed_batch, insert_rows, batch_size=2, insert_batch_size=2, **params)
+
+    async def collect():
+        return [event async for event in enrollment.run(
+            "user-1", images, on_inserted=lambda rows, results: callbacks.extend(zip(rows, results)))]
+
+    return asyncio.run(collect()), inserted_rows, callbacks
+
+def test_each_album_folder_becomes_one_connection():
+    upload = album({f"Ada/{i}.jpg": f"1:{i}".encode() for i in range(1, 4)} |
+                   {f"Grace/{i}.jpg": f"2:{i}".encode() for i in range(1, 3)})
+    images = list(iter_uploaded_images([("album.zip", upload), ("Linus.png", b"3:1")]))
+    events, rows, callbacks = run(images)
+
+    assert [row["name"] for row in rows] == ["Ada", "Grace", "Linus"]
+    ada = rows[0]
+    assert len(ada["face_templates"]) == 3
+    assert ada["face_embedding"] == template_centroid(ada["face_templates"])
+    # Enrichment runs on the best-quality photo of each connection
+    assert callbacks[0][1]["preview_jpeg"] == b"1:3"
+    assert callbacks[0][1]["files"] == ["Ada/1.jpg", "Ada/2.jpg", "Ada/3.jpg"]
+    done = events[-1]
+    assert done["event"] == "done" and done["added"] == 6 and done["connections"] == 3
+
+def test_folder_templates_are_capped_at_max_exemplars():
+    images = [("Ada", f"Ada/{i}.jpg", f"1:{i}".encode()) for i in range(1, 8)]
+    _, rows, _ = run(images, max_exemplars=3)
+    assert len(rows) == 1
+    assert sorted(t["quality"] for t in rows[0]["face_templates"]) == [0.5, 0.6, 0.7]
+
+def test_image_limit_is_enforced_before_decompressing():
+    upload = album({f"Ada/{i}.jpg": f"1:{i}".encode() for i in range(5)})
+    images = iter_uploaded_images([("album.zip", upload)], max_images=3)
+    assert len([next(images) for _ in range(3)]) == 3
+    with pytest.raises(UploadTooLargeError):
+        next(images)
+
+def test_uncompressed_size_limit_uses_declared_member_sizes():
+    upload = album({"Ada/1.jpg": b"\0" * (2 * 1024 * 1024)})
+    assert len(upload) < 1024 * 1024
+    with pytest.raises(UploadTooLargeError):
+        list(iter_uploaded_images([("album.zip", upload)], max_bytes=1024 * 1024))
@@ -0,0 +1,117 @@
+"""
+UserEmbeddingIndex two-stage search and EmbeddingIndexCache residency
+
+Run from the backend directory:
+    python -m pytest tests
+"""
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_index import EmbeddingIndexCache, UserEmbeddingIndex
+from face_templates import add_template, template_centroid
+
+DIM = 8
+
+def unit(axis: int, scale: float = 1.0):
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[axis] = scale
+    return vector.tolist()
+
+def row(connection_id: str, embedding, exemplars=()):
+    templates = []
+    for exemplar in exemplars:
+        templates = add_template(templates, exemplar, 0.8)
+    return {"id": connection_id, "name": connection_id.title(), "face_embedding": embedding,
+            "face_templates": templates}
+
+class Loader:
+    """Connections per user, counting loads"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.loads = []
+
+    def __call__(self, user_id):
+        self.loads.append(user_id)
+        return self.rows.get(user_id, [])
+
+def test_nearest_returns_position_and_distance_per_query():
+    index = UserEmbeddingIndex.from_connections([row("a", unit(0)), row("b", unit(1)), row("c", unit(2))])
+    matches = index.nearest(np.array([unit(1, 0.9), unit(2)]))
+    assert [index.ids[position] for position, _ in matches] == ["b", "c"]
+    assert matches[0][1] == pytest.approx(0.1, abs=1e-5) and matches[1][1] == pytest.approx(0.0, abs=1e-5)
+
+def test_nearest_matches_an_exemplar_far_from_the_centroid():
+    # "a" was photographed from two very different angles; its centroid sits between them
+    side, front = unit(0), unit(3)
+    a = row("a", template_centroid(add_template(add_template([], side, 0.8), front, 0.8)), [side, front])
+    index = UserEmbeddingIndex.from_connections([a, row("b", unit(5))], candidates=2)
+    position, distance = index.nearest(np.array([front]))[0]
+    assert index.ids[position] == "a" and distance == pytest.approx(0.0, abs=1e-5)
+
+def test_nearest_on_empty_or_mismatched_index():
+    assert UserEmbeddingIndex().nearest(np.array([unit(0)])) == [(None, float("inf"))]
+    index = UserEmbeddingIndex.from_connections([row("a", unit(0))])
+    assert index.nearest(np.zeros((1, DIM + 1))) == [(None, float("inf"))]
+
+def test_add_replaces_and_remove_drops_a_connection():
+    index = UserEmbeddingIndex.from_connections([row("a", unit(0)), row("b", unit(1))])
+    index.add("a", unit(4), {"id": "a", "name": "A"})
+    assert len(index) == 2 and index.ids == ["b", "a"]
+    assert index.ids[index.nearest(np.array([unit(4)]))[0][0]] == "a"
+    assert index.remove("b") and not index.remove("b")
+    assert index.ids == ["a"] and index.embeddings.shape == (1, DIM)
+
+def test_update_embeddings_copies_the_matrix_before_writing():
+    index = UserEmbeddingIndex.from_connections([row("a", unit(0)), row("b", unit(1))])
+    before = index.embeddings
+    assert index.update_embeddings({"a": np.asarray(unit(2)), "missing": np.asarray(unit(3))}) == 1
+    # A search that took the old matrix keeps seeing the old centroids
+    assert before[0].tolist() == unit(0)
+    assert index.embeddings[0].tolist() == unit(2) and index.embeddings is not before
+    assert index.norms[0] == pytest.approx(1.0)
+
+def test_cache_hits_until_the_ttl_expires():
+    loader = Loader({"u1": [row("a", unit(0))]})
+    cache = EmbeddingIndexCache(loader, ttl_seconds=60)
+    index = cache.get("u1")
+    assert cache.get("u1") is index and loader.loads == ["u1"]
+    index.loaded_at -= 61
+    assert cache.get("u1") is not index and loader.loads == ["u1", "u1"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+def test_cache_evicts_the_least_recently_used_user():
+    loader = Loader({})
+    cache = EmbeddingIndexCache(loader, max_users=2)
+    cache.get("u1")
+    cache.get("u2")
+    cache.get("u1")
+    cache.get("u3")
+    assert cache.stats()["users"] == 2 and cache.evictions == 1
+    cache.get("u1")
+    cache.get("u2")
+    assert loader.loads == ["u1", "u2", "u3", "u2"]
+
+def test_cache_updates_only_resident_users():
+    loader = Loader({"u1": [row("a", unit(0)), row("b", unit(1))]})
+    cache = EmbeddingIndexCache(loader)
+    assert not cache.add_connection("u1", "c", unit(2), {"id": "c"})
+    index = cache.get("u1")
+    assert cache.add_connection("u1", "c", unit(2), {"id": "c"}) and len(index) == 3
+    assert cache.update_embeddings("u1", {"a": np.asarray(unit(3))}) == 1
+    assert cache.centroid("u1", "a").tolist() == unit(3)
+    assert cache.remove_connection("b") and not cache.remove_connection("b")
+    assert index.ids == ["a", "c"]
+    cache.invalidate("u1")
+    assert cache.centroid("u1", "a") is None
+
+def test_cache_attaches_a_matcher_to_large_galleries():
+    rows = [row(f"c{i}", np.random.default_rng(i).standard_normal(DIM).tolist()) for i in range(30)]
+    cache = EmbeddingIndexCache(Loader({"u1": rows}), matcher_kind="hnsw", matcher_min_size=20, candidates=3)
+    index = cache.get("u1")
+    assert index.matcher is not None
+    for i in (0, 11, 29):
+        assert index.ids[index.nearest(np.array([rows[i]["face_embedding"]]))[0][0]] == f"c{i}"
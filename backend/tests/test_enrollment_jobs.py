@@ -0,0 +1,151 @@
+"""
+EnrollmentEnricher and EnrollmentJobQueue with the local stand-ins for Claude and Supabase
+
+Run from the backend directory:
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from enrollment_jobs import EnrollmentEnricher, EnrollmentJobQueue, EnrollmentQueueFullError, InMemoryEnrollmentStore, \
+    local_trait_descriptions
+
+FEATURES = {
+    "landmark_data": {"points": "AAAA"},
+    "facial_traits": {"eye_distance_ratio": 0.42},
+    "caricature_highlights": {"nose": 0.8}
+}
+
+class Analyzer:
+    """Stand-in for the inference-pool analysis step, counting its calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, image_bytes, face_location):
+        self.calls += 1
+        return {**FEATURES, "face_jpeg": b"face"}
+
+class FlakyDescriber:
+    """Trait description stand-in that fails its first `failures` calls"""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self, image_b64, landmarks):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError("Claude unavailable")
+        return local_trait_descriptions(image_b64, landmarks)
+
+async def run_jobs(queue: EnrollmentJobQueue, jobs):
+    for _ in range(500):
+        if all(job.finished for job in jobs):
+            break
+        await asyncio.sleep(0.01)
+    await queue.close()
+
+def make_queue(describe, store, max_attempts: int = 4):
+    analyze = Analyzer()
+    completed = []
+    enricher = EnrollmentEnricher(analyze, describe, store, on_complete=completed.append)
+    queue = EnrollmentJobQueue(enricher, concurrency=2, max_attempts=max_attempts,
+                               backoff_seconds=0.01, max_backoff_seconds=0.05)
+    return queue, analyze, completed
+
+def test_connection_job_writes_every_field_to_its_row():
+    store = InMemoryEnrollmentStore()
+
+    async def scenario():
+        queue, analyze, completed = make_queue(local_trait_descriptions, store)
+        job = queue.submit("connection", "user-1", b"image", (10, 50, 50, 10), record_id="conn-1")
+        await run_jobs(queue, [job])
+        return queue, job, completed
+
+    queue, job, completed = asyncio.run(scenario())
+    assert job.status == "done" and job.attempts == 1 and job.stored
+    assert completed == [job]
+    assert store.rows[("connections", "conn-1")] == {
+        "facial_traits": FEATURES["facial_traits"],
+        "trait_descriptions": local_trait_descriptions("", None),
+        "landmark_data": FEATURES["landmark_data"],
+        "caricature_highlights": FEATURES["caricature_highlights"]
+    }
+    assert job.image_bytes is None and job.face_jpeg is None
+    assert queue.stats()["completed"] == 1
+
+def test_failed_attempts_retry_with_backoff_and_resume():
+    store = InMemoryEnrollmentStore()
+    describe = FlakyDescriber(failures=2)
+
+    async def scenario():
+        queue, analyze, _ = make_queue(describe, store)
+        job = queue.submit("face", "user-1", b"image", record_id="face-1")
+        await run_jobs(queue, [job])
+        return queue, analyze, job
+
+    queue, analyze, job = asyncio.run(scenario())
+    assert job.status == "done" and job.attempts == 3 and job.error is None
+    assert queue.retries == 2 and describe.calls == 3
+    # Landmarks computed on the first attempt are reused by the retries
+    assert analyze.calls == 1
+    assert store.rows[("faces", "face-1")]["traits"] == local_trait_descriptions("", None)
+
+def test_last_attempt_falls_back_to_generic_traits():
+    store = InMemoryEnrollmentStore()
+
+    async def scenario():
+        queue, _, _ = make_queue(FlakyDescriber(failures=10), store, max_attempts=2)
+        job = queue.submit("connection", "user-1", b"image", record_id="conn-1")
+        await run_jobs(queue, [job])
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.status == "done" and job.attempts == 2
+    assert store.rows[("connections", "conn-1")]["trait_descriptions"] == ["distinctive features", "memorable appearance"]
+
+def test_retry_delay_doubles_up_to_the_cap():
+    queue = EnrollmentJobQueue(lambda job: None, backoff_seconds=1.0, max_backoff_seconds=4.0)
+    for attempts, full_delay in [(1, 1.0), (2, 2.0), (3, 4.0), (6, 4.0)]:
+        delay = queue._retry_delay(attempts)
+        assert 0.5 * full_delay <= delay <= full_delay
+
+def test_job_without_connection_id_keeps_results_on_the_job():
+    store = InMemoryEnrollmentStore()
+
+    async def scenario():
+        queue, _, completed = make_queue(local_trait_descriptions, store)
+        job = queue.submit("connection", "user-1", b"image")
+        await run_jobs(queue, [job])
+        return queue, job, completed
+
+    queue, job, completed = asyncio.run(scenario())
+    assert job.status == "done" and completed == [job]
+    assert store.rows == {}
+    assert job.to_dict()["result"]["caricature_highlights"] == FEATURES["caricature_highlights"]
+    assert queue.get(job.job_id) is job
+
+def test_submit_is_refused_once_max_queued_jobs_are_unfinished():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def process(job):
+            await release.wait()
+
+        queue = EnrollmentJobQueue(process, concurrency=1, max_queued=2)
+        jobs = [queue.submit("face", "user-1", b"image") for _ in range(2)]
+        with pytest.raises(EnrollmentQueueFullError):
+            queue.submit("face", "user-1", b"image")
+        release.set()
+        await run_jobs(queue, jobs)
+        # Finished jobs free their places
+        queue.check_capacity()
+        return queue
+
+    queue = asyncio.run(scenario())
+    stats = queue.stats()
+    assert stats["rejected"] == 1 and stats["unfinished"] == 0 and stats["completed"] == 2
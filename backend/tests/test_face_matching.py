@@ -0,0 +1,96 @@
+"""
+FaceMatcher agreement with exact search, slot reuse and compaction across the exact, IVF and HNSW matchers
+
+Run from the backend directory:
+    python -m pytest tests
+"""
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from face_matching import create_matcher, load_matcher
+
+DIM = 16
+KINDS = [
+    ("exact", {}),
+    ("ivf_flat", {"nlist": 4, "nprobe": 4, "min_train_size": 20}),
+    ("hnsw", {"M": 8, "ef_construction": 64, "ef_search": 64}),
+]
+
+def gallery(size: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((size, DIM)).astype(np.float32)
+
+def build(kind: str, params, vectors: np.ndarray):
+    matcher = create_matcher(kind, DIM, "euclidean", **params)
+    matcher.add([f"c{i}" for i in range(len(vectors))], vectors)
+    return matcher
+
+@pytest.mark.parametrize("kind,params", KINDS)
+def test_repeated_updates_keep_the_size_bounded(kind, params):
+    vectors = gallery(50)
+    matcher = build(kind, params, vectors)
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        ids = [f"c{i}" for i in rng.choice(50, 10, replace=False)]
+        matcher.add(ids, rng.standard_normal((10, DIM)).astype(np.float32))
+    assert matcher.capacity == 50 and len(matcher) == 50
+    assert matcher._alive[:matcher.capacity].all()
+
+@pytest.mark.parametrize("kind,params", KINDS)
+def test_updated_vector_is_found_at_its_new_position(kind, params):
+    vectors = gallery(50)
+    matcher = build(kind, params, vectors)
+    matcher.add(["c7"], vectors[30:31] + 0.01)
+    [(connection_id, distance)] = matcher.search(vectors[30:31] + 0.01, k=1)[0]
+    assert connection_id == "c7" and distance == pytest.approx(0.0, abs=1e-4)
+    assert all(hit[0][0] != "c7" for hit in matcher.search(vectors[7:8], k=1))
+
+@pytest.mark.parametrize("kind,params", KINDS)
+def test_removed_slots_are_compacted(kind, params):
+    vectors = gallery(200)
+    matcher = build(kind, params, vectors)
+    matcher.COMPACT_MIN_DEAD = 10
+    matcher.remove([f"c{i}" for i in range(0, 200, 2)])
+    assert len(matcher) == 100 and matcher.capacity < 200
+    for i in range(1, 200, 2):
+        assert matcher.search(vectors[i:i + 1], k=1)[0][0][0] == f"c{i}"
+
+@pytest.mark.parametrize("kind,params", KINDS)
+def test_compacted_matcher_round_trips_through_save(kind, params, tmp_path):
+    vectors = gallery(60)
+    matcher = build(kind, params, vectors)
+    matcher.remove([f"c{i}" for i in range(30)])
+    matcher.compact()
+    path = str(tmp_path / "matcher.npz")
+    matcher.save(path)
+    loaded = load_matcher(path)
+    assert loaded.search(vectors[40:41], k=1)[0][0][0] == "c40"
+
+def exact_top1(vectors: np.ndarray, queries: np.ndarray):
+    exact = build("exact", {}, vectors)
+    return [hits[0][0] for hits in exact.search(queries, k=1)]
+
+def test_ivf_probing_every_list_agrees_with_exact():
+    vectors, queries = gallery(300), gallery(40, seed=1)
+    ivf = build("ivf_flat", {"nlist": 8, "nprobe": 8, "min_train_size": 100}, vectors)
+    assert ivf.is_trained
+    assert [hits[0][0] for hits in ivf.search(queries, k=1)] == exact_top1(vectors, queries)
+
+def test_approximate_matchers_mostly_agree_with_exact():
+    vectors, queries = gallery(300), gallery(40, seed=1)
+    expected = exact_top1(vectors, queries)
+    for kind, params in KINDS[1:]:
+        matcher = build(kind, {**params, "min_train_size": 100} if kind == "ivf_flat" else params, vectors)
+        found = [hits[0][0] for hits in matcher.search(queries, k=1)]
+        assert np.mean([a == b for a, b in zip(found, expected)]) >= 0.9, kind
+
+@pytest.mark.parametrize("kind,params", KINDS)
+def test_scores_are_euclidean_distances(kind, params):
+    vectors = gallery(50)
+    matcher = build(kind, params, vectors)
+    query = vectors[3:4] + 0.05
+    for connection_id, distance in matcher.search(query, k=3)[0]:
+        expected = np.linalg.norm(vectors[int(connection_id[1:])] - query[0])
+        assert distance == pytest.approx(expected, rel=1e-4)
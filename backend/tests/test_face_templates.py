@@ -0,0 +1,51 @@
+"""
+Face template lists: quality-capped add_template and the weighted template_centroid
+
+Run from the backend directory:
+    python -m pytest tests
+"""
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from face_templates import LEGACY_QUALITY, add_template, row_templates, template_centroid
+
+def test_add_template_keeps_the_best_by_quality():
+    templates = []
+    for i, quality in enumerate([0.2, 0.9, 0.5, 0.7]):
+        templates = add_template(templates, [float(i), 0.0], quality, max_exemplars=3)
+    assert sorted(t["quality"] for t in templates) == [0.5, 0.7, 0.9]
+    assert all(t["embedding"] != [0.0, 0.0] for t in templates)
+
+def test_add_template_drops_the_oldest_among_equal_quality():
+    templates = add_template([], [1.0, 0.0], 0.5, max_exemplars=2)
+    templates[0]["added_at"] -= 10
+    templates = add_template(templates, [2.0, 0.0], 0.5, max_exemplars=2)
+    templates = add_template(templates, [3.0, 0.0], 0.5, max_exemplars=2)
+    assert sorted(t["embedding"][0] for t in templates) == [2.0, 3.0]
+
+def test_add_template_does_not_modify_its_input():
+    templates = add_template([], [1.0, 0.0], 0.5)
+    add_template(templates, [0.0, 1.0], 0.9)
+    assert len(templates) == 1
+
+def test_centroid_is_quality_weighted_and_keeps_the_exemplar_scale():
+    templates = [{"embedding": [1.0, 0.0], "quality": 0.9}, {"embedding": [0.0, 1.0], "quality": 0.1}]
+    centroid = np.asarray(template_centroid(templates))
+    assert np.linalg.norm(centroid) == pytest.approx(1.0)
+    assert centroid[0] > 8 * centroid[1] > 0
+
+def test_zero_quality_exemplars_still_count():
+    centroid = template_centroid([{"embedding": [1.0, 0.0], "quality": 0.0}, {"embedding": [0.0, 1.0], "quality": 0.0}])
+    assert centroid[0] == pytest.approx(centroid[1])
+
+def test_centroid_of_no_templates_is_none():
+    assert template_centroid([]) is None
+
+def test_legacy_rows_read_as_a_single_exemplar():
+    assert row_templates({"face_embedding": [0.5, 0.5]}) == [{"embedding": [0.5, 0.5], "quality": LEGACY_QUALITY}]
+    assert row_templates({"face_embedding": None, "face_templates": None}) == []
+    templates = add_template([], [1.0, 0.0], 0.8)
+    assert row_templates({"face_embedding": [0.5, 0.5], "face_templates": templates}) == templates
@@ -0,0 +1,71 @@
+"""
+TrainingImageCache load deduplication and disk accounting, using local image files
+
+Run from the backend directory:
+    python -m pytest tests
+"""
+import os
+import sys
+import threading
+import pytest
+
+pytest.importorskip("requests")
+Image = pytest.importorskip("PIL.Image")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from image_cache import TrainingImageCache
+
+def write_image(path: str, colour) -> str:
+    Image.new("RGB", (32, 32), colour).save(path, format="PNG")
+    return path
+
+def disk_bytes(cache: TrainingImageCache) -> int:
+    return sum(os.path.getsize(cache._object_path(digest)) for digest in set(cache._load_index().values()))
+
+def test_concurrent_gets_of_one_url_load_it_once(tmp_path):
+    url = write_image(str(tmp_path / "face.png"), (200, 100, 50))
+    cache = TrainingImageCache(cache_dir=str(tmp_path / "cache"))
+    fetches = []
+    release = threading.Event()
+    fetch = cache._fetch
+
+    def slow_fetch(source):
+        fetches.append(source)
+        release.wait(5)
+        return fetch(source)
+
+    cache._fetch = slow_fetch
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(url))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    # The lock is free while the first load is fetching
+    assert cache.stats()["memory_items"] == 0
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert fetches == [url] and len(results) == 4
+    assert all(image is results[0] and image.shape == (256, 256, 3) for image in results)
+    assert cache.downloads == 1 and cache._loading == {}
+
+def test_disk_bytes_running_total_tracks_writes_and_evictions(tmp_path):
+    urls = [write_image(str(tmp_path / f"face{i}.png"), (i * 40, 0, 0)) for i in range(4)]
+    cache = TrainingImageCache(cache_dir=str(tmp_path / "cache"), max_memory_items=1)
+    for url in urls:
+        assert cache.get(url) is not None
+    assert cache.stats()["disk_bytes"] == disk_bytes(cache)
+
+    cache.max_disk_bytes = disk_bytes(cache) // 2
+    cache.get(write_image(str(tmp_path / "late.png"), (0, 0, 255)))
+    stats = cache.stats()
+    assert stats["disk_evictions"] > 0
+    assert stats["disk_bytes"] == disk_bytes(cache) <= cache.max_disk_bytes
+
+    reopened = TrainingImageCache(cache_dir=str(tmp_path / "cache"))
+    assert reopened.stats()["disk_bytes"] == stats["disk_bytes"]
+
+def test_failed_load_is_not_cached(tmp_path):
+    cache = TrainingImageCache(cache_dir=str(tmp_path / "cache"))
+    assert cache.get(str(tmp_path / "missing.png")) is None
+    assert cache.failures == 1 and cache._loading == {} and cache.stats()["memory_items"] == 0
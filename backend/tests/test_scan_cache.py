@@ -0,0 +1,67 @@
+"""
+ScanResponseCache perceptual-hash lookups and invalidation generations
+
+Run from the backend directory:
+    python -m pytest tests
+"""
+import os
+import sys
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scan_cache import ScanResponseCache, perceptual_hash
+
+def frame(shift: int = 0, brightness: int = 0) -> bytes:
+    image = np.zeros((240, 320, 3), dtype=np.uint8)
+    cv2.circle(image, (120 + shift, 120), 60, (200, 180, 160), -1)
+    cv2.rectangle(image, (220, 40), (300, 200), (60, 90, 200), -1)
+    image = cv2.add(image, np.full_like(image, brightness))
+    return cv2.imencode(".jpg", image)[1].tobytes()
+
+def test_similar_frames_hash_close_and_different_frames_far():
+    base = perceptual_hash(frame())
+    assert (base ^ perceptual_hash(frame(brightness=20))).bit_count() <= 4
+    assert (base ^ perceptual_hash(frame(shift=100))).bit_count() > 4
+    assert perceptual_hash(b"not an image") is None
+
+def test_hit_needs_a_close_hash_and_the_same_variant():
+    cache = ScanResponseCache(ttl_seconds=60)
+    generation = cache.generation("u1")
+    cache.put("u1", 0b1111, "fast", {"faces": []}, generation)
+    response, age = cache.get("u1", 0b0111, "fast")
+    assert response == {"faces": []} and age >= 0
+    assert cache.get("u1", 0b1111, "full") is None
+    assert cache.get("u1", 0b1111 ^ 0xFFFF, "fast") is None
+    assert cache.get("u2", 0b1111, "fast") is None
+
+def test_invalidate_drops_responses_and_rejects_ones_computed_before_it():
+    cache = ScanResponseCache(ttl_seconds=60)
+    cache.put("u1", 1, "fast", "old", cache.generation("u1"))
+    in_flight = cache.generation("u1")
+    cache.invalidate("u1")
+    assert cache.get("u1", 1, "fast") is None
+
+    # A scan that started before the invalidation must not repopulate the cache
+    cache.put("u1", 1, "fast", "stale", in_flight)
+    assert cache.get("u1", 1, "fast") is None
+    cache.put("u1", 1, "fast", "fresh", cache.generation("u1"))
+    assert cache.get("u1", 1, "fast")[0] == "fresh"
+    assert cache.stats()["invalidations"] == 1
+
+def test_other_users_keep_their_responses():
+    cache = ScanResponseCache(ttl_seconds=60)
+    cache.put("u2", 1, "fast", "kept", cache.generation("u2"))
+    cache.invalidate("u1")
+    assert cache.get("u2", 1, "fast")[0] == "kept"
+
+def test_expired_and_disabled_caches_miss():
+    cache = ScanResponseCache(ttl_seconds=60)
+    cache.put("u1", 1, "fast", "old", cache.generation("u1"))
+    stored_at, *rest = cache._entries["u1"][0]
+    cache._entries["u1"][0] = (stored_at - 61, *rest)
+    assert cache.get("u1", 1, "fast") is None
+
+    disabled = ScanResponseCache(ttl_seconds=0)
+    disabled.put("u1", 1, "fast", "old", 0)
+    assert disabled.get("u1", 1, "fast") is None and disabled.stats()["responses"] == 0
@@ -0,0 +1,68 @@
+"""
+TemplateRefiner observation batching and EMA flushes against a resident EmbeddingIndexCache
+
+Run from the backend directory:
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_index import EmbeddingIndexCache
+from enrollment_jobs import InMemoryEnrollmentStore
+from template_refinement import TemplateRefiner
+
+def rows():
+    return [{"id": "a", "name": "A", "face_embedding": [1.0, 0.0, 0.0]},
+            {"id": "b", "name": "B", "face_embedding": [0.0, 1.0, 0.0]}]
+
+def make_refiner(**params):
+    gallery = EmbeddingIndexCache(lambda user_id: rows())
+    gallery.get("u1")
+    store = InMemoryEnrollmentStore()
+    return TemplateRefiner(gallery, store, enabled=True, **params), gallery, store
+
+def test_flush_moves_the_centroid_by_the_ema_weight_and_writes_it():
+    refiner, gallery, store = make_refiner(alpha=0.5)
+    refiner.observe("u1", "a", [0.0, 0.0, 1.0], 0.9)
+    refiner.observe("u1", "a", [0.0, 0.0, 1.0], 0.9)
+    assert asyncio.run(refiner.flush()) == 1
+
+    # Two observations move it 1 - (1 - 0.5)^2 = 75% of the way, at the old norm
+    expected = np.array([0.25, 0.0, 0.75])
+    expected /= np.linalg.norm(expected)
+    centroid = gallery.centroid("u1", "a")
+    assert centroid == pytest.approx(expected, abs=1e-6)
+    assert store.rows[("connections", "a")]["face_embedding"] == pytest.approx(expected.tolist(), abs=1e-6)
+    assert gallery.centroid("u1", "b").tolist() == [0.0, 1.0, 0.0]
+    assert refiner.stats()["pending"] == 0 and refiner.written == 1
+
+def test_weak_and_pending_matches_are_ignored():
+    refiner, _, _ = make_refiner(min_confidence=0.7)
+    refiner.observe("u1", "a", [0.0, 0.0, 1.0], 0.5)
+    refiner.observe("u1", "pending:1", [0.0, 0.0, 1.0], 0.9)
+    assert refiner.observed == 0 and asyncio.run(refiner.flush()) == 0
+
+def test_flush_writes_at_most_max_writes_connections():
+    refiner, _, _ = make_refiner(max_writes=1)
+    refiner.observe("u1", "a", [0.0, 0.0, 1.0], 0.9)
+    refiner.observe("u1", "b", [0.0, 0.0, 1.0], 0.9)
+    assert asyncio.run(refiner.flush()) == 1
+    assert refiner.stats()["pending"] == 1
+    assert asyncio.run(refiner.flush()) == 1
+
+def test_observations_of_unloaded_users_are_discarded():
+    refiner, gallery, store = make_refiner()
+    refiner.observe("u1", "a", [0.0, 0.0, 1.0], 0.9)
+    gallery.invalidate("u1")
+    assert asyncio.run(refiner.flush()) == 0
+    assert refiner.discarded == 1 and store.rows == {}
+
+def test_observations_beyond_max_pending_are_dropped():
+    refiner, _, _ = make_refiner(max_pending=1)
+    refiner.observe("u1", "a", [0.0, 0.0, 1.0], 0.9)
+    refiner.observe("u1", "b", [0.0, 0.0, 1.0], 0.9)
+    assert refiner.dropped == 1 and refiner.stats()["pending"] == 1
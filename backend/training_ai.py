@@ -4,17 +4,38 @@ Generates face recognition training exercises with auto-generated content
 """
 import cv2
 import numpy as np
+import os
 import random
 import base64
 import io
-from PIL import Image, ImageDraw, ImageFilter
+from PIL import Image, ImageDraw
 from typing import Dict, List, Optional, Tuple
 import logging
-import requests
-from urllib.parse import urlparse
+from image_cache import TrainingImageCache
+from distortion import DistortionEngine, EyeCenters, eye_centers_from_landmarks
+from morphing import MorphEngine
 
 logger = logging.getLogger(__name__)
 
+# Response image encodings: format -> (mime type, cv2 extension, cv2 quality flag)
+IMAGE_FORMATS = {
+    "jpeg": ("image/jpeg", ".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": ("image/webp", ".webp", cv2.IMWRITE_WEBP_QUALITY)
+}
+
+def encode_data_url(image: np.ndarray, image_format: str = "jpeg", quality: int = 85) -> str:
+    """Encode an RGB array as a base64 data URL; the one encode an exercise image gets"""
+    mime_type, extension, quality_flag = IMAGE_FORMATS[image_format]
+    _, buffer = cv2.imencode(extension, cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [quality_flag, quality])
+    return f"data:{mime_type};base64,{base64.b64encode(buffer).decode()}"
+
+def decode_data_url(image_b64: str) -> np.ndarray:
+    """Decode a base64 (or data URL) image to an RGB array"""
+    if image_b64.startswith('data:image'):
+        image_b64 = image_b64.split(',')[1]
+    image = Image.open(io.BytesIO(base64.b64decode(image_b64)))
+    return np.asarray(image.convert('RGB'))
+
 class AdaptiveDifficultyManager:
     """Manages adaptive difficulty for training modules"""
     
@@ -38,126 +59,92 @@ class AdaptiveDifficultyManager:
         # Maintain current level if performance is moderate
         return current_level
 
+# Built-in faces used when a user has no connections yet
+SAMPLE_FACES = [
+    {
+        "id": "sample_1",
+        "name": "Alex Chen",
+        "image_url": "https://images.pexels.com/photos/2379004/pexels-photo-2379004.jpeg?auto=compress&cs=tinysrgb&w=400",
+        "traits": ["expressive eyes", "defined jawline", "warm smile"],
+        "description": "Friendly colleague with distinctive features"
+    },
+    {
+        "id": "sample_2", 
+        "name": "Jordan Smith",
+        "image_url": "https://images.pexels.com/photos/1222271/pexels-photo-1222271.jpeg?auto=compress&cs=tinysrgb&w=400",
+        "traits": ["gentle features", "kind eyes", "soft smile"],
+        "description": "Approachable person with memorable characteristics"
+    },
+    {
+        "id": "sample_3",
+        "name": "Taylor Johnson", 
+        "image_url": "https://images.pexels.com/photos/1239291/pexels-photo-1239291.jpeg?auto=compress&cs=tinysrgb&w=400",
+        "traits": ["strong features", "confident expression", "distinctive nose"],
+        "description": "Professional with striking facial structure"
+    },
+    {
+        "id": "sample_4",
+        "name": "Casey Williams",
+        "image_url": "https://images.pexels.com/photos/1681010/pexels-photo-1681010.jpeg?auto=compress&cs=tinysrgb&w=400", 
+        "traits": ["bright eyes", "friendly smile", "oval face"],
+        "description": "Cheerful individual with memorable features"
+    },
+    {
+        "id": "sample_5",
+        "name": "Morgan Davis",
+        "image_url": "https://images.pexels.com/photos/1043471/pexels-photo-1043471.jpeg?auto=compress&cs=tinysrgb&w=400",
+        "traits": ["angular features", "intense gaze", "prominent cheekbones"], 
+        "description": "Distinguished person with sharp characteristics"
+    },
+    {
+        "id": "sample_6",
+        "name": "Riley Brown",
+        "image_url": "https://images.pexels.com/photos/1212984/pexels-photo-1212984.jpeg?auto=compress&cs=tinysrgb&w=400",
+        "traits": ["round face", "cheerful expression", "dimpled smile"],
+        "description": "Warm personality with distinctive smile"
+    }
+]
+
 class FaceGenerator:
     """Generates sample faces for training when user has no connections"""
     
-    def __init__(self):
-        self.sample_faces = [
-            {
-                "id": "sample_1",
-                "name": "Alex Chen",
-                "image_url": "https://images.pexels.com/photos/2379004/pexels-photo-2379004.jpeg?auto=compress&cs=tinysrgb&w=400",
-                "traits": ["expressive eyes", "defined jawline", "warm smile"],
-                "description": "Friendly colleague with distinctive features"
-            },
-            {
-                "id": "sample_2", 
-                "name": "Jordan Smith",
-                "image_url": "https://images.pexels.com/photos/1222271/pexels-photo-1222271.jpeg?auto=compress&cs=tinysrgb&w=400",
-                "traits": ["gentle features", "kind eyes", "soft smile"],
-                "description": "Approachable person with memorable characteristics"
-            },
-            {
-                "id": "sample_3",
-                "name": "Taylor Johnson", 
-                "image_url": "https://images.pexels.com/photos/1239291/pexels-photo-1239291.jpeg?auto=compress&cs=tinysrgb&w=400",
-                "traits": ["strong features", "confident expression", "distinctive nose"],
-                "description": "Professional with striking facial structure"
-            },
-            {
-                "id": "sample_4",
-                "name": "Casey Williams",
-                "image_url": "https://images.pexels.com/photos/1681010/pexels-photo-1681010.jpeg?auto=compress&cs=tinysrgb&w=400", 
-                "traits": ["bright eyes", "friendly smile", "oval face"],
-                "description": "Cheerful individual with memorable features"
-            },
-            {
-                "id": "sample_5",
-                "name": "Morgan Davis",
-                "image_url": "https://images.pexels.com/photos/1043471/pexels-photo-1043471.jpeg?auto=compress&cs=tinysrgb&w=400",
-                "traits": ["angular features", "intense gaze", "prominent cheekbones"], 
-                "description": "Distinguished person with sharp characteristics"
-            },
-            {
-                "id": "sample_6",
-                "name": "Riley Brown",
-                "image_url": "https://images.pexels.com/photos/1212984/pexels-photo-1212984.jpeg?auto=compress&cs=tinysrgb&w=400",
-                "traits": ["round face", "cheerful expression", "dimpled smile"],
-                "description": "Warm personality with distinctive smile"
-            }
-        ]
+    def __init__(self, image_cache: Optional[TrainingImageCache] = None):
+        self.sample_faces = SAMPLE_FACES
+        self.image_cache = image_cache or TrainingImageCache.from_env()
+        self.distortion_engine = DistortionEngine()
     
     def get_sample_faces(self) -> List[Dict]:
         """Return list of sample faces for training"""
         return self.sample_faces
     
+    def load_image(self, image_url: str) -> Optional[np.ndarray]:
+        """Return a read-only 256x256 RGB array, from the local cache when possible"""
+        return self.image_cache.get(image_url)
+    
     def download_and_encode_image(self, image_url: str) -> Optional[str]:
-        """Download image from URL and encode as base64"""
-        try:
-            response = requests.get(image_url, timeout=10)
-            if response.status_code == 200:
-                # Convert to PIL Image
-                image = Image.open(io.BytesIO(response.content))
-                
-                # Resize to standard size
-                image = image.resize((256, 256), Image.Resampling.LANCZOS)
-                
-                # Convert to RGB if needed
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                
-                # Encode to base64
-                buffer = io.BytesIO()
-                image.save(buffer, format='JPEG', quality=85)
-                img_str = base64.b64encode(buffer.getvalue()).decode()
-                return f"data:image/jpeg;base64,{img_str}"
-            
-        except Exception as e:
-            logger.error(f"Error downloading image {image_url}: {e}")
-        
-        return None
+        """Load an image through the cache and encode it as a base64 JPEG data URL"""
+        image = self.load_image(image_url)
+        return encode_data_url(image) if image is not None else None
+    
+    def distort_image(self, image: np.ndarray, distortion_type: str, intensity: float = 0.3,
+                      eye_centers: Optional[EyeCenters] = None) -> np.ndarray:
+        """Return a distorted copy of an RGB image array"""
+        return self.distortion_engine.distort(image, distortion_type, intensity, eye_centers)
+    
+    def distort_variants(self, image: np.ndarray, variants: List[Tuple[str, float]],
+                         eye_centers: Optional[EyeCenters] = None) -> List[np.ndarray]:
+        """Render several (distortion_type, intensity) variants of an image in one pass"""
+        return self.distortion_engine.distort_batch(image, variants, eye_centers)
+    
+    def eye_centers(self, face: Dict, image: np.ndarray) -> Optional[EyeCenters]:
+        """Eye positions from a face's stored landmarks, scaled to the loaded image"""
+        height, width = image.shape[:2]
+        return eye_centers_from_landmarks(face.get("landmark_data"), (width, height))
     
     def create_distorted_image(self, base64_image: str, distortion_type: str, intensity: float = 0.3) -> Optional[str]:
-        """Create a distorted version of the image"""
+        """Create a distorted version of a base64 image"""
         try:
-            # Decode base64 image
-            if base64_image.startswith('data:image'):
-                base64_image = base64_image.split(',')[1]
-            
-            image_data = base64.b64decode(base64_image)
-            image = Image.open(io.BytesIO(image_data))
-            
-            # Apply distortion based on type
-            if distortion_type == "eye_spacing":
-                # Simulate wider eye spacing by stretching horizontally
-                width, height = image.size
-                new_width = int(width * (1 + intensity * 0.5))
-                image = image.resize((new_width, height), Image.Resampling.LANCZOS)
-                image = image.crop((int((new_width - width) / 2), 0, int((new_width + width) / 2), height))
-                
-            elif distortion_type == "face_width":
-                # Make face appear wider
-                width, height = image.size
-                new_width = int(width * (1 + intensity))
-                image = image.resize((new_width, height), Image.Resampling.LANCZOS)
-                image = image.crop((int((new_width - width) / 2), 0, int((new_width + width) / 2), height))
-                
-            elif distortion_type == "brightness":
-                # Adjust brightness
-                from PIL import ImageEnhance
-                enhancer = ImageEnhance.Brightness(image)
-                image = enhancer.enhance(1 + intensity)
-                
-            elif distortion_type == "blur":
-                # Apply slight blur
-                image = image.filter(ImageFilter.GaussianBlur(radius=intensity * 2))
-            
-            # Encode back to base64
-            buffer = io.BytesIO()
-            image.save(buffer, format='JPEG', quality=85)
-            img_str = base64.b64encode(buffer.getvalue()).decode()
-            return f"data:image/jpeg;base64,{img_str}"
-            
+            return encode_data_url(self.distort_image(decode_data_url(base64_image), distortion_type, intensity))
         except Exception as e:
             logger.error(f"Error creating distorted image: {e}")
             return None
@@ -165,9 +152,27 @@ class FaceGenerator:
 class TrainingAI:
     """Main AI training system"""
     
-    def __init__(self):
+    def __init__(self, image_format: Optional[str] = None, image_quality: Optional[int] = None):
         self.face_generator = FaceGenerator()
         self.difficulty_manager = AdaptiveDifficultyManager()
+        self.morph_engine = MorphEngine()
+        # Exercises keep images as arrays and encode once, in this format
+        self.image_format = image_format or os.getenv("TRAINING_IMAGE_FORMAT", "jpeg")
+        self.image_quality = image_quality or int(os.getenv("TRAINING_IMAGE_QUALITY", "85"))
+        if self.image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported training image format: {self.image_format}")
+    
+    def encode_image(self, image: np.ndarray) -> str:
+        """Encode an exercise image for the response"""
+        return encode_data_url(image, self.image_format, self.image_quality)
+    
+    def _distort_or_original(self, image: np.ndarray, variants: List[Tuple[str, float]],
+                             eye_centers: Optional[EyeCenters] = None) -> List[np.ndarray]:
+        try:
+            return self.face_generator.distort_variants(image, variants, eye_centers)
+        except Exception as e:
+            logger.error(f"Error creating distorted images: {e}")
+            return [image] * len(variants)
     
     def generate_caricature_exercise(self, target_face: Dict, difficulty_level: int, available_faces: List[Dict]) -> Dict:
         """Generate caricature training exercise"""
@@ -181,20 +186,16 @@ class TrainingAI:
             
             target_face = random.choice(available_faces)
             
-            # Download and encode original image
-            original_image_b64 = self.face_generator.download_and_encode_image(target_face["image_url"])
-            if not original_image_b64:
+            # Load original image (decoded, from the image cache)
+            original_image = self.face_generator.load_image(target_face["image_url"])
+            if original_image is None:
                 return {"error": "Failed to load training image"}
             
-            # Create exaggerated version
+            # Create exaggerated version, falling back to the original
             distortion_types = ["eye_spacing", "face_width", "brightness"]
             distortion_type = random.choice(distortion_types)
-            modified_image_b64 = self.face_generator.create_distorted_image(
-                original_image_b64, distortion_type, 0.4
-            )
-            
-            if not modified_image_b64:
-                modified_image_b64 = original_image_b64  # Fallback to original
+            eye_centers = self.face_generator.eye_centers(target_face, original_image)
+            modified_image = self._distort_or_original(original_image, [(distortion_type, 0.4)], eye_centers)[0]
             
             # Generate question and options
             feature_focus = {
@@ -217,8 +218,8 @@ class TrainingAI:
             return {
                 "exercise_type": "caricature",
                 "question": question,
-                "original_image": original_image_b64,
-                "modified_image": modified_image_b64,
+                "original_image": self.encode_image(original_image),
+                "modified_image": self.encode_image(modified_image),
                 "options": options,
                 "correct_index": correct_index,
                 "level": difficulty_level,
@@ -246,36 +247,25 @@ class TrainingAI:
             
             target_face = random.choice(available_faces)
             
-            # Download original image
-            original_image_b64 = self.face_generator.download_and_encode_image(target_face["image_url"])
-            if not original_image_b64:
+            # Load original image
+            original_image = self.face_generator.load_image(target_face["image_url"])
+            if original_image is None:
                 return {"error": "Failed to load training image"}
             
             # Create variations with different spacing
-            variations = []
             distortion_types = ["eye_spacing", "face_width", "brightness", "blur"]
             
-            # Add original as one option
-            variations.append(original_image_b64)
+            # Add original as one option, then the distorted versions,
+            # rendered together (varying intensities)
+            distortions = [(random.choice(distortion_types), 0.2 + (i * 0.1)) for i in range(3)]
+            eye_centers = self.face_generator.eye_centers(target_face, original_image)
+            variations = [original_image] + self._distort_or_original(original_image, distortions, eye_centers)
             
-            # Create distorted versions
-            for i in range(3):
-                distortion_type = random.choice(distortion_types)
-                intensity = 0.2 + (i * 0.1)  # Varying intensities
-                distorted = self.face_generator.create_distorted_image(
-                    original_image_b64, distortion_type, intensity
-                )
-                variations.append(distorted or original_image_b64)
-            
-            # Shuffle and track correct answer
-            correct_index = 0  # Original is always correct
-            random.shuffle(variations)
-            
-            # Find where original ended up after shuffle
-            for i, variation in enumerate(variations):
-                if variation == original_image_b64:
-                    correct_index = i
-                    break
+            # Shuffle and track where the original (index 0) ended up
+            order = list(range(len(variations)))
+            random.shuffle(order)
+            correct_index = order.index(0)
+            variations = [self.encode_image(variations[i]) for i in order]
             
             question = f"Which image shows {target_face['name']} with the most natural facial proportions?"
             
@@ -307,9 +297,9 @@ class TrainingAI:
             
             target_face = random.choice(available_faces)
             
-            # Download image
-            face_image_b64 = self.face_generator.download_and_encode_image(target_face["image_url"])
-            if not face_image_b64:
+            # Load image
+            face_image = self.face_generator.load_image(target_face["image_url"])
+            if face_image is None:
                 return {"error": "Failed to load training image"}
             
             # Get target traits
@@ -347,7 +337,7 @@ class TrainingAI:
             return {
                 "exercise_type": "trait_identification",
                 "question": question,
-                "face_image": face_image_b64,
+                "face_image": self.encode_image(face_image),
                 "options": options,
                 "correct_indices": correct_indices,
                 "is_multiple_choice": True,
@@ -378,15 +368,20 @@ class TrainingAI:
             face1 = random.choice(available_faces)
             face2 = random.choice([f for f in available_faces if f["id"] != face1["id"]])
             
-            # Download images
-            image1_b64 = self.face_generator.download_and_encode_image(face1["image_url"])
-            image2_b64 = self.face_generator.download_and_encode_image(face2["image_url"])
+            # Load images
+            image1 = self.face_generator.load_image(face1["image_url"])
+            image2 = self.face_generator.load_image(face2["image_url"])
             
-            if not image1_b64 or not image2_b64:
+            if image1 is None or image2 is None:
                 return {"error": "Failed to load training images"}
             
-            # Create a simple "morph" by blending
-            morphed_image_b64 = self.create_simple_morph(image1_b64, image2_b64)
+            # Warp both faces onto their mean landmark shape before blending;
+            # landmarks are cached per image, stored ones are used when present
+            morphed_image = self.morph_engine.morph(
+                image1, image2, 0.5,
+                key1=face1["image_url"], key2=face2["image_url"],
+                landmark_data1=face1.get("landmark_data"), landmark_data2=face2.get("landmark_data")
+            )
             
             # Generate options
             options = [
@@ -403,7 +398,7 @@ class TrainingAI:
             return {
                 "exercise_type": "morph_matching",
                 "question": question,
-                "morphed_image": morphed_image_b64,
+                "morphed_image": self.encode_image(morphed_image),
                 "options": options,
                 "correct_index": correct_index,
                 "level": difficulty_level,
@@ -414,40 +409,20 @@ class TrainingAI:
             logger.error(f"Error generating morph matching exercise: {e}")
             return {"error": f"Exercise generation failed: {str(e)}"}
     
+    def blend_images(self, image1: np.ndarray, image2: np.ndarray, alpha: float = 0.5) -> np.ndarray:
+        """Create a simple morph by blending two RGB arrays (alpha weights image2)"""
+        # Ensure same size
+        size = (256, 256)
+        if image1.shape[:2] != size:
+            image1 = cv2.resize(image1, size, interpolation=cv2.INTER_LANCZOS4)
+        if image2.shape[:2] != size:
+            image2 = cv2.resize(image2, size, interpolation=cv2.INTER_LANCZOS4)
+        return cv2.addWeighted(image1, 1 - alpha, image2, alpha, 0)
+    
     def create_simple_morph(self, image1_b64: str, image2_b64: str, alpha: float = 0.5) -> Optional[str]:
-        """Create a simple morph by blending two images"""
+        """Create a landmark-aligned morph of two base64 images"""
         try:
-            # Decode both images
-            if image1_b64.startswith('data:image'):
-                image1_b64 = image1_b64.split(',')[1]
-            if image2_b64.startswith('data:image'):
-                image2_b64 = image2_b64.split(',')[1]
-            
-            image1_data = base64.b64decode(image1_b64)
-            image2_data = base64.b64decode(image2_b64)
-            
-            image1 = Image.open(io.BytesIO(image1_data))
-            image2 = Image.open(io.BytesIO(image2_data))
-            
-            # Ensure same size
-            size = (256, 256)
-            image1 = image1.resize(size, Image.Resampling.LANCZOS)
-            image2 = image2.resize(size, Image.Resampling.LANCZOS)
-            
-            # Convert to RGBA for blending
-            image1 = image1.convert('RGBA')
-            image2 = image2.convert('RGBA')
-            
-            # Blend images
-            blended = Image.blend(image1, image2, alpha)
-            blended = blended.convert('RGB')
-            
-            # Encode back to base64
-            buffer = io.BytesIO()
-            blended.save(buffer, format='JPEG', quality=85)
-            img_str = base64.b64encode(buffer.getvalue()).decode()
-            return f"data:image/jpeg;base64,{img_str}"
-            
+            return encode_data_url(self.morph_engine.morph(decode_data_url(image1_b64), decode_data_url(image2_b64), alpha))
         except Exception as e:
             logger.error(f"Error creating morph: {e}")
-            return None
\ No newline at end of file
+            return None
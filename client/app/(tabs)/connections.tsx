@@ -134,10 +134,7 @@ export default function ConnectionsScreen() {
       }
 
       let imageUrl = formData.image;
-      let faceEmbedding = null;
-      let facialTraits = {};
-      let traitDescriptions: string[] = [];
-      let landmarkData = {};
+      let imageBlob: Blob | null = null;
 
       if (editingConnection) {
         // Update existing connection
@@ -165,11 +162,11 @@ export default function ConnectionsScreen() {
           const fileName = `${user.id}/connection_${timestamp}.jpg`;
 
           const response = await fetch(formData.image);
-          const blob = await response.blob();
+          imageBlob = await response.blob();
 
           const { data: uploadData, error: uploadError } = await supabase.storage
             .from('connections')
-            .upload(fileName, blob, {
+            .upload(fileName, imageBlob, {
               contentType: 'image/jpeg',
             });
 
@@ -181,8 +178,26 @@ export default function ConnectionsScreen() {
             .getPublicUrl(fileName);
 
           imageUrl = urlData.publicUrl;
+        }
+
+        // Save to database first, so the backend's trait analysis can be written to the row
+        const { data: inserted, error: dbError } = await supabase
+          .from('connections')
+          .insert({
+            user_id: user.id,
+            name: formData.name.trim(),
+            image_url: imageUrl,
+            description: formData.description.trim() || null,
+            notes: formData.notes.trim() || null,
+          })
+          .select('id')
+          .single();
+
+        if (dbError) throw dbError;
 
-          // Try to get face analysis from backend
+        // Try to get face analysis from backend
+        let analyzing = false;
+        if (imageBlob && inserted) {
           try {
             const backendUrl = process.env.EXPO_PUBLIC_BACKEND_URL || 'http://localhost:8000';
             
@@ -192,7 +207,8 @@ export default function ConnectionsScreen() {
             formDataToSend.append('name', formData.name.trim());
             formDataToSend.append('role', formData.description.trim());
             formDataToSend.append('context', formData.notes.trim());
-            formDataToSend.append('file', blob, 'connection.jpg');
+            formDataToSend.append('connection_id', inserted.id);
+            formDataToSend.append('file', imageBlob, 'connection.jpg');
 
             const apiResponse = await fetch(`${backendUrl}/connections/add`, {
               method: 'POST',
@@ -201,11 +217,18 @@ export default function ConnectionsScreen() {
 
             if (apiResponse.ok) {
               const result = await apiResponse.json();
-              if (result.success && result.data) {
-                faceEmbedding = result.data.face_embedding || null;
-                facialTraits = result.data.facial_traits || {};
-                traitDescriptions = result.data.trait_descriptions || [];
-                landmarkData = result.data.landmark_data || {};
+              if (result.success && result.data?.face_embedding) {
+                // Facial traits, trait descriptions and landmarks are added to the row by a background job
+                const { error: embeddingError } = await supabase
+                  .from('connections')
+                  .update({
+                    face_embedding: result.data.face_embedding,
+                    face_templates: result.data.face_templates || [],
+                  })
+                  .eq('id', inserted.id);
+
+                if (embeddingError) throw embeddingError;
+                analyzing = true;
               }
             }
           } catch (backendError) {
@@ -214,28 +237,10 @@ export default function ConnectionsScreen() {
           }
         }
 
-        // Save to database
-        const { error: dbError } = await supabase
-          .from('connections')
-          .insert({
-            user_id: user.id,
-            name: formData.name.trim(),
-            image_url: imageUrl,
-            description: formData.description.trim() || null,
-            notes: formData.notes.trim() || null,
-            face_embedding: faceEmbedding,
-            facial_traits: facialTraits,
-            trait_descriptions: traitDescriptions,
-            landmark_data: landmarkData,
-          });
-
-        if (dbError) throw dbError;
-
-        // Show success message with traits if available
-        if (traitDescriptions.length > 0) {
+        if (analyzing) {
           Alert.alert(
             'Connection Added!', 
-            `Face analysis complete. Detected traits: ${traitDescriptions.slice(0, 3).join(', ')}`,
+            'Face saved for recognition. Distinctive traits will appear once analysis finishes.',
             [{ text: 'OK' }]
           );
         } else {
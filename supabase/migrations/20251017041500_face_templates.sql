@@ -0,0 +1,21 @@
+/*
+  # Add Multi-Photo Face Templates to Connections
+
+  1. New Columns
+    - `face_templates` (jsonb) - Up to five photo embeddings per connection,
+      each `{"embedding": [...], "quality": 0-1, "added_at": epoch seconds}`;
+      `face_embedding` holds their quality-weighted centroid
+
+  2. Compatibility
+    - Existing rows keep an empty list and are matched by `face_embedding`
+      alone until another photo is added
+
+  3. Security
+    - Maintain existing RLS policies
+*/
+
+-- Add face template column to connections table
+ALTER TABLE connections
+ADD COLUMN IF NOT EXISTS face_templates jsonb DEFAULT '[]';
+
+COMMENT ON COLUMN connections.face_templates IS 'Per-photo face embeddings with quality scores; face_embedding is their weighted centroid';
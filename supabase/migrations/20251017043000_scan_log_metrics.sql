@@ -0,0 +1,29 @@
+/*
+  # Add Scan Metrics to Face Recognition Logs
+
+  1. New Columns
+    - `face_count` (integer) - Faces detected in the scan
+    - `face_confidences` (double precision array) - Best match confidence per face
+    - `timings` (jsonb) - Milliseconds per scan stage, as returned by /scan/identify
+    - `cache_hit` (boolean) - Whether the response was reused from a near-identical recent frame
+    - `processing_ms` (double precision) - Total server-side time of the scan
+
+  2. Notes
+    - The backend writes one row per scan, in batches; `confidence_score`
+      and `emotion_detected` describe the best-matching face (0 and null
+      when no face was found)
+
+  3. Security
+    - Maintain existing RLS policies
+*/
+
+-- Add scan metric columns to face_recognition_logs table
+ALTER TABLE face_recognition_logs
+ADD COLUMN IF NOT EXISTS face_count integer DEFAULT 0,
+ADD COLUMN IF NOT EXISTS face_confidences double precision[] DEFAULT '{}',
+ADD COLUMN IF NOT EXISTS timings jsonb DEFAULT '{}',
+ADD COLUMN IF NOT EXISTS cache_hit boolean DEFAULT false,
+ADD COLUMN IF NOT EXISTS processing_ms double precision;
+
+COMMENT ON COLUMN face_recognition_logs.face_confidences IS 'Best match confidence of each detected face';
+COMMENT ON COLUMN face_recognition_logs.timings IS 'Milliseconds per scan stage (detect, encode, emotion, queue, match, cache)';
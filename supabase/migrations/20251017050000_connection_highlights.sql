@@ -0,0 +1,16 @@
+/*
+  # Add Caricature Highlights to Connections Table
+
+  1. New Columns
+    - `caricature_highlights` (jsonb) - Distinctive feature intensity scores,
+      written by the backend's enrollment job along with the facial traits
+
+  2. Security
+    - Maintain existing RLS policies
+*/
+
+-- Add caricature highlights column to connections table
+ALTER TABLE connections
+ADD COLUMN IF NOT EXISTS caricature_highlights jsonb DEFAULT '{}';
+
+COMMENT ON COLUMN connections.caricature_highlights IS 'Distinctive feature highlights for caricature generation';